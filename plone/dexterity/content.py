@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
+from abc import ABC
+from abc import abstractmethod
+from copy import copy
 from copy import deepcopy
+from datetime import date
 from datetime import datetime
 from persistent import Persistent
 
@@ -13,26 +17,75 @@ from zope.interface.declarations import ObjectSpecificationDescriptor
 from zope.interface.declarations import getObjectSpecification
 from zope.interface.declarations import implementedBy
 from zope.schema.interfaces import IContextAwareDefaultFactory
+from plone.dexterity.events import notify
+from plone.dexterity.events import notifyContainerModified
+from plone.dexterity.executor import get_executor
 from plone.dexterity.interfaces import IDexterityContainer
 from plone.dexterity.interfaces import IDexterityContent
 from plone.dexterity.interfaces import IDexterityItem
 from plone.dexterity.schema import SCHEMA_CACHE
+from plone.dexterity.storage import get_storage
+from plone.dexterity.storage import NameIndexedData
 from plone.uuid.interfaces import IAttributeUUID
 from plone.uuid.interfaces import IUUID
-import asyncio
+from bisect import bisect_left
+from bisect import bisect_right
+from itertools import islice
+import base64
+import json
 import six
-from zope.event import notify
 from BTrees.OOBTree import OOBTree
 from BTrees.Length import Length
-from zope.container.contained import setitem, uncontained
-from zope.container.contained import notifyContainerModified
+from zope.container.contained import checkAndConvertName
 from zope.container.contained import containedEvent
-from persistent.dict import PersistentDict
-from persistent.list import PersistentList
+from zope.lifecycleevent import ObjectRemovedEvent
+from ZODB.interfaces import IBroken
+from ZODB.POSException import ConflictError
+from plone.dexterity.ordering import ContainerOrder
+from zope.component import queryUtility
+
+try:
+    from zope.intid.interfaces import IIntIds
+    from zope.keyreference.interfaces import IKeyReference
+except ImportError:  # pragma: no cover
+    IIntIds = None
 
 _marker = object()
 _zone = tzlocal()
 
+# Number of children whose state is prefetched at once by iteritems()
+PREFETCH_BATCH_SIZE = 100
+
+# Default number of children returned by BTreeContainer.page_items()
+PAGE_SIZE = 50
+
+# Number of children loaded per executor call by aiter_items() and
+# aget_many()
+ASYNC_BATCH_SIZE = 100
+
+# Number of asyncget() calls answered directly from the connection cache
+# ('fast_path') and through the connection executor ('executor')
+ASYNCGET_STATS = {'fast_path': 0, 'executor': 0}
+
+# Types whose instances can be shared between objects without copying
+_IMMUTABLE_TYPES = six.string_types + (
+    bytes, int, float, bool, type(None), frozenset, date, datetime,
+)
+
+
+def _is_flat(value):
+    """Return True if ``value`` is a list, set or dict holding only immutable
+    items, i.e. a shallow copy of it is as good as a deep copy.
+    """
+    if isinstance(value, dict):
+        items = value.items()
+        return all(
+            isinstance(k, _IMMUTABLE_TYPES) and
+            isinstance(v, _IMMUTABLE_TYPES)
+            for (k, v) in items
+        )
+    return all(isinstance(v, _IMMUTABLE_TYPES) for v in value)
+
 
 def _default_from_schema(context, schema, fieldname):
     """helper to lookup default value of a field
@@ -47,8 +100,13 @@ def _default_from_schema(context, schema, fieldname):
     ):
         bound = field.bind(context)
         return deepcopy(bound.default)
-    else:
-        return deepcopy(field.default)
+    default = field.default
+    if isinstance(default, _IMMUTABLE_TYPES):
+        return default
+    if type(default) in (list, set, dict) and _is_flat(default):
+        # a shallow copy is enough and much cheaper than deepcopy
+        return copy(default)
+    return deepcopy(default)
 
 
 class FTIAwareSpecification(ObjectSpecificationDescriptor):
@@ -228,14 +286,180 @@ def synccontext(context):
 
         await sync(request)(txn.commit)
 
+    Calls go through the ManagedExecutor of the connection, see
+    plone.dexterity.executor. They raise ExecutorSaturated if too many calls
+    are queued already.
     """
-    loop = asyncio.get_event_loop()
     assert getattr(context, '_p_jar', None) is not None, \
         'Request has no conn'
     assert getattr(context._p_jar, 'executor', None) is not None, \
         'Connection has no executor'
-    return lambda *args, **kwargs: loop.run_in_executor(
-        context._p_jar.executor, *args, **kwargs)
+    return get_executor(context._p_jar).submit
+
+
+def _iter_prefetching(context, items, batch_size=None, deactivate=False):
+    """Yield the ``(key, child)`` pairs of ``items`` in batches.
+
+    While a batch is consumed, the connection of ``context`` is asked to
+    prefetch the state of the children in the next one. If ``deactivate`` is
+    True, unmodified children are turned back into ghosts once the caller
+    has moved on, so memory use stays bounded on large containers.
+    """
+    batch_size = batch_size or PREFETCH_BATCH_SIZE
+    jar = getattr(context, '_p_jar', None)
+    prefetch = getattr(jar, 'prefetch', None)
+    items = iter(items)
+
+    def next_batch():
+        batch = list(islice(items, batch_size))
+        if prefetch is not None:
+            oids = [
+                value._p_oid for (key, value) in batch
+                if getattr(value, '_p_changed', False) is None and
+                value._p_oid is not None
+            ]
+            if oids:
+                prefetch(oids)
+        return batch
+
+    batch = next_batch()
+    while batch:
+        following = next_batch()
+        for key, value in batch:
+            yield key, value
+            if deactivate and getattr(value, '_p_changed', None) is False:
+                value._p_deactivate()
+        batch = following
+
+
+def _get_loaded(tree, key):
+    """Return the child ``key`` of the BTree ``tree`` if neither the nodes
+    leading to it nor the child itself are ghosts, i.e. if no state has to be
+    loaded from the database. Returns _marker otherwise.
+
+    Raises KeyError if ``key`` is known to be missing.
+    """
+    if isinstance(tree, NameIndexedData):
+        if tree._p_changed is None:
+            return _marker
+        id = _get_loaded(tree._index, key)
+        if id is _marker:
+            return _marker
+        tree = tree._data
+        key = id
+    node = tree
+    while True:
+        if getattr(node, '_p_changed', None) is None:
+            return _marker
+        if getattr(type(node), '_bucket_type', None) is None:
+            # a bucket, or a mapping from before BTrees were used
+            value = node[key]
+            break
+        state = node.__getstate__()
+        if state is None:
+            raise KeyError(key)
+        data = state[0]
+        if len(data) == 1 and isinstance(data[0], tuple):
+            # a single bucket stored in the tree itself
+            value = node[key]
+            break
+        node = data[2 * bisect_right(data[1::2], key)]
+    if getattr(value, '_p_changed', False) is None:
+        return _marker
+    return value
+
+
+def _getitem_loaded(container, key):
+    """Return the child ``key`` of ``container`` with its state loaded, so
+    that the next asyncget() for it takes the fast path. Runs in the executor.
+    """
+    value = container[key]
+    if getattr(value, '_p_changed', False) is None:
+        value._p_activate()
+    return value
+
+
+def _executor_idle(container):
+    """Return True if no call is queued on or running in the executor of the
+    connection of ``container``, which could be loading or changing the
+    objects read directly.
+    """
+    jar = container._p_jar
+    if getattr(jar, 'executor', None) is None:
+        return True
+    return get_executor(jar).pending == 0
+
+
+async def _asyncget(container, get_tree, key):
+    """Return the child ``key`` of ``container``, directly if it is loaded
+    and the connection executor is idle, and through the executor otherwise.
+    """
+    if container._p_changed is not None and _executor_idle(container):
+        value = _get_loaded(get_tree(), key)
+        if value is not _marker:
+            ASYNCGET_STATS['fast_path'] += 1
+            return value
+    ASYNCGET_STATS['executor'] += 1
+    return await synccontext(container)(_getitem_loaded, container, key)
+
+
+def _load_batch(items, batch_size):
+    """Return the next ``batch_size`` ``(key, child)`` pairs of the iterator
+    ``items``, with the state of the children loaded. Runs in the executor.
+    """
+    batch = list(islice(items, batch_size))
+    for key, value in batch:
+        if getattr(value, '_p_changed', False) is None:
+            value._p_activate()
+    return batch
+
+
+def _get_batch(container, keys):
+    """Return the ``(key, child)`` pairs of the existing ``keys`` of
+    ``container``, see _load_batch(). Runs in the executor.
+    """
+    items = []
+    for key in keys:
+        value = container.get(key, _marker)
+        if value is not _marker:
+            items.append((key, value))
+    jar = getattr(container, '_p_jar', None)
+    if getattr(jar, 'prefetch', None) is not None:
+        oids = [
+            value._p_oid for (key, value) in items
+            if getattr(value, '_p_changed', False) is None and
+            value._p_oid is not None
+        ]
+        if oids:
+            jar.prefetch(oids)
+    return _load_batch(iter(items), len(items))
+
+
+async def _aiter_items(container, batch_size=None):
+    """Yield the ``(key, child)`` pairs of ``container``, loading them in the
+    connection executor ``batch_size`` at a time.
+    """
+    batch_size = batch_size or ASYNC_BATCH_SIZE
+    run = synccontext(container)
+    items = container.iteritems(batch_size)
+    while True:
+        batch = await run(_load_batch, items, batch_size)
+        if not batch:
+            break
+        for item in batch:
+            yield item
+
+
+async def _aget_many(container, keys, batch_size=None):
+    batch_size = batch_size or ASYNC_BATCH_SIZE
+    run = synccontext(container)
+    keys = list(keys)
+    result = {}
+    for start in range(0, len(keys), batch_size):
+        batch = await run(
+            _get_batch, container, keys[start:start + batch_size])
+        result.update(batch)
+    return result
 
 
 @implementer(IDexterityItem)
@@ -249,6 +473,404 @@ class Item(DexterityContent):
     __getattr__ = DexterityContent.__getattr__
 
 
+class ContainerView(ABC):
+    """Live view on the children of a Container, in container order.
+
+    Views do not copy the order; iterating a view while the container is
+    changed raises a RuntimeError, like iterating a dict does. Indexing a
+    view walks the order's buckets up to the index, so it is O(n): loop
+    over the view instead of indexing it in a loop.
+    """
+
+    def __init__(self, container):
+        self._container = container
+
+    def _iterkeys(self):
+        container = self._container
+        order = container._order
+        if isinstance(order, ContainerOrder):
+            generation = order.generation
+
+            def changed():
+                return container._order is not order or \
+                    order.generation != generation
+        else:
+            # the PersistentList of a container that is not migrated yet is
+            # changed in place, iterate over a copy
+            size = len(order)
+            order = list(order)
+
+            def changed():
+                return len(container._order) != size
+
+        for key in order:
+            if changed():
+                raise RuntimeError('Container changed during iteration')
+            yield key
+        if changed():
+            raise RuntimeError('Container changed during iteration')
+
+    @abstractmethod
+    def _item(self, key):
+        """Return the item of the view for the child ``key``"""
+
+    def __len__(self):
+        return len(self._container)
+
+    def __iter__(self):
+        for key in self._iterkeys():
+            yield self._item(key)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._item(key) for key in self._container._order[index]]
+        return self._item(self._container._order[index])
+
+    def __eq__(self, other):
+        if isinstance(other, ContainerView):
+            other = list(other)
+        if not isinstance(other, (list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    def index(self, value):
+        """Return the position of the first item equal to ``value``"""
+        for index, item in enumerate(self):
+            if item == value:
+                return index
+        raise ValueError('{0!r} is not in the container'.format(value))
+
+    def count(self, value):
+        return sum(1 for item in self if item == value)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class ContainerKeysView(ContainerView):
+    """Keys of a Container"""
+
+    def _item(self, key):
+        return key
+
+    def __contains__(self, key):
+        return key in self._container
+
+    def index(self, key):
+        if key not in self._container:
+            raise ValueError('{0!r} is not in the container'.format(key))
+        return self._container._order.index(key)
+
+    def count(self, key):
+        return int(key in self._container)
+
+
+class ContainerValuesView(ContainerView):
+    """Children of a Container"""
+
+    def _item(self, key):
+        return self._container._data[key]
+
+
+class ContainerItemsView(ContainerView):
+    """(key, child) pairs of a Container"""
+
+    def _item(self, key):
+        return (key, self._container._data[key])
+
+    def __contains__(self, item):
+        key, value = item
+        return self._container.get(key, _marker) is value
+
+
+class _OrderMover(object):
+    """Adapt a ContainerOrder to the list operations used by _move_by_delta
+    """
+
+    def __init__(self, order):
+        self.order = order
+        self.size = len(order)
+        self.reversed = False
+
+    def reverse(self):
+        self.reversed = not self.reversed
+
+    def index(self, key):
+        index = self.order.index(key)
+        if self.reversed:
+            return self.size - 1 - index
+        return index
+
+    def move(self, key, index):
+        if self.reversed:
+            index = self.size - 1 - index
+        return self.order.move(key, index)
+
+
+class _ListMover(list):
+    """A list of keys with the operations used by _move_by_delta
+    """
+
+    def move(self, key, index):
+        self.remove(key)
+        self.insert(index, key)
+
+
+def _move_by_delta(keys, ids, delta):
+    """Move ``ids`` within ``keys`` by ``delta``, keeping the order of ``ids``
+    when they bump into the top or bottom. Returns the number of moved keys.
+    """
+    ids = list(ids)
+    # unify moving direction
+    if delta > 0:
+        ids.reverse()
+        keys.reverse()
+    min_position = 0
+    counter = 0
+    for id in ids:
+        old_position = keys.index(id)
+        new_position = max(old_position - abs(delta), min_position)
+        if new_position == min_position:
+            min_position += 1
+        if old_position != new_position and \
+                keys.move(id, new_position) is not False:
+            counter += 1
+    if delta > 0:
+        keys.reverse()
+    return counter
+
+
+def _check_new_items(container, items, check_key):
+    """Return ``items`` as a list of ``(key, object)`` pairs, raising an
+    error if any key is invalid or already used.
+    """
+    if hasattr(items, 'items'):
+        items = items.items()
+    items = list(items)
+    seen = set()
+    for key, object in items:
+        check_key(key)
+        if key in seen or key in container:
+            raise KeyError(key)
+        seen.add(key)
+    return items
+
+
+def _setitem(container, setitemf, name, object):
+    """``zope.container.contained.setitem``, firing its events through
+    ``plone.dexterity.events.notify``.
+    """
+    name = checkAndConvertName(name)
+    old = container.get(name, _marker)
+    if old is object:
+        return
+    if old is not _marker:
+        raise KeyError(name)
+
+    object, event = containedEvent(object, container, name)
+    setitemf(name, object)
+    if event:
+        notify(event)
+        notifyContainerModified(container)
+
+
+def _notify_added(container, events):
+    """Fire the events of children added in bulk, followed by one container
+    modified event.
+    """
+    for event in events:
+        notify(event)
+    if events:
+        notifyContainerModified(container)
+
+
+def _check_existing_keys(container, keys):
+    """Return ``keys`` as a list, raising KeyError if any of them is not in
+    ``container``.
+    """
+    keys = list(keys)
+    if len(set(keys)) != len(keys):
+        raise ValueError('Duplicate keys')
+    for key in keys:
+        if key not in container:
+            raise KeyError(key)
+    return keys
+
+
+def _uncontained_many(container, items):
+    """Fire the removed events for ``(key, object)`` pairs deleted in bulk,
+    like ``zope.container.contained.uncontained`` does for one child.
+
+    Returns True if a container modified event should be fired.
+    """
+    modified = False
+    for name, object in items:
+        try:
+            oldparent = object.__parent__
+            oldname = object.__name__
+        except AttributeError:
+            # Maybe we're converting old data
+            state = getattr(object, '__Broken_state__', {})
+            oldparent = state.get('__parent__')
+            oldname = state.get('__name__')
+
+        if oldparent is not container or oldname != name:
+            if oldparent is not None or oldname is not None:
+                modified = True
+            continue
+
+        notify(ObjectRemovedEvent(object, oldparent, oldname))
+        if not IBroken.providedBy(object):
+            object.__parent__ = None
+            object.__name__ = None
+        modified = True
+    return modified
+
+
+def _count_types(container, objects, delta):
+    """Add ``delta`` to the per portal_type counters of ``container`` for
+    each of ``objects``. Containers without counters are left alone.
+    """
+    counts = container._type_counts
+    if counts is None:
+        return
+    changes = {}
+    for object in objects:
+        portal_type = getattr(object, 'portal_type', None)
+        if portal_type:
+            changes[portal_type] = changes.get(portal_type, 0) + delta
+    for portal_type, change in changes.items():
+        length = counts.get(portal_type)
+        if length is None:
+            length = counts[portal_type] = Length()
+        length.change(change)
+
+
+def _counts_by_type(container):
+    counts = container._type_counts
+    if counts is None:
+        # an older container, count without storing anything
+        result = {}
+        for object in container.itervalues(deactivate=True):
+            portal_type = getattr(object, 'portal_type', None)
+            if portal_type:
+                result[portal_type] = result.get(portal_type, 0) + 1
+        return result
+    return dict(
+        (portal_type, length())
+        for portal_type, length in counts.items()
+        if length()
+    )
+
+
+def rebuild_type_counts(container):
+    """Recompute the per portal_type counters of ``container`` from its
+    children, creating them for containers made before they existed.
+    """
+    container._type_counts = OOBTree()
+    _count_types(
+        container, container.itervalues(deactivate=True), 1)
+    return _counts_by_type(container)
+
+
+# Attributes of a container that two concurrent transactions may both
+# change, the newest value is kept
+_NEWEST_WINS = ('modification_date', )
+
+
+def _same(a, b):
+    try:
+        return a is b or bool(a == b)
+    except Exception:
+        # e.g. persistent references that cannot be compared
+        return False
+
+
+def _resolve_container_conflict(old, committed, new):
+    """Merge the states of a container written by two concurrent transactions.
+
+    The children and their order are kept in BTrees, which resolve
+    non-overlapping changes themselves. Concurrent adds therefore only meet
+    on the container itself when both update an attribute like its
+    modification date. Attributes changed by one transaction are taken from
+    it, for those in _NEWEST_WINS the newest value is kept, and any other
+    attribute changed differently by both raises ConflictError.
+    """
+    if not (isinstance(old, dict) and isinstance(committed, dict) and
+            isinstance(new, dict)):
+        raise ConflictError
+    resolved = dict(committed)
+    for name in set(old) | set(committed) | set(new):
+        old_value = old.get(name, _marker)
+        committed_value = committed.get(name, _marker)
+        new_value = new.get(name, _marker)
+        if _same(new_value, old_value) or \
+                _same(new_value, committed_value):
+            continue
+        if _same(committed_value, old_value):
+            value = new_value
+        elif name in _NEWEST_WINS and committed_value is not _marker and \
+                new_value is not _marker:
+            try:
+                value = max(committed_value, new_value)
+            except TypeError:
+                raise ConflictError
+        else:
+            raise ConflictError
+        if value is _marker:
+            del resolved[name]
+        else:
+            resolved[name] = value
+    return resolved
+
+
+def _remove_many(order, keys):
+    """Remove ``keys`` from the order of a Container"""
+    if isinstance(order, ContainerOrder):
+        order.remove_many(keys)
+    else:
+        # the PersistentList of a container that is not migrated yet
+        removed = set(keys)
+        order[:] = [key for key in order if key not in removed]
+
+
+def _reorder(order, keys):
+    """Reorder ``keys`` among the positions they hold in the order of a
+    Container.
+    """
+    if isinstance(order, ContainerOrder):
+        order.reorder(keys)
+    else:
+        moved = set(keys)
+        keys = iter(keys)
+        order[:] = [next(keys) if key in moved else key for key in order]
+
+
+def migrate_container_storage(container):
+    """Migrate a Container created before its children were kept in BTrees.
+
+    The PersistentDict holding the children and the PersistentList holding
+    their order are replaced in place by an OOBTree and a ContainerOrder.
+    Returns True if the container was migrated. This writes all children
+    keys in one transaction; the ``Promoter`` of
+    ``plone.dexterity.promotion`` migrates containers in batches instead.
+    Until then the old storage is read and written as it is.
+    """
+    if isinstance(container._order, ContainerOrder):
+        return False
+    container._data = OOBTree(container._data)
+    container._order = ContainerOrder(container._order)
+    return True
+
+
 @implementer(
     IDexterityContainer,
     IAttributeAnnotatable,
@@ -259,75 +881,181 @@ class Container(DexterityContent):
 
     __providedBy__ = FTIAwareSpecification()
 
+    # Per portal_type child counters, None for containers created before
+    # they were introduced, see rebuild_type_counts()
+    _type_counts = None
+
+    # Names of tombstoned children that are not reaped yet, see reaper.py
+    _reserved_names = None
+
     def __init__(self, id=None, **kwargs):
-        self._data = PersistentDict()
-        self._order = PersistentList()
+        self._data = OOBTree()
+        self._order = ContainerOrder()
+        self._type_counts = OOBTree()
         DexterityContent.__init__(self, id, **kwargs)
 
     def __getattr__(self, name, default=None):
         return DexterityContent.__getattr__(self, name)
 
     def keys(self):
-        return self._order[:]
+        return ContainerKeysView(self)
 
     def __iter__(self):
-        return iter(self.keys())
+        return iter(ContainerKeysView(self))
 
     def __getitem__(self, key):
         return self._data[key]
 
     async def asyncget(self, key):
-        return await synccontext(self)(self._data.__getitem__, key)
+        return await _asyncget(self, lambda: self._data, key)
 
     def get(self, key, default=None):
         return self._data.get(key, default)
 
     def values(self):
-        return [self._data[i] for i in self._order]
+        return ContainerValuesView(self)
 
     def __len__(self):
-        return len(self._data)
+        return len(self._order)
 
     def items(self):
-        return [(i, self._data[i]) for i in self._order]
+        return ContainerItemsView(self)
 
     def __contains__(self, key):
         return key in self._data
 
     has_key = __contains__
 
-    def __setitem__(self, key, object):
-        existed = key in self._data
+    def iteritems(self, batch_size=None, deactivate=False):
+        """Iterate over (key, child) pairs, prefetching children in batches
+        """
+        return _iter_prefetching(
+            self, ContainerItemsView(self), batch_size, deactivate)
 
-        bad = False
+    def itervalues(self, batch_size=None, deactivate=False):
+        """Iterate over the children, prefetching them in batches
+        """
+        for key, value in self.iteritems(batch_size, deactivate):
+            yield value
+
+    def counts_by_type(self):
+        """Return a dict mapping portal_types to the number of children of
+        that type.
+        """
+        return _counts_by_type(self)
+
+    def _p_resolveConflict(self, old, committed, new):
+        return _resolve_container_conflict(old, committed, new)
+
+    def aiter_items(self, batch_size=None):
+        """Iterate asynchronously over (key, child) pairs, loading
+        ``batch_size`` children per executor call.
+
+            async for key, child in container.aiter_items():
+                ...
+        """
+        return _aiter_items(self, batch_size)
+
+    async def aiter_values(self, batch_size=None):
+        """Iterate asynchronously over the children, see aiter_items()
+        """
+        async for key, value in _aiter_items(self, batch_size):
+            yield value
+
+    async def aget_many(self, keys, batch_size=None):
+        """Return a dict of the children with the given ``keys``, loading
+        ``batch_size`` of them per executor call. Missing keys are left out.
+        """
+        return await _aget_many(self, keys, batch_size)
+
+    def _checkKey(self, key):
         if not isinstance(key, six.string_types):
-            bad = True
-        if bad:
             raise TypeError("'%s' is invalid, the key must be an "
                             "ascii or unicode string" % key)
         if len(key) == 0:
             raise ValueError("The key cannot be an empty string")
+        if self._reserved_names is not None and key in self._reserved_names:
+            # a tombstoned child is waiting to be reaped, see reaper.py
+            raise KeyError(key)
+
+    def __setitem__(self, key, object):
+        existed = key in self._data
+
+        self._checkKey(key)
 
         # We have to first update the order, so that the item is available,
         # otherwise most API functions will lie about their available values
         # when an event subscriber tries to do something with the container.
         if not existed:
             self._order.append(key)
+            _count_types(self, [object], 1)
 
         # This function creates a lot of events that other code listens to.
         try:
-            setitem(self, self._data.__setitem__, key, object)
+            _setitem(self, self._data.__setitem__, key, object)
         except Exception:
             if not existed:
                 self._order.remove(key)
+                _count_types(self, [object], -1)
             raise
 
         return key
 
+    def add_many(self, items):
+        """Add several children at once.
+
+        ``items`` is a mapping or a sequence of ``(key, object)`` pairs. All
+        keys are checked before anything is added. An added event is fired
+        for each child, followed by a single container modified event.
+        Returns the list of added keys.
+        """
+        items = _check_new_items(self, items, self._checkKey)
+
+        events = []
+        for key, object in items:
+            object, event = containedEvent(object, self, key)
+            self._data[key] = object
+            if event:
+                events.append(event)
+        self._order.extend(key for key, object in items)
+        _count_types(self, [object for key, object in items], 1)
+
+        _notify_added(self, events)
+        return [key for key, object in items]
+
     def __delitem__(self, key):
-        uncontained(self._data[key], self, key)
+        object = self._data[key]
+        if _uncontained_many(self, [(key, object)]):
+            notifyContainerModified(self)
         del self._data[key]
         self._order.remove(key)
+        _count_types(self, [object], -1)
+
+    def _detach(self, key):
+        """Remove the child ``key`` without firing any event and return it.
+        """
+        object = self._data.pop(key)
+        self._order.remove(key)
+        _count_types(self, [object], -1)
+        return object
+
+    def delete_many(self, keys):
+        """Delete several children at once.
+
+        All keys are checked before anything is deleted. A removed event is
+        fired for each child, followed by a single container modified event.
+        """
+        keys = _check_existing_keys(self, keys)
+
+        items = [(key, self._data[key]) for key in keys]
+        modified = _uncontained_many(self, items)
+        for key in keys:
+            del self._data[key]
+        _remove_many(self._order, keys)
+        _count_types(self, [object for key, object in items], -1)
+
+        if modified:
+            notifyContainerModified(self)
 
     def updateOrder(self, order):
         """ See `IOrderedContainer`.
@@ -358,14 +1086,17 @@ class Container(DexterityContent):
         Traceback (most recent call last):
         ...
         ValueError: Incompatible key set.
+        >>> oc.updateOrder(oc.keys())
+        >>> oc.keys()
+        ['zork', 'foo', 'baz']
         >>> oc.updateOrder(1)
         Traceback (most recent call last):
         ...
-        TypeError: order must be a tuple or a list.
+        TypeError: order must be an iterable of keys.
         >>> oc.updateOrder('bar')
         Traceback (most recent call last):
         ...
-        TypeError: order must be a tuple or a list.
+        TypeError: order must be an iterable of keys.
         >>> oc.updateOrder(['baz', 'zork', 'quux'])
         Traceback (most recent call last):
         ...
@@ -377,28 +1108,125 @@ class Container(DexterityContent):
         0
         """
 
-        if not isinstance(order, list) and \
-            not isinstance(order, tuple):
-            raise TypeError('order must be a tuple or a list.')
+        if isinstance(order, (str, bytes)):
+            raise TypeError('order must be an iterable of keys.')
+        try:
+            # also takes a snapshot of a view of the keys
+            order = list(order)
+        except TypeError:
+            raise TypeError('order must be an iterable of keys.')
 
         if len(order) != len(self._order):
             raise ValueError("Incompatible key set.")
 
-        was_dict = {}
-        will_be_dict = {}
-        new_order = PersistentList()
-
-        for i in range(len(order)):
-            was_dict[self._order[i]] = 1
-            will_be_dict[order[i]] = 1
-            new_order.append(order[i])
-
-        if will_be_dict != was_dict:
+        if set(order) != set(self._order):
             raise ValueError("Incompatible key set.")
 
-        self._order = new_order
+        _reorder(self._order, order)
         notifyContainerModified(self)
 
+    def getObjectPosition(self, id):
+        """Return the position of the child ``id``"""
+        if id not in self._data:
+            raise ValueError('The object with the id "{0:s}" does not exist.'
+                             .format(id))
+        return self._order.index(id)
+
+    def moveObjectsByDelta(self, ids, delta, subset_ids=None):
+        """Move the children ``ids`` by ``delta`` positions, relative to the
+        keys in ``subset_ids`` if given. Returns the number of moved children.
+
+        Only the positions of the moved children are written.
+        """
+        if isinstance(ids, six.string_types):
+            ids = [ids]
+        for id in ids:
+            if id not in self._data:
+                raise ValueError('The object with the id "{0:s}" does not '
+                                 'exist.'.format(id))
+
+        if subset_ids is not None:
+            # only the positions held by the subset change
+            subset_ids = _ListMover(subset_ids)
+            counter = _move_by_delta(subset_ids, ids, delta)
+            if counter:
+                _reorder(self._order, subset_ids)
+        elif isinstance(self._order, ContainerOrder):
+            counter = _move_by_delta(_OrderMover(self._order), ids, delta)
+        else:
+            keys = _ListMover(self._order)
+            counter = _move_by_delta(keys, ids, delta)
+            if counter:
+                self._order[:] = keys
+
+        if counter:
+            notifyContainerModified(self)
+        return counter
+
+    def moveObjectToPosition(self, id, position):
+        """Move the child ``id`` to ``position``"""
+        return self.moveObjectsByDelta(
+            [id], position - self.getObjectPosition(id))
+
+    def moveObjectsToTop(self, ids, subset_ids=None):
+        """Move the children ``ids`` to the top"""
+        return self.moveObjectsByDelta(ids, -len(self), subset_ids)
+
+    def moveObjectsToBottom(self, ids, subset_ids=None):
+        """Move the children ``ids`` to the bottom"""
+        return self.moveObjectsByDelta(ids, len(self), subset_ids)
+
+
+def _encode_cursor(key, reverse):
+    data = json.dumps([key, bool(reverse)]).encode('utf8')
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def _decode_cursor(cursor, reverse):
+    try:
+        key, reversed_ = json.loads(
+            base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf8'))
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError('Invalid cursor {0!r}'.format(cursor))
+    if reversed_ != bool(reverse):
+        raise ValueError('Cursor was created for the other direction')
+    return key
+
+
+def _key_before(tree, key):
+    """Return the largest key of ``tree`` lower than ``key``, or _marker.
+
+    BTrees only find the largest key lower than *or equal to* a key, and
+    ranges ending at a key are counted from their start, so the nodes of
+    the tree are walked down to the bucket holding the key, reading
+    O(log n) nodes.
+    """
+    if isinstance(tree, NameIndexedData):
+        tree = tree._index
+    state = tree.__getstate__()
+    if state is None:
+        return _marker
+    data = state[0]
+    if getattr(type(tree), '_bucket_type', None) is None:
+        # a bucket
+        keys = data[::2]
+    elif len(data) == 1 and isinstance(data[0], tuple):
+        # the state of a single bucket stored in the tree itself
+        keys = data[0][0][::2]
+    else:
+        keys = None
+    if keys is not None:
+        index = bisect_left(keys, key)
+        return keys[index - 1] if index else _marker
+    children = data[::2]
+    # child i holds the keys from separator i - 1 up to separator i
+    index = bisect_left(data[1::2], key)
+    for child in reversed(children[:index + 1]):
+        found = _key_before(child, key)
+        if found is not _marker:
+            return found
+    return _marker
+
 
 class Lazy(object):
     """Lazy Attributes.
@@ -426,11 +1254,18 @@ class Lazy(object):
     IAttributeUUID)
 class BTreeContainer(DexterityContent):
 
+    # Per portal_type child counters, see Container
+    _type_counts = None
+
+    # Names of tombstoned children, see Container
+    _reserved_names = None
+
     def __init__(self, id=None, **kwargs):
         # We keep the previous attribute to store the data
         # for backward compatibility
         self._BTreeContainer__data = self._newContainerData()
         self.__len = Length()
+        self._type_counts = OOBTree()
         DexterityContent.__init__(self, id, **kwargs)
 
     def _newContainerData(self):
@@ -479,24 +1314,100 @@ class BTreeContainer(DexterityContent):
         return self.__data.get(key, default)
 
     async def asyncget(self, key):
-        return await synccontext(self)(self.__data.__getitem__, key)
+        return await _asyncget(self, lambda: self.__data, key)
 
-    def __setitem__(self, key, value):
+    def _checkKey(self, key):
         if not key:
             raise ValueError("empty names are not allowed")
+        if self._reserved_names is not None and key in self._reserved_names:
+            raise KeyError(key)
+
+    def _checkStorage(self):
+        """Give an empty container the storage the FTI of its type asks
+        for, see plone.dexterity.storage.
+        """
+        if self.__data:
+            return
+        factory = get_storage(self.portal_type)
+        if factory is not None and type(self.__data) is not factory:
+            self.__data = factory()
+
+    def __setitem__(self, key, value):
+        self._checkKey(key)
+        self._checkStorage()
         object, event = containedEvent(value, self, key)
+        old = self.__data.get(key)
+        if old is not None:
+            _count_types(self, [old], -1)
+        _count_types(self, [value], 1)
         self._setitemf(key, value)
         if event:
             notify(event)
             notifyContainerModified(self)
 
+    def add_many(self, items):
+        """Add several children at once.
+
+        ``items`` is a mapping or a sequence of ``(key, object)`` pairs. All
+        keys are checked before anything is added. The length is updated
+        once, an added event is fired for each child, followed by a single
+        container modified event. Returns the list of added keys.
+        """
+        items = _check_new_items(self, items, self._checkKey)
+        self._checkStorage()
+        # make sure our lazy property gets set
+        l = self.__len
+
+        events = []
+        for key, value in items:
+            object, event = containedEvent(value, self, key)
+            self.__data[key] = object
+            if event:
+                events.append(event)
+        l.change(len(items))
+        _count_types(self, [value for key, value in items], 1)
+
+        _notify_added(self, events)
+        return [key for key, value in items]
+
     def __delitem__(self, key):
         # make sure our lazy property gets set
         l = self.__len
         item = self.__data[key]
         del self.__data[key]
         l.change(-1)
-        uncontained(item, self, key)
+        _count_types(self, [item], -1)
+        if _uncontained_many(self, [(key, item)]):
+            notifyContainerModified(self)
+
+    def _detach(self, key):
+        """Remove the child ``key`` without firing any event and return it.
+        """
+        # make sure our lazy property gets set
+        l = self.__len
+        object = self.__data.pop(key)
+        l.change(-1)
+        _count_types(self, [object], -1)
+        return object
+
+    def delete_many(self, keys):
+        """Delete several children at once.
+
+        All keys are checked before anything is deleted. The length is
+        updated once, a removed event is fired for each child, followed by a
+        single container modified event.
+        """
+        keys = _check_existing_keys(self, keys)
+        # make sure our lazy property gets set
+        l = self.__len
+        items = [(key, self.__data[key]) for key in keys]
+        for key in keys:
+            del self.__data[key]
+        l.change(-len(keys))
+        _count_types(self, [object for key, object in items], -1)
+
+        if _uncontained_many(self, items):
+            notifyContainerModified(self)
 
     has_key = __contains__
 
@@ -509,3 +1420,273 @@ class BTreeContainer(DexterityContent):
     def values(self, key=None):
         return self.__data.values(key)
 
+    def iteritems(self, batch_size=None, deactivate=False):
+        """Iterate over (key, child) pairs, prefetching children in batches
+        """
+        return _iter_prefetching(
+            self, self.__data.iteritems(), batch_size, deactivate)
+
+    def page_items(self, cursor=None, size=PAGE_SIZE, reverse=False):
+        """Return a page of children in key order.
+
+        Returns a list of up to ``size`` ``(key, child)`` pairs and an opaque
+        cursor to pass in to get the next page, or None on the last page.
+        Each page costs O(log n + size), however far into the container.
+        """
+        if size < 1:
+            raise ValueError('size must be at least 1')
+        data = self.__data
+        last = None
+        if cursor is not None:
+            last = _decode_cursor(cursor, reverse)
+
+        if not reverse:
+            if last is None:
+                keys = data.keys()
+            else:
+                keys = data.keys(min=last, excludemin=True)
+            keys = list(islice(keys, size + 1))
+        else:
+            keys = []
+            if last is None:
+                key = data.maxKey() if data else _marker
+            else:
+                key = _key_before(data, last)
+            while key is not _marker and len(keys) <= size:
+                keys.append(key)
+                key = _key_before(data, key)
+
+        next_cursor = None
+        if len(keys) > size:
+            keys = keys[:size]
+            next_cursor = _encode_cursor(keys[-1], reverse)
+        return [(key, data[key]) for key in keys], next_cursor
+
+    def itervalues(self, batch_size=None, deactivate=False):
+        """Iterate over the children, prefetching them in batches
+        """
+        for key, value in self.iteritems(batch_size, deactivate):
+            yield value
+
+    def counts_by_type(self):
+        """Return a dict mapping portal_types to the number of children of
+        that type.
+        """
+        return _counts_by_type(self)
+
+    def _p_resolveConflict(self, old, committed, new):
+        return _resolve_container_conflict(old, committed, new)
+
+    def aiter_items(self, batch_size=None):
+        """Iterate asynchronously over (key, child) pairs, loading
+        ``batch_size`` children per executor call.
+
+            async for key, child in container.aiter_items():
+                ...
+        """
+        return _aiter_items(self, batch_size)
+
+    async def aiter_values(self, batch_size=None):
+        """Iterate asynchronously over the children, see aiter_items()
+        """
+        async for key, value in _aiter_items(self, batch_size):
+            yield value
+
+    async def aget_many(self, keys, batch_size=None):
+        """Return a dict of the children with the given ``keys``, loading
+        ``batch_size`` of them per executor call. Missing keys are left out.
+        """
+        return await _aget_many(self, keys, batch_size)
+
+
+def _order_page(order, last, size, reverse):
+    """Return up to ``size`` keys of the ContainerOrder ``order`` after
+    ``last``, or before it if ``reverse`` is true, in O(log n + size).
+    """
+    positions = order._pos
+    position = None
+    if last is not None:
+        position = order._rpos.get(last)
+        if position is None:
+            raise ValueError('The child of the cursor was removed')
+    if not reverse:
+        if position is None:
+            keys = positions.values()
+        else:
+            keys = positions.values(min=position, excludemin=True)
+        return list(islice(keys, size))
+    keys = []
+    while len(keys) < size:
+        try:
+            if position is None:
+                position = positions.maxKey()
+            else:
+                position = positions.maxKey(position - 1)
+        except ValueError:
+            break
+        keys.append(positions[position])
+    return keys
+
+
+class OrderedBTreeContainer(BTreeContainer):
+    """BTreeContainer keeping its children in a user defined order.
+
+    It has the ordering API of Container: ``keys()``, ``values()`` and
+    ``items()`` follow the order, which ``updateOrder()`` and the
+    ``moveObjects*`` methods change. The order is kept in a ContainerOrder
+    next to the children, so it can be used as the ``klass`` of types using
+    either Container or BTreeContainer. Existing content is converted with
+    migrate_to_ordered_btree().
+    """
+
+    def __init__(self, id=None, **kwargs):
+        self._order = ContainerOrder()
+        BTreeContainer.__init__(self, id, **kwargs)
+
+    @property
+    def _data(self):
+        # used by the views and methods shared with Container
+        return self._BTreeContainer__data
+
+    keys = Container.keys
+    values = Container.values
+    items = Container.items
+    __iter__ = Container.__iter__
+    iteritems = Container.iteritems
+    itervalues = Container.itervalues
+    updateOrder = Container.updateOrder
+    getObjectPosition = Container.getObjectPosition
+    moveObjectsByDelta = Container.moveObjectsByDelta
+    moveObjectToPosition = Container.moveObjectToPosition
+    moveObjectsToTop = Container.moveObjectsToTop
+    moveObjectsToBottom = Container.moveObjectsToBottom
+
+    def _setitemf(self, key, value):
+        # the order is updated before any event is fired, like in Container
+        if key not in self._order:
+            self._order.append(key)
+        BTreeContainer._setitemf(self, key, value)
+
+    def add_many(self, items):
+        items = _check_new_items(self, items, self._checkKey)
+        self._order.extend(key for key, value in items)
+        return BTreeContainer.add_many(self, items)
+
+    add_many.__doc__ = BTreeContainer.add_many.__doc__
+
+    def __delitem__(self, key):
+        self._order.remove(key)
+        BTreeContainer.__delitem__(self, key)
+
+    def _detach(self, key):
+        self._order.remove(key)
+        return BTreeContainer._detach(self, key)
+
+    _detach.__doc__ = BTreeContainer._detach.__doc__
+
+    def delete_many(self, keys):
+        keys = _check_existing_keys(self, keys)
+        self._order.remove_many(keys)
+        BTreeContainer.delete_many(self, keys)
+
+    delete_many.__doc__ = BTreeContainer.delete_many.__doc__
+
+    def page_items(self, cursor=None, size=PAGE_SIZE, reverse=False):
+        """Return a page of children in container order.
+
+        Returns a list of up to ``size`` ``(key, child)`` pairs and an opaque
+        cursor to pass in to get the next page, or None on the last page.
+        The cursor becomes invalid if its child is removed.
+        """
+        if size < 1:
+            raise ValueError('size must be at least 1')
+        last = None
+        if cursor is not None:
+            last = _decode_cursor(cursor, reverse)
+        keys = _order_page(self._order, last, size + 1, reverse)
+        next_cursor = None
+        if len(keys) > size:
+            keys = keys[:size]
+            next_cursor = _encode_cursor(keys[-1], reverse)
+        data = self._data
+        return [(key, data[key]) for key in keys], next_cursor
+
+
+# Attributes holding the children of Container and BTreeContainer, which
+# migrate_to_ordered_btree() does not copy
+_STORAGE_ATTRIBUTES = frozenset([
+    '_data', '_order', '_type_counts',
+    '_BTreeContainer__data', '_BTreeContainer__len',
+])
+
+
+def migrate_to_ordered_btree(container, klass=OrderedBTreeContainer):
+    """Replace the Container or BTreeContainer ``container`` by an
+    OrderedBTreeContainer and return the new object.
+
+    Changing the class of a persistent object in place would leave the
+    references to it pointing to the old class, so a new object, with a new
+    oid, takes its place in its parent, with the same attributes, e.g. its
+    UUID and annotations. Its intid, if zope.intid is used, is moved to the
+    new object, so relations by intid keep working; other references to the
+    old object, e.g. queued promotions, are not updated. The children keep
+    their order, which is the key order for a BTreeContainer. Every child is
+    loaded and written to get the new object as its ``__parent__``, all in
+    the current transaction, so large containers need a commit of their own.
+    No events are fired.
+    """
+    if isinstance(container, klass):
+        return container
+    if isinstance(container, Container):
+        items = container.items()
+    elif isinstance(container, BTreeContainer):
+        items = container._BTreeContainer__data.items()
+    else:
+        raise TypeError('Cannot migrate {0!r}'.format(container))
+    parent = container.__parent__
+    name = container.__name__
+
+    new = klass.__new__(klass)
+    new.__dict__.update(
+        (key, value) for key, value in container.__dict__.items()
+        if key not in _STORAGE_ATTRIBUTES and not key.startswith('_v_'))
+    new._order = ContainerOrder()
+    new._BTreeContainer__data = new._newContainerData()
+    new._BTreeContainer__len = Length()
+    new._type_counts = OOBTree()
+    new._checkStorage()
+    items = list(items)
+    for key, child in items:
+        new._BTreeContainer__data[key] = child
+        child.__parent__ = new
+    new._order.extend(key for key, child in items)
+    new._BTreeContainer__len.change(len(items))
+    _count_types(new, [child for key, child in items], 1)
+
+    if parent is not None and name is not None:
+        if isinstance(parent, (Container, OrderedBTreeContainer)):
+            parent._data[name] = new
+        elif isinstance(parent, BTreeContainer):
+            parent._BTreeContainer__data[name] = new
+        elif hasattr(parent, '_setOb'):
+            parent._setOb(name, new)
+        else:
+            parent[name] = new
+    _move_intid(container, new)
+    return new
+
+
+def _move_intid(old, new):
+    """Give ``new`` the intid of ``old``"""
+    if IIntIds is None:
+        return
+    intids = queryUtility(IIntIds, context=new.__parent__)
+    if intids is None:
+        return
+    uid = intids.queryId(old)
+    if uid is None:
+        return
+    del intids.ids[IKeyReference(old)]
+    key = IKeyReference(new)
+    intids.refs[uid] = key
+    intids.ids[key] = uid
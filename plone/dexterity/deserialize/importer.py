@@ -0,0 +1,472 @@
+# -*- coding: utf-8 -*-
+"""Streaming import of content from JSON lines.
+
+Every line of the input holds one object as exported by the JSON
+serializer: its ``id``, its ``@type`` and its field values. Lines are read
+and converted one at a time, so the memory used does not depend on the size
+of the input:
+
+    >>> importer = JSONLinesImporter(
+    ...     folder, savepoint_every=100, commit_every=1000,
+    ...     checkpoint='/tmp/import.checkpoint')
+    >>> stats = importer.run('/tmp/export.jsonl')
+
+Each object is created with ``createContent()``, gets its field values from
+the ``IDeserializeFromJson`` adapter and is added with
+``addContentToContainer()``. A savepoint is taken every ``savepoint_every``
+objects, after which the changed objects can leave the connection cache,
+and the transaction is committed every ``commit_every`` objects.
+
+After each commit the position of the next line is written to the
+checkpoint file. Running the importer again with the same checkpoint
+resumes after the last committed object.
+
+``ParallelJSONLinesImporter`` moves the CPU bound part of the work, JSON
+decoding, text cleaning, conversion through ``IFromUnicode`` and
+validation, to a pool of processes. Only the thread running the importer
+uses the database connection; it gets the converted values in input order
+and creates the objects. Values the workers cannot convert, and fields
+protected by a write permission, still go through the
+``IDeserializeFromJson`` adapter.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from plone.dexterity.schema import SCHEMA_CACHE
+from plone.dexterity.utils import addContentToContainer
+from plone.dexterity.utils import createContent
+from plone.jsonserializer.interfaces import IDeserializeFromJson
+from plone.supermodel.interfaces import WRITE_PERMISSIONS_KEY
+from plone.supermodel.utils import mergedTaggedValueDict
+from zope.component import getMultiAdapter
+from zope.schema import getFieldsInOrder
+from zope.schema.interfaces import IChoice
+from zope.schema.interfaces import IDate
+from zope.schema.interfaces import IDatetime
+from zope.schema.interfaces import IFromUnicode
+
+import copy
+import datetime
+import json
+import logging
+import os
+import pickle
+import re
+import time
+import transaction
+
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+
+log = logging.getLogger(__name__)
+
+# Number of objects created between two savepoints
+SAVEPOINT_EVERY = 100
+
+# Number of objects created between two commits
+COMMIT_EVERY = 1000
+
+# Number of lines sent to a worker process at once
+CHUNK_SIZE = 200
+
+# Control characters removed from text values
+_CONTROL_CHARACTERS = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
+
+
+def peak_memory():
+    """Return the peak resident memory of the process in kB, or None"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Checkpoint(object):
+    """The input position after the last committed object, kept in a file
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """Return ``(line, offset)``, ``(0, 0)`` if there is no checkpoint
+        or it cannot be read, e.g. a truncated file.
+        """
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return 0, 0
+        return data['line'], data['offset']
+
+    def save(self, line, offset):
+        # write a new file and rename it, so a crash leaves the old one
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'line': line, 'offset': offset}, f)
+        os.replace(tmp, self.path)
+
+
+def read_raw_lines(source, line=0, offset=0):
+    """Yield ``(line, offset, data)`` for the lines of ``source``, a path or
+    a binary stream, starting after ``line`` lines at byte ``offset``.
+    ``line`` and ``offset`` are the position after the line, ``data`` its
+    stripped bytes. Blank lines are skipped.
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as stream:
+            for item in read_raw_lines(stream, line, offset):
+                yield item
+        return
+
+    if offset:
+        try:
+            source.seek(offset)
+        except (AttributeError, IOError, OSError):
+            # not seekable, skip the lines
+            for i in range(line):
+                source.readline()
+    for data in source:
+        line += 1
+        offset += len(data)
+        data = data.strip()
+        if data:
+            yield line, offset, data
+
+
+def read_lines(source, line=0, offset=0):
+    """Yield ``(line, offset, record)`` for the JSON lines of ``source``,
+    see read_raw_lines().
+    """
+    for line, offset, data in read_raw_lines(source, line, offset):
+        yield line, offset, json.loads(data.decode('utf8'))
+
+
+class ImportStats(object):
+    """Counters of an import run"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.created = 0
+        self.failed = 0
+        self.commits = 0
+        self.line = 0
+
+    @property
+    def seconds(self):
+        return time.time() - self.started
+
+    @property
+    def rate(self):
+        """Objects created per second"""
+        seconds = self.seconds
+        return self.created / seconds if seconds else 0.0
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'commits': self.commits,
+            'line': self.line,
+            'seconds': self.seconds,
+            'rate': self.rate,
+            'peak_memory': peak_memory(),
+        }
+
+    def __repr__(self):
+        return ('<ImportStats {0:d} created, {1:d} failed, '
+                '{2:.1f} objects/s>'.format(
+                    self.created, self.failed, self.rate))
+
+
+class JSONLinesImporter(object):
+    """Creates the objects of a JSON lines file in ``container``.
+
+    ``portal_type`` is used for records without an ``@type``. Records that
+    cannot be converted are logged and skipped if ``skip_errors`` is true,
+    and abort the import otherwise. ``progress``, if given, is called with
+    the ImportStats after each commit.
+    """
+
+    def __init__(self, container, portal_type=None, request=None,
+                 savepoint_every=None, commit_every=None, checkpoint=None,
+                 checkConstraints=True, skip_errors=False, progress=None):
+        self.container = container
+        self.portal_type = portal_type
+        self.request = request
+        self.savepoint_every = savepoint_every or SAVEPOINT_EVERY
+        self.commit_every = commit_every or COMMIT_EVERY
+        self.checkpoint = checkpoint
+        if isinstance(checkpoint, str):
+            self.checkpoint = Checkpoint(checkpoint)
+        self.checkConstraints = checkConstraints
+        self.skip_errors = skip_errors
+        self.progress = progress
+
+    @property
+    def transaction_manager(self):
+        jar = getattr(self.container, '_p_jar', None)
+        if jar is None:
+            return transaction.manager
+        return jar.transaction_manager
+
+    def create(self, record):
+        """Create the object of ``record`` and add it to the container"""
+        portal_type = record.get('@type') or self.portal_type
+        content = createContent(portal_type, id=record['id'])
+        deserializer = getMultiAdapter(
+            (content, self.request), IDeserializeFromJson)
+        deserializer(record)
+        return addContentToContainer(
+            self.container, content, request=self.request,
+            checkConstraints=self.checkConstraints)
+
+    def _gc(self):
+        jar = getattr(self.container, '_p_jar', None)
+        if jar is not None:
+            jar.cacheGC()
+
+    def _commit(self, stats, line, offset):
+        self.transaction_manager.commit()
+        stats.commits += 1
+        stats.line = line
+        if self.checkpoint is not None:
+            self.checkpoint.save(line, offset)
+        self._gc()
+        log.info('Imported %d objects, %.1f objects/s, peak memory %s kB',
+                 stats.created, stats.rate, peak_memory())
+        if self.progress is not None:
+            self.progress(stats)
+
+    def records(self, source, line, offset):
+        """Yield ``(line, offset, record)`` for the records of ``source``
+        to pass to create(), see read_lines().
+        """
+        return read_lines(source, line, offset)
+
+    def run(self, source):
+        """Import the records of ``source``, a path or a binary stream.
+        Returns the ImportStats.
+        """
+        stats = ImportStats()
+        line = offset = 0
+        if self.checkpoint is not None:
+            line, offset = self.checkpoint.load()
+        stats.line = line
+        pending = 0
+        for line, offset, record in self.records(source, line, offset):
+            savepoint = None
+            if self.skip_errors:
+                # undo what a failing record changed before its error
+                savepoint = self.transaction_manager.savepoint()
+            try:
+                self.create(record)
+            except Exception:
+                if savepoint is None:
+                    raise
+                savepoint.rollback()
+                log.warning('Cannot import line %d', line, exc_info=True)
+                stats.failed += 1
+                continue
+            stats.created += 1
+            pending += 1
+            if pending % self.commit_every == 0:
+                self._commit(stats, line, offset)
+                pending = 0
+            elif pending % self.savepoint_every == 0:
+                self.transaction_manager.savepoint(optimistic=True)
+                self._gc()
+        if pending or line != stats.line:
+            self._commit(stats, line, offset)
+        return stats
+
+
+def clean_text(value):
+    """Normalize line endings and drop control characters"""
+    value = value.replace(u'\r\n', u'\n').replace(u'\r', u'\n')
+    return _CONTROL_CHARACTERS.sub(u'', value)
+
+
+def convert(field, value):
+    """Return ``value`` converted for ``field`` and validated. Strings are
+    cleaned and read with ``fromUnicode()``, or as ISO 8601 for dates.
+    """
+    if isinstance(value, str):
+        value = clean_text(value)
+        if IFromUnicode.providedBy(field):
+            # also validates
+            return field.fromUnicode(value)
+        if IDatetime.providedBy(field):
+            value = datetime.datetime.fromisoformat(value)
+        elif IDate.providedBy(field):
+            value = datetime.date.fromisoformat(value)
+    field.validate(value)
+    return value
+
+
+def compile_fields(portal_type):
+    """Return a dict mapping the names of the writable fields of
+    ``portal_type`` to a copy of the field that can be sent to another
+    process, or to None for fields that need the component registry or
+    cannot be pickled, e.g. vocabulary based choices. Fields protected by a
+    write permission are left out. Values of fields that are left out or
+    None are deserialized in the process of the importer.
+    """
+    fields = {}
+    schemas, routes = SCHEMA_CACHE.field_routes(portal_type)
+    for schema in schemas:
+        write_permissions = mergedTaggedValueDict(
+            schema, WRITE_PERMISSIONS_KEY)
+        for name, field in getFieldsInOrder(schema):
+            if field.readonly or name in fields:
+                continue
+            if write_permissions.get(name):
+                # checked by the IDeserializeFromJson adapter
+                fields[name] = None
+                continue
+            description = None
+            if not (IChoice.providedBy(field) and field.vocabulary is None):
+                description = copy.copy(field)
+                description.interface = None
+                try:
+                    pickle.dumps(description)
+                except Exception:
+                    description = None
+            fields[name] = description
+    return fields
+
+
+def _is_simple(value):
+    """Return True for JSON values convert() can handle: strings, numbers,
+    booleans, null and lists of them. Objects, e.g. files and rich text, are
+    left to the field deserializers.
+    """
+    if isinstance(value, list):
+        return all(_is_simple(item) for item in value)
+    return value is None or isinstance(value, (str, int, float, bool))
+
+
+# Field descriptions by portal_type and the portal_type of records without
+# an ``@type``, set in the worker processes
+_worker_fields = {}
+_worker_portal_type = None
+
+
+def _init_worker(fields, portal_type=None):
+    global _worker_portal_type
+    _worker_fields.clear()
+    _worker_fields.update(fields)
+    _worker_portal_type = portal_type
+
+
+def prepare_lines(lines, fields=None, portal_type=None):
+    """Decode and convert the ``(line, offset, data)`` items of ``lines``.
+
+    Returns a list of ``(line, offset, record)``. ``record`` has the
+    converted values in ``@values`` and the values to deserialize in the
+    importer in ``@raw``, or an error message in ``@error``. Records
+    without an ``@type`` are of type ``portal_type``. Records of types
+    missing from ``fields`` are returned as decoded.
+    """
+    if fields is None:
+        fields = _worker_fields
+        portal_type = _worker_portal_type
+    prepared = []
+    for line, offset, data in lines:
+        try:
+            record = json.loads(data.decode('utf8'))
+            record_type = record.get('@type') or portal_type
+            type_fields = fields.get(record_type)
+            if type_fields is not None:
+                values = {}
+                raw = {}
+                for name, value in record.items():
+                    if name in ('id', '@type'):
+                        continue
+                    field = type_fields.get(name)
+                    if field is None or not _is_simple(value):
+                        raw[name] = value
+                    else:
+                        values[name] = convert(field, value)
+                record = {'id': record['id'], '@type': record_type,
+                          '@values': values, '@raw': raw}
+        except Exception as e:
+            record = {'@error': 'line {0:d}: {1!r}'.format(line, e)}
+        prepared.append((line, offset, record))
+    return prepared
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ParallelJSONLinesImporter(JSONLinesImporter):
+    """JSONLinesImporter converting the records in ``workers`` processes.
+
+    The fields of ``portal_types``, by default the ``portal_type`` of the
+    importer, are converted with convert() instead of the
+    ``IDeserializeFromJson`` adapter, except for the values convert() cannot
+    handle, fields protected by a write permission and keys that are not
+    fields of the type. Records of other types are only decoded in the
+    workers. At most ``2 * workers`` chunks of
+    ``chunk_size`` lines are in flight, which bounds the memory used. With
+    ``workers=0`` the records are prepared in the importer's process.
+    """
+
+    def __init__(self, container, portal_type=None, workers=None,
+                 chunk_size=None, portal_types=None, **kwargs):
+        JSONLinesImporter.__init__(self, container, portal_type, **kwargs)
+        self.workers = os.cpu_count() if workers is None else workers
+        self.chunk_size = chunk_size or CHUNK_SIZE
+        if portal_types is None:
+            portal_types = [portal_type] if portal_type else []
+        self.fields = dict(
+            (name, compile_fields(name)) for name in portal_types)
+
+    def create(self, record):
+        """Create the object of a record prepared by prepare_lines()"""
+        if '@error' in record:
+            raise ValueError(record['@error'])
+        if '@values' not in record:
+            return JSONLinesImporter.create(self, record)
+        content = createContent(
+            record['@type'], id=record['id'], **record['@values'])
+        if record['@raw']:
+            deserializer = getMultiAdapter(
+                (content, self.request), IDeserializeFromJson)
+            deserializer(record['@raw'])
+        return addContentToContainer(
+            self.container, content, request=self.request,
+            checkConstraints=self.checkConstraints)
+
+    def records(self, source, line, offset):
+        chunks = _chunks(
+            read_raw_lines(source, line, offset), self.chunk_size)
+        if not self.workers:
+            for chunk in chunks:
+                for item in prepare_lines(
+                        chunk, self.fields, self.portal_type):
+                    yield item
+            return
+
+        with ProcessPoolExecutor(
+                self.workers, initializer=_init_worker,
+                initargs=(self.fields, self.portal_type)) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(prepare_lines, chunk))
+                if len(pending) >= 2 * self.workers:
+                    for item in pending.popleft().result():
+                        yield item
+            while pending:
+                for item in pending.popleft().result():
+                    yield item
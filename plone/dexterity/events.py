@@ -1,8 +1,13 @@
 # -*- coding: utf-8 -*-
+from contextlib import contextmanager
 from plone.dexterity import interfaces
 from zope.component.interfaces import ObjectEvent
+from zope.container.contained import ContainerModifiedEvent
 from zope.interface import implementer
 
+import contextvars
+import zope.event
+
 
 @implementer(interfaces.IEditBegunEvent)
 class EditBegunEvent(ObjectEvent):
@@ -35,3 +40,91 @@ class EditFinishedEvent(ObjectEvent):
     """Edit was finished and contents are saved. This event is fired
     even when no changes happen (and no modified event is fired.)
     """
+
+
+# Events queued by deferred_events() in the current context, so that
+# coroutines sharing a thread each get their own queue
+_deferred = contextvars.ContextVar(
+    'plone.dexterity.deferred_events', default=None)
+
+
+class _EventQueue(list):
+    """Events queued by a deferred_events() block. Copies of the context
+    taken in the block keep it after the block was left, so it is closed
+    then.
+    """
+
+    closed = False
+
+
+def notify(event):
+    """Dispatch ``event`` like ``zope.event.notify``, or queue it if called
+    inside a ``deferred_events()`` block.
+    """
+    queue = _deferred.get()
+    if queue is None or queue.closed:
+        zope.event.notify(event)
+    else:
+        queue.append(event)
+
+
+def notifyContainerModified(object, *descriptions):
+    """Notify that the container's contents were modified"""
+    notify(ContainerModifiedEvent(object, *descriptions))
+
+
+def coalesce(events):
+    """Return ``events`` with one container modified event per container,
+    kept at the position of the last one and carrying the descriptions of
+    all of them.
+    """
+    last = {}
+    descriptions = {}
+    for index, event in enumerate(events):
+        if type(event) is ContainerModifiedEvent:
+            key = id(event.object)
+            last[key] = index
+            descriptions[key] = descriptions.get(key, ()) + tuple(
+                description for description in event.descriptions
+                if description not in descriptions.get(key, ()))
+    result = []
+    for index, event in enumerate(events):
+        if type(event) is ContainerModifiedEvent:
+            key = id(event.object)
+            if last[key] != index:
+                continue
+            if descriptions[key] != event.descriptions:
+                event = ContainerModifiedEvent(
+                    event.object, *descriptions[key])
+        result.append(event)
+    return result
+
+
+@contextmanager
+def deferred_events():
+    """Queue the events fired by ``createContent()`` and by adding, removing
+    and reordering children of dexterity containers, and dispatch them when
+    the block is left, with one container modified event per container.
+
+    Subscribers run after the block, so code inside it does not see their
+    effects, like the UUID set when an object is created. Nested blocks
+    dispatch when the outermost one is left. The events are dispatched even
+    if the block raises, as the changes made before may be kept by code
+    catching the exception.
+
+    Calls submitted to the connection executor with ``synccontext()`` or
+    ``get_executor()`` inside the block queue their events too; await them
+    before leaving it, or their events are dispatched right away.
+    """
+    if _deferred.get() is not None:
+        yield
+        return
+    queue = _EventQueue()
+    token = _deferred.set(queue)
+    try:
+        yield
+    finally:
+        _deferred.reset(token)
+        queue.closed = True
+        for event in coalesce(queue):
+            zope.event.notify(event)
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""Managed access to the executor of a ZODB connection.
+
+Code running in an event loop must not block on the database, so it hands
+database work to ``connection.executor``, a thread pool that runs the calls
+of a connection one after the other. ``ManagedExecutor`` wraps that
+executor to
+
+- keep track of the number of queued calls and reject new ones right away
+  once ``max_queue`` calls are waiting, instead of queueing them without
+  limit,
+- optionally give up waiting for a call after ``timeout`` seconds,
+- record how long calls wait in the queue and how long they run.
+
+    >>> executor = get_executor(context._p_jar)
+    >>> await executor.submit(txn.commit)
+    >>> executor.stats()
+
+``GroupCommit`` is an opt-in layer on top: commits queued within a short
+window are run back to back in a single executor call.
+
+    >>> await group_commit(context)(txn.commit)
+"""
+from bisect import bisect_left
+
+import asyncio
+import contextvars
+import threading
+import time
+
+
+# Maximum number of calls queued on the executor of one connection,
+# 0 for no limit
+MAX_QUEUE = 0
+
+# Seconds to wait for a call before raising asyncio.TimeoutError, None to
+# wait forever
+TIMEOUT = None
+
+# Upper bounds in seconds of the histogram buckets
+HISTOGRAM_BOUNDS = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0,
+)
+
+# Seconds a group commit waits for more commits before running them
+GROUP_COMMIT_WINDOW = 0.002
+
+# Maximum number of commits run in one group
+GROUP_COMMIT_MAX_BATCH = 64
+
+# Upper bounds of the group commit batch size histogram buckets
+BATCH_SIZE_BOUNDS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class ExecutorSaturated(RuntimeError):
+    """Raised when the executor of a connection has too many queued calls"""
+
+
+class Histogram(object):
+    """Counts of values per bucket of ``bounds``, plus one bucket for
+    larger ones.
+    """
+
+    def __init__(self, bounds=HISTOGRAM_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, value):
+        with self._lock:
+            self.counts[bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.total += value
+            if value > self.maximum:
+                self.maximum = value
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'buckets': list(zip(
+                    self.bounds + (float('inf'), ), self.counts)),
+                'count': self.count,
+                'total': self.total,
+                'max': self.maximum,
+            }
+
+
+class ManagedExecutor(object):
+    """Bounded, instrumented wrapper of the executor of a connection"""
+
+    def __init__(self, executor, max_queue=None, timeout=None):
+        self.executor = executor
+        self.max_queue = MAX_QUEUE if max_queue is None else max_queue
+        self.timeout = TIMEOUT if timeout is None else timeout
+        self.pending = 0
+        self.max_pending = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.wait_time = Histogram()
+        self.exec_time = Histogram()
+        self._lock = threading.Lock()
+        self._loop = None
+
+    @property
+    def loop(self):
+        """The event loop of the caller, looked up once"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            loop = self._loop = asyncio.get_event_loop()
+        return loop
+
+    def submit(self, func, *args, **kwargs):
+        """Queue ``func(*args, **kwargs)`` and return an awaitable of its
+        result. Raises ExecutorSaturated if ``max_queue`` calls are already
+        waiting.
+
+        ``func`` runs in a copy of the context variables of the caller, like
+        ``loop.run_in_executor()`` does not, so e.g. the events it fires are
+        queued by a ``deferred_events()`` block of the caller.
+        """
+        with self._lock:
+            if self.max_queue and self.pending >= self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated(
+                    '{0:d} calls queued on the connection executor'.format(
+                        self.pending))
+            self.pending += 1
+            self.submitted += 1
+            if self.pending > self.max_pending:
+                self.max_pending = self.pending
+
+        queued = time.perf_counter()
+        context = contextvars.copy_context()
+
+        def call():
+            started = time.perf_counter()
+            self.wait_time.add(started - queued)
+            try:
+                return context.run(func, *args, **kwargs)
+            finally:
+                self.exec_time.add(time.perf_counter() - started)
+
+        future = self.executor.submit(call)
+        # also called if the call is cancelled before it started
+        future.add_done_callback(self._done)
+        future = asyncio.wrap_future(future, loop=self.loop)
+        if self.timeout:
+            return self._wait(future)
+        return future
+
+    __call__ = submit
+
+    def _done(self, future):
+        with self._lock:
+            self.pending -= 1
+
+    async def _wait(self, future):
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    def stats(self):
+        """Return the counters and histograms as a dict"""
+        return {
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'submitted': self.submitted,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+            'wait_time': self.wait_time.as_dict(),
+            'exec_time': self.exec_time.as_dict(),
+        }
+
+
+def get_executor(connection, max_queue=None, timeout=None):
+    """Return the ManagedExecutor of ``connection``, creating it on first
+    use. ``max_queue`` and ``timeout`` update its settings if given.
+    """
+    managed = getattr(connection, '_managed_executor', None)
+    if managed is None or managed.executor is not connection.executor:
+        managed = ManagedExecutor(connection.executor)
+        connection._managed_executor = managed
+    if max_queue is not None:
+        managed.max_queue = max_queue
+    if timeout is not None:
+        managed.timeout = timeout
+    return managed
+
+
+def _run_batch(calls, cancelled=None):
+    """Run ``calls`` one after the other, returning ``(ok, result or
+    exception)`` for each. Calls not started yet when the event
+    ``cancelled`` is set are skipped. Runs in the executor.
+    """
+    results = []
+    for func in calls:
+        if cancelled is not None and cancelled.is_set():
+            results.append((False, asyncio.CancelledError()))
+            continue
+        try:
+            results.append((True, func()))
+        except Exception as e:
+            results.append((False, e))
+    return results
+
+
+class GroupCommit(object):
+    """Runs the commits queued within ``window`` seconds, or up to
+    ``max_batch`` of them, in one call of the executor ``executor``.
+
+    Every commit still is its own transaction, and its caller only gets its
+    own result or exception. If the executor call of a group times out, its
+    callers get asyncio.TimeoutError and the commits not started yet are
+    skipped, but the commit running at that time still completes: a caller
+    getting TimeoutError cannot tell whether its transaction was committed.
+    """
+
+    def __init__(self, executor, window=None, max_batch=None):
+        self.executor = executor
+        self.window = GROUP_COMMIT_WINDOW if window is None else window
+        self.max_batch = max_batch or GROUP_COMMIT_MAX_BATCH
+        self.batch_sizes = Histogram(BATCH_SIZE_BOUNDS)
+        self._queue = []
+        self._timer = None
+
+    def commit(self, func):
+        """Queue ``func``, usually the ``commit`` of a transaction, and
+        return a future of its result.
+        """
+        loop = self.executor.loop
+        future = loop.create_future()
+        self._queue.append((func, future))
+        if len(self._queue) >= self.max_batch:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self.flush)
+        return future
+
+    __call__ = commit
+
+    def flush(self):
+        """Run the queued commits now"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        queue, self._queue = self._queue, []
+        if not queue:
+            return
+        self.batch_sizes.add(len(queue))
+        cancelled = threading.Event()
+        try:
+            results = self.executor.submit(
+                _run_batch, [func for func, future in queue], cancelled)
+        except Exception as e:
+            for func, future in queue:
+                future.set_exception(e)
+            return
+        results = asyncio.ensure_future(results, loop=self.executor.loop)
+        results.add_done_callback(
+            lambda results: self._resolve(queue, results, cancelled))
+
+    def _resolve(self, queue, results, cancelled):
+        if results.cancelled() or results.exception() is not None:
+            cancelled.set()
+            error = results.exception() if not results.cancelled() else \
+                asyncio.CancelledError()
+            for func, future in queue:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (func, future), (ok, value) in zip(queue, results.result()):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def stats(self):
+        """Return the batch size histogram as a dict"""
+        return {'batch_sizes': self.batch_sizes.as_dict()}
+
+
+def group_commit(context, window=None, max_batch=None):
+    """Return the commit function of the GroupCommit of the connection of
+    ``context``, like synccontext() returns the executor. ``window`` and
+    ``max_batch`` update its settings if given, like get_executor().
+    """
+    connection = context._p_jar
+    committer = getattr(connection, '_group_commit', None)
+    executor = get_executor(connection)
+    if committer is None or committer.executor is not executor:
+        committer = GroupCommit(executor)
+        connection._group_commit = committer
+    if window is not None:
+        committer.window = window
+    if max_batch:
+        committer.max_batch = max_batch
+    return committer.commit
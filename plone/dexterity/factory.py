@@ -2,7 +2,9 @@
 from persistent import Persistent
 from plone.dexterity.interfaces import IDexterityFactory
 from plone.dexterity.interfaces import IDexterityFTI
+from plone.dexterity.schema import SCHEMA_CACHE
 from plone.dexterity.utils import resolveDottedName
+from zope.component import getSiteManager
 from zope.component import getUtility
 from zope.component.factory import Factory
 from zope.interface import implementer
@@ -12,31 +14,70 @@ from zope.interface.declarations import Implements
 @implementer(IDexterityFactory)
 class DexterityFactory(Persistent, Factory):
     """A factory for Dexterity content.
+
+    The FTI, the content class and the interfaces spec of the type are kept
+    in volatile attributes. They are used again as long as the same site is
+    active, no schema was invalidated since, and the FTI's ``_p_mtime`` and
+    ``klass`` did not change.
     """
 
     def __init__(self, portal_type):
         self.portal_type = portal_type
 
+    def _cache_key(self, fti):
+        return (getSiteManager(), SCHEMA_CACHE.invalidations,
+                fti._p_mtime, fti.klass)
+
+    def _is_current(self, key, fti):
+        """Return True if ``key`` is still the cache key of ``fti``. The site
+        manager is compared first, as the FTI of another site must not be
+        touched, its connection may be closed.
+        """
+        return key[0] is getSiteManager() and \
+            key[1] == SCHEMA_CACHE.invalidations and \
+            key[2:] == (fti._p_mtime, fti.klass)
+
+    def _resolved(self, resolve=True):
+        """Return the cached ``(key, fti, klass)`` of the type, looking the
+        FTI up and resolving the class if the cache is stale. With
+        ``resolve=False`` the class is not resolved for a new FTI and None
+        is returned as klass.
+        """
+        cached = getattr(self, '_v_resolved', None)
+        if cached is not None:
+            key, fti, klass = cached
+            if self._is_current(key, fti) and (klass or not resolve):
+                return cached
+        fti = getUtility(IDexterityFTI, name=self.portal_type)
+        klass = self.resolve_class(fti) if resolve else None
+        cached = self._v_resolved = (self._cache_key(fti), fti, klass)
+        return cached
+
     @property
     def title(self):
-        fti = getUtility(IDexterityFTI, name=self.portal_type)
-        return fti.title
+        return self._resolved(False)[1].title
 
     @property
     def description(self):
-        fti = getUtility(IDexterityFTI, name=self.portal_type)
-        return fti.description
+        return self._resolved(False)[1].description
 
     def __call__(self, *args, **kw):
-        fti = getUtility(IDexterityFTI, name=self.portal_type)
+        key, fti, klass = self._resolved()
+        return self.construct(klass, fti, *args, **kw)
 
+    def resolve_class(self, fti):
+        """Return the content class of the type ``fti``"""
         klass = resolveDottedName(fti.klass)
         if klass is None or not callable(klass):
             raise ValueError(
                 'Content class {0:s} set for type {1:s} is not valid'
                 .format(fti.klass, self.portal_type)
             )
+        return klass
 
+    def construct(self, klass, fti, *args, **kw):
+        """Create an instance of ``klass``, as returned by resolve_class()
+        """
         try:
             obj = klass(*args, **kw)
         except TypeError as e:
@@ -54,9 +95,13 @@ class DexterityFactory(Persistent, Factory):
         return obj
 
     def getInterfaces(self):
-        fti = getUtility(IDexterityFTI, name=self.portal_type)
+        key, fti, klass = self._resolved(False)
+        cached = getattr(self, '_v_spec', None)
+        if cached is not None and cached[0] == key:
+            return cached[1]
         spec = Implements(fti.lookupSchema())
         spec.__name__ = self.portal_type
+        self._v_spec = (key, spec)
         return spec
 
     def __repr__(self):
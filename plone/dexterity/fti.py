@@ -97,6 +97,35 @@ class DexterityFTI(Persistent):
             'label': 'Content type schema policy',
             'description': 'Name of the schema policy.'
         },
+        {
+            'id': 'promotion_threshold',
+            'type': 'int',
+            'mode': 'w',
+            'label': 'Promotion threshold',
+            'description': 'Number of children past which a container of '
+                           'this type is migrated to BTree based storage. '
+                           '0 disables the migration.'
+        },
+        {
+            'id': 'ordered',
+            'type': 'boolean',
+            'mode': 'w',
+            'label': 'Ordered',
+            'description': 'Whether containers of this type keep their '
+                           'children in a user defined order. Promoted '
+                           'unordered containers sort them by id.'
+        },
+        {
+            'id': 'container_storage',
+            'type': 'string',
+            'mode': 'w',
+            'label': 'Container storage',
+            'description': 'BTree holding the children of BTree based '
+                           'containers of this type: empty for the default '
+                           'OOBTree, "large" for an OOBTree with larger '
+                           'buckets, "integer" for mostly numerically named '
+                           'children.'
+        },
 
     )
 
@@ -137,6 +166,9 @@ class DexterityFTI(Persistent):
     schema = ''
     schema_policy = 'dexterity'
     factory = ''
+    promotion_threshold = 0
+    ordered = True
+    container_storage = ''
 
     def __init__(self, id, *args, **kwargs):
         self.id = id
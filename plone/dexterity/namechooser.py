@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from BTrees.OOBTree import OOBTree
+from plone.dexterity.content import BTreeContainer
+from plone.dexterity.content import Container
+from zope.container.contained import NameChooser
+
+
+def _children_tree(container):
+    """Return the BTree holding the children of ``container``, or None"""
+    if isinstance(container, BTreeContainer):
+        return container._BTreeContainer__data
+    if isinstance(container, Container):
+        data = container._data
+        if isinstance(data, OOBTree):
+            return data
+    return None
+
+
+def _reserved_names(container):
+    """Return the names kept free in ``container`` by tombstoned children"""
+    return getattr(container, '_reserved_names', None) or ()
+
+
+class DexterityNameChooser(NameChooser):
+    """Name chooser choosing names like zope.container's NameChooser.
+
+    If the suggested name is taken, the stock chooser tries ``name-2``,
+    ``name-3``, ... with one container lookup each. Here the numbers are
+    probed with an exponential and then a binary search, so choosing a name
+    among ``n`` taken ones costs ``O(log n)`` key lookups. This finds the
+    same name as long as the taken numbers have no gaps, which is the case
+    unless objects were removed or named by hand; otherwise it picks a free
+    number following a taken one, not necessarily the lowest.
+    """
+
+    def chooseName(self, name, object):
+        container = self.context
+
+        # convert to unicode and remove characters that checkName does not
+        # allow, like NameChooser does
+        if isinstance(name, bytes):
+            name = name.decode('ascii')
+        if not isinstance(name, str):
+            try:
+                name = str(name)
+            except Exception:
+                name = ''
+        name = name.replace('/', '-').lstrip('+@')
+
+        if not name:
+            name = object.__class__.__name__
+
+        dot = name.rfind('.')
+        if dot >= 0:
+            suffix = name[dot:]
+            name = name[:dot]
+        else:
+            suffix = ''
+
+        n = name + suffix
+        if n in container or n in _reserved_names(container):
+            n = self._nextName(container, name, suffix)
+
+        # Make sure the name is valid. We may have started with something bad.
+        self.checkName(n, object)
+        return n
+
+    def checkName(self, name, object):
+        if name in _reserved_names(self.context):
+            raise KeyError(
+                'The given name is reserved by a deleted object')
+        return super(DexterityNameChooser, self).checkName(name, object)
+
+    def _nextName(self, container, name, suffix):
+        """Return a free ``name-<i><suffix>`` for i >= 2, the first one if
+        the taken numbers have no gaps.
+        """
+        tree = _children_tree(container)
+        if tree is None:
+            tree = container
+        reserved = _reserved_names(container)
+
+        def taken(i):
+            n = '{0:s}-{1:d}{2:s}'.format(name, i, suffix)
+            return n in tree or n in reserved
+
+        if not taken(2):
+            return '{0:s}-2{1:s}'.format(name, suffix)
+        # taken(low) and not taken(high)
+        low, high = 2, 4
+        while taken(high):
+            low, high = high, high * 2
+        while high - low > 1:
+            middle = (low + high) // 2
+            if taken(middle):
+                low = middle
+            else:
+                high = middle
+        return '{0:s}-{1:d}{2:s}'.format(name, high, suffix)
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+from BTrees.LOBTree import LOBTree
+from BTrees.Length import Length
+from BTrees.OLBTree import OLBTree
+from itertools import islice
+from persistent import Persistent
+
+import random
+import weakref
+
+
+# Number of changes made to each ContainerOrder in this process. It is kept
+# outside of the orders, as ghosting an order drops its volatile attributes
+_generations = weakref.WeakKeyDictionary()
+
+
+class ContainerOrder(Persistent):
+    """The order of the children of a Container, stored in BTrees.
+
+    Every key gets a sparse integer position. ``_pos`` maps positions to keys
+    and ``_rpos`` maps keys back to their position. Appending, removing and
+    moving a key only touches the buckets holding its old and new position,
+    instead of re-pickling a list of all keys.
+
+    The class supports the parts of the list API the Container uses, so a
+    PersistentList from an older Container can be used in its place until the
+    container is migrated.
+    """
+
+    # distance between the positions of two appended keys
+    gap = 2 ** 32
+
+    # highest position a key may get before the index is renumbered
+    max_position = 2 ** 62
+
+    # pick new positions at random from the middle of the free range, so
+    # that concurrent transactions adding keys at the same place, e.g. at
+    # the end, pick different positions and the BTrees resolve the conflict
+    random_positions = True
+
+    def __init__(self, keys=()):
+        self._pos = LOBTree()
+        self._rpos = OLBTree()
+        self._len = Length()
+        self.update(keys)
+
+    @property
+    def generation(self):
+        """Number of changes made in this process, used to detect changes
+        while iterating. It survives the order being ghosted.
+        """
+        return _generations.get(self, 0)
+
+    def _changed(self):
+        _generations[self] = self.generation + 1
+
+    def __len__(self):
+        return self._len()
+
+    def _keys(self):
+        """Return the keys in order, as a lazy BTree sequence"""
+        return self._pos.values()
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __reversed__(self):
+        # BTrees cannot iterate backwards
+        return reversed(list(self._keys()))
+
+    def __contains__(self, key):
+        return key in self._rpos
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if (index.start or 0) >= 0 and (index.stop or 0) >= 0 and \
+                    (index.step or 1) > 0:
+                return list(islice(
+                    self._keys(), index.start, index.stop, index.step))
+            return list(self)[index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self._keys()[index]
+
+    def __repr__(self):
+        return '<{0:s} {1!r}>'.format(self.__class__.__name__, list(self))
+
+    def index(self, key):
+        """Return the index of ``key``"""
+        position = self._rpos[key]
+        return len(self._pos.keys(max=position, excludemax=True))
+
+    def append(self, key):
+        self.insert(len(self), key)
+
+    def extend(self, keys):
+        """Append ``keys``, updating the length once"""
+        keys = list(keys)
+        if len(set(keys)) != len(keys):
+            raise ValueError('Duplicate keys')
+        for key in keys:
+            if key in self._rpos:
+                raise ValueError('Duplicate key {0!r}'.format(key))
+        size = len(self)
+        for count, key in enumerate(keys):
+            self._set(key, self._free_position(size + count, size + count))
+        self._len.change(len(keys))
+        self._changed()
+
+    def insert(self, index, key):
+        if key in self._rpos:
+            raise ValueError('Duplicate key {0!r}'.format(key))
+        size = len(self)
+        if index < 0:
+            index = max(0, index + size)
+        self._set(key, self._free_position(index, size))
+        self._len.change(1)
+        self._changed()
+
+    def remove(self, key):
+        position = self._rpos.pop(key)
+        del self._pos[position]
+        self._len.change(-1)
+        self._changed()
+
+    def remove_many(self, keys):
+        """Remove ``keys``, updating the length once"""
+        keys = list(keys)
+        for key in keys:
+            del self._pos[self._rpos.pop(key)]
+        self._len.change(-len(keys))
+        self._changed()
+
+    def move(self, key, index):
+        """Move ``key`` to ``index``. Returns True if the key was moved."""
+        size = len(self)
+        if index < 0:
+            index = max(0, index + size)
+        index = min(index, size - 1)
+        if self.index(key) == index:
+            return False
+        position = self._rpos.pop(key)
+        del self._pos[position]
+        self._set(key, self._free_position(index, size - 1))
+        self._changed()
+        return True
+
+    def reorder(self, keys):
+        """Reorder ``keys`` among the positions they already occupy.
+
+        Only the positions whose key changes are written, so moving one key
+        in a list of all keys is a small change.
+        """
+        keys = list(keys)
+        if len(set(keys)) != len(keys):
+            raise ValueError('Duplicate keys')
+        positions = sorted(self._rpos[key] for key in keys)
+        for position, key in zip(positions, keys):
+            if self._pos[position] != key:
+                self._set(key, position)
+        self._changed()
+
+    def update(self, keys):
+        """Replace the order with ``keys``"""
+        keys = list(keys)
+        if len(set(keys)) != len(keys):
+            raise ValueError('Duplicate keys')
+        self._renumber(keys)
+        self._len.set(len(keys))
+        self._changed()
+
+    def _set(self, key, position):
+        self._pos[position] = key
+        self._rpos[key] = position
+
+    def _free_position(self, index, size):
+        """Return a free position to insert a key at ``index`` among the
+        ``size`` keys in ``_pos``, renumbering them if there is no room left.
+        """
+        positions = self._pos
+        if not size:
+            return self.gap
+        if index >= size:
+            before = positions.maxKey()
+            after = before + 2 * self.gap
+        else:
+            after = positions.keys()[index]
+            if index == 0:
+                before = after - 2 * self.gap
+            else:
+                before = positions.keys()[index - 1]
+        if after - before < 2 or max(abs(before), abs(after)) > \
+                self.max_position:
+            self._renumber(list(positions.values()))
+            return self._free_position(index, size)
+        span = after - before
+        if span < 4 or not self.random_positions:
+            return before + span // 2
+        return before + span // 4 + random.randrange(span // 2)
+
+    def _renumber(self, keys):
+        self._pos.clear()
+        self._rpos.clear()
+        for count, key in enumerate(keys, 1):
+            self._set(key, count * self.gap)
+
+
+class KeyOrder(ContainerOrder):
+    """The order of the children of an unordered Container.
+
+    The children are sorted by key, like in a BTreeContainer, so only their
+    number is stored. Moving children is not supported: ``move()`` and
+    ``reorder()`` raise ValueError unless the order stays the same.
+    """
+
+    def __init__(self, data, size=None):
+        self._data = data
+        self._len = Length(len(data) if size is None else size)
+
+    def _keys(self):
+        return self._data.keys()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def index(self, key):
+        if key not in self._data:
+            raise KeyError(key)
+        return len(self._data.keys(max=key, excludemax=True))
+
+    def extend(self, keys):
+        self._len.change(len(list(keys)))
+        self._changed()
+
+    def insert(self, index, key):
+        self._len.change(1)
+        self._changed()
+
+    def remove(self, key):
+        self._len.change(-1)
+        self._changed()
+
+    def remove_many(self, keys):
+        self._len.change(-len(list(keys)))
+        self._changed()
+
+    def move(self, key, index):
+        size = len(self)
+        if index < 0:
+            index = max(0, index + size)
+        if self.index(key) != min(index, size - 1):
+            raise ValueError(
+                'Children of an unordered container cannot be moved')
+        return False
+
+    def reorder(self, keys):
+        keys = list(keys)
+        if keys != sorted(keys):
+            raise ValueError(
+                'Children of an unordered container cannot be reordered')
+
+    def update(self, keys):
+        self._len.set(len(list(keys)))
+        self._changed()
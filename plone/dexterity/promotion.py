@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""Migration of large containers to BTree based storage.
+
+A type opts in by setting ``promotion_threshold`` on its FTI. Containers of
+that type that grow past the threshold are queued in the database, and a
+``Promoter`` migrates them in transactions of at most ``batch_size``
+children. Containers still using the storage of older versions are queued
+when they are changed, whatever their size; until they are migrated, they
+keep reading and writing their old storage.
+
+- a ``Container`` created before its children were kept in BTrees gets the
+  OOBTree and ``ContainerOrder`` storage, keeping the order of its children,
+- a ``Container`` of a type whose FTI is not ``ordered`` then drops the
+  index keeping the order of its children, which are sorted by id from then
+  on, like in a ``BTreeContainer``,
+- a ``BTreeContainer`` whose children are not kept in the mapping its FTI
+  asks for with ``container_storage`` gets a new one, see
+  ``plone.dexterity.storage``. Children added or removed while it is
+  copied are caught up with in the last transaction.
+
+The container keeps its class, so references to it stay valid.
+
+The subscriber queueing containers only sees containers that are changed.
+Older containers that are only read can be queued with
+``queue_promotion()``, e.g. from an upgrade step.
+
+    >>> fti.promotion_threshold = 5000
+    >>> fti.ordered = False
+    >>> Promoter(db).start()
+"""
+from BTrees.OOBTree import OOBTree
+from itertools import islice
+from persistent import Persistent
+from plone.dexterity.content import BTreeContainer
+from plone.dexterity.content import Container
+from plone.dexterity.content import migrate_container_storage
+from plone.dexterity.interfaces import IDexterityContainer
+from plone.dexterity.interfaces import IDexterityFTI
+from plone.dexterity.ordering import ContainerOrder
+from plone.dexterity.ordering import KeyOrder
+from plone.dexterity.reaper import BatchJob
+from plone.dexterity.storage import get_storage
+from plone.dexterity.storage import NameIndexedData
+from zope.component import adapter
+from zope.component import queryUtility
+from zope.container.interfaces import IContainerModifiedEvent
+
+import logging
+import time
+
+
+log = logging.getLogger(__name__)
+
+# Key of the promotion queue in the database root
+PROMOTIONS_KEY = 'plone.dexterity.promotions'
+
+
+class Promotion(Persistent):
+    """A container waiting to be promoted, with the storage built so far"""
+
+    # last key copied into ``data`` of a BTreeContainer
+    last = None
+
+    # number of positions of the old order of a Container copied so far
+    position = 0
+
+    def __init__(self, object):
+        self.object = object
+        self.data = None
+        self.order = None
+        self.created = time.time()
+        self.migrated = 0
+
+    def __repr__(self):
+        return '<Promotion {0!s}, {1:d} children migrated>'.format(
+            self.object.__name__, self.migrated)
+
+
+def get_promotions(connection, create=False):
+    """Return the promotion queue of the database of ``connection``"""
+    root = connection.root()
+    promotions = root.get(PROMOTIONS_KEY)
+    if promotions is None and create:
+        promotions = root[PROMOTIONS_KEY] = OOBTree()
+    return promotions
+
+
+def get_policy(portal_type):
+    """Return ``(threshold, ordered)`` for containers of ``portal_type``"""
+    fti = None
+    if portal_type:
+        fti = queryUtility(IDexterityFTI, name=portal_type)
+    if fti is None:
+        return 0, True
+    return (getattr(fti, 'promotion_threshold', 0) or 0,
+            getattr(fti, 'ordered', True))
+
+
+def _is_legacy(container):
+    return not isinstance(container._order, ContainerOrder)
+
+
+def _storage_mismatch(container):
+    """Return the mapping class the children of the BTreeContainer
+    ``container`` should be moved to, or None.
+    """
+    factory = get_storage(getattr(container, 'portal_type', None))
+    data = container._BTreeContainer__data
+    if factory is None or type(data) is factory:
+        return None
+    return factory
+
+
+def needs_promotion(container):
+    """Return True if ``container`` still uses the storage of older
+    versions, is past the promotion threshold of its type and not promoted
+    yet, or is a BTreeContainer whose children are not kept in the storage
+    of its type.
+    """
+    if isinstance(container, BTreeContainer):
+        return _storage_mismatch(container) is not None and len(container) > 0
+    if not isinstance(container, Container):
+        return False
+    if _is_legacy(container):
+        return True
+    threshold, ordered = get_policy(getattr(container, 'portal_type', None))
+    if not threshold or len(container) <= threshold:
+        return False
+    return not ordered and not isinstance(container._order, KeyOrder)
+
+
+def queue_promotion(container):
+    """Queue ``container`` for promotion. Returns the queue entry, or None if
+    the container is not persistent or already queued.
+    """
+    jar = getattr(container, '_p_jar', None)
+    if jar is None or container._p_oid is None:
+        return None
+    promotions = get_promotions(jar, create=True)
+    if container._p_oid in promotions:
+        return None
+    entry = promotions[container._p_oid] = Promotion(container)
+    return entry
+
+
+@adapter(IDexterityContainer, IContainerModifiedEvent)
+def queuePromotion(container, event):
+    """Queue containers that grew past the threshold of their type"""
+    if needs_promotion(container):
+        queue_promotion(container)
+
+
+def promote_to_unordered(container):
+    """Drop the order index of ``container``. Its children are then sorted
+    by key, like in a ``BTreeContainer``, and adding or removing one only
+    writes the data BTree and a ``Length``. The children are not touched.
+    """
+    migrate_container_storage(container)
+    if not isinstance(container._order, KeyOrder):
+        container._order = KeyOrder(container._data, len(container._order))
+
+
+def _read_current(mapping):
+    """Make the current transaction fail with a conflict if another one
+    changes ``mapping`` before it commits. Adding a child to a BTree only
+    writes one of its buckets, not the container swapping the mapping, so
+    every node of the tree is checked, which loads all of them.
+    """
+    if getattr(mapping, '_p_oid', None) is None:
+        return
+    mapping._p_activate()
+    mapping._p_jar.readCurrent(mapping)
+    if isinstance(mapping, NameIndexedData):
+        _read_current(mapping._index)
+        _read_current(mapping._data)
+        return
+    if getattr(type(mapping), '_bucket_type', None) is None:
+        # a bucket, or the PersistentDict or PersistentList of a Container
+        return
+    state = mapping.__getstate__()
+    if state is None:
+        return
+    data = state[0]
+    if len(data) == 1 and isinstance(data[0], tuple):
+        # a single bucket stored in the tree itself
+        return
+    for child in data[::2]:
+        _read_current(child)
+
+
+def migrate_btree_batch(entry, batch_size):
+    """Copy up to ``batch_size`` children of the BTreeContainer of
+    ``entry`` to the storage of its type. Returns True once the container
+    uses it.
+
+    The children are copied in key order; only references are copied, the
+    children are not loaded. The last batch catches up with the children
+    added, replaced or removed meanwhile, which reads the keys of both
+    mappings, and conflicts with transactions changing the old mapping
+    before it commits.
+    """
+    container = entry.object
+    factory = _storage_mismatch(container)
+    if factory is None:
+        entry.data = entry.last = None
+        return True
+    source = container._BTreeContainer__data
+    if entry.data is None or type(entry.data) is not factory:
+        entry.data = factory()
+        entry.last = None
+    if entry.last is None:
+        keys = source.keys()
+    else:
+        keys = source.keys(min=entry.last, excludemin=True)
+    keys = list(islice(keys, batch_size))
+    for key in keys:
+        entry.data[key] = source[key]
+    entry.migrated += len(keys)
+    if len(keys) == batch_size:
+        entry.last = keys[-1]
+        return False
+
+    _read_current(source)
+    data = entry.data
+    for key, value in source.items():
+        if data.get(key) is not value:
+            data[key] = value
+    for key in [key for key in data.keys() if key not in source]:
+        del data[key]
+    container._BTreeContainer__data = data
+    entry.data = entry.last = None
+    return True
+
+
+def promote_batch(entry, batch_size):
+    """Migrate up to ``batch_size`` children of the queued ``entry``.
+    Returns True once the container is promoted.
+    """
+    container = entry.object
+    if isinstance(container, BTreeContainer):
+        return migrate_btree_batch(entry, batch_size)
+    if _is_legacy(container):
+        if entry.order is None:
+            entry.data = OOBTree()
+            entry.order = ContainerOrder()
+            entry.position = 0
+        source = container._data
+        done = entry.position
+        keys = list(container._order[done:done + batch_size])
+        entry.position += len(keys)
+        # keys shift when children are removed between two batches
+        keys = [key for key in keys
+                if key in source and key not in entry.order]
+        for key in keys:
+            entry.data[key] = source[key]
+        entry.order.extend(keys)
+        entry.migrated += len(keys)
+        if entry.position < len(container._order):
+            return False
+
+        # catch up with the children added, replaced, removed or moved
+        # since the first batch, and with children missing from the order
+        # of a broken container. Changes committed to the old storage from
+        # now on would be lost, so they make this transaction conflict
+        _read_current(source)
+        _read_current(container._order)
+        data = entry.data
+        order = [key for key in container._order if key in source]
+        seen = set(order)
+        order += [key for key in source.keys() if key not in seen]
+        for key in [key for key in data.keys() if key not in source]:
+            del data[key]
+            entry.order.remove(key)
+        for key in order:
+            value = source[key]
+            if key not in entry.order:
+                entry.order.append(key)
+            if data.get(key) is not value:
+                data[key] = value
+        if list(entry.order) != order:
+            entry.order.update(order)
+        container._data = data
+        container._order = entry.order
+    # else the container was migrated with migrate_container_storage()
+
+    entry.data = entry.order = None
+    entry.position = 0
+    threshold, ordered = get_policy(getattr(container, 'portal_type', None))
+    if not ordered:
+        promote_to_unordered(container)
+    return True
+
+
+class Promoter(BatchJob):
+    """Promotes queued containers in transactions of ``batch_size``
+    children, sleeping ``pause`` seconds between two of them.
+
+    ``progress``, if given, is called with the queue entry after each batch.
+    """
+
+    thread_name = 'plone.dexterity.promoter'
+
+    def step(self, connection):
+        """Promote one batch. Returns True if there is nothing left to do."""
+        promotions = get_promotions(connection)
+        if not promotions:
+            return True
+        key = promotions.minKey()
+        entry = promotions[key]
+        if promote_batch(entry, self.batch_size):
+            del promotions[key]
+            log.info('Promoted %s: %d children migrated',
+                     entry.object.__name__, entry.migrated)
+        if self.progress is not None:
+            self.progress(entry)
+        return False
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""Deletion of very large subtrees in many small transactions.
+
+Deleting a folder in one transaction fires removed events for every
+descendant and writes all of them in one commit. Instead, ``tombstone()``
+detaches the folder from its parent right away and records it in a queue
+stored in the database. Its name stays reserved in the parent until it is
+reaped, so that no new content is created at the paths the removed events
+of the subtree refer to. A ``Reaper`` then empties the detached subtree,
+deepest children first, with the regular ``delete_many`` of the containers,
+committing after every batch. All progress is kept in the database, so an
+interrupted reaper simply continues where it stopped.
+
+    >>> tombstone(folder, 'huge-folder')
+    >>> transaction.commit()
+    >>> Reaper(db).start()
+"""
+from abc import ABC
+from abc import abstractmethod
+from BTrees.OOBTree import OOBTree
+from BTrees.OOBTree import OOTreeSet
+from persistent import Persistent
+from plone.dexterity.events import notify
+from plone.dexterity.events import notifyContainerModified
+from ZODB.POSException import ConflictError
+from zope.lifecycleevent import ObjectRemovedEvent
+
+import logging
+import threading
+import time
+import transaction
+
+
+log = logging.getLogger(__name__)
+
+# Key of the tombstone queue in the database root
+TOMBSTONES_KEY = 'plone.dexterity.tombstones'
+
+
+class Tombstone(Persistent):
+    """A detached subtree waiting to be reaped"""
+
+    def __init__(self, object, parent, name):
+        self.object = object
+        self.parent = parent
+        self.name = name
+        self.created = time.time()
+        self.removed = 0
+
+    def __repr__(self):
+        return '<Tombstone {0:s}, {1:d} objects removed>'.format(
+            self.name, self.removed)
+
+
+def get_tombstones(connection, create=False):
+    """Return the tombstone queue of the database of ``connection``"""
+    root = connection.root()
+    tombstones = root.get(TOMBSTONES_KEY)
+    if tombstones is None and create:
+        tombstones = root[TOMBSTONES_KEY] = OOBTree()
+    return tombstones
+
+
+def _is_container(object):
+    return getattr(type(object), 'delete_many', None) is not None
+
+
+def _reserve_name(container, key):
+    names = container._reserved_names
+    if names is None:
+        names = container._reserved_names = OOTreeSet()
+    names.add(key)
+
+
+def _release_name(container, key):
+    names = getattr(container, '_reserved_names', None)
+    if names is not None and key in names:
+        names.remove(key)
+
+
+def tombstone(container, key):
+    """Detach the child ``key`` of ``container`` and queue it for deletion.
+
+    The parent gets a container modified event right away. The removed events
+    for the subtree are fired by the reaper, batch by batch, ending with the
+    event for the detached child itself. Until then ``key`` cannot be used
+    in ``container``.
+    """
+    object = container[key]
+    jar = getattr(container, '_p_jar', None)
+    if jar is None or getattr(object, '_p_oid', None) is None \
+            or not _is_container(object) or not len(object):
+        # nothing to gain, delete it right away
+        container.delete_many([key])
+        return None
+
+    tombstones = get_tombstones(jar, create=True)
+    container._detach(key)
+    _reserve_name(container, key)
+    entry = tombstones[object._p_oid] = Tombstone(object, container, key)
+    notifyContainerModified(container)
+    return entry
+
+
+def reap_batch(container, batch_size):
+    """Delete up to ``batch_size`` descendants of ``container``, deepest
+    first. Returns the number of deleted objects.
+    """
+    keys = []
+    for key, child in container.iteritems(batch_size):
+        if _is_container(child) and len(child):
+            if keys:
+                # delete the leaves found so far first
+                break
+            return reap_batch(child, batch_size)
+        keys.append(key)
+        if len(keys) >= batch_size:
+            break
+    container.delete_many(keys)
+    return len(keys)
+
+
+class BatchJob(ABC):
+    """Base class of jobs working through the database in transactions of
+    ``batch_size`` changes, sleeping ``pause`` seconds between two of them.
+
+    Subclasses implement ``step()``. ``progress``, if given, is called with
+    the entry worked on after each batch.
+    """
+
+    thread_name = 'plone.dexterity.job'
+
+    def __init__(self, db, batch_size=500, pause=0.0, progress=None):
+        self.db = db
+        self.batch_size = batch_size
+        self.pause = pause
+        self.progress = progress
+        self.thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Run the job in a background thread"""
+        self._stopped.clear()
+        self.thread = threading.Thread(
+            target=self.run, name=self.thread_name)
+        self.thread.daemon = True
+        self.thread.start()
+        return self.thread
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def run(self, max_transactions=None):
+        """Run until there is nothing left to do, the job is stopped or
+        ``max_transactions`` were committed. Returns the number of commits.
+        """
+        manager = transaction.TransactionManager()
+        connection = self.db.open(transaction_manager=manager)
+        commits = 0
+        try:
+            while not self._stopped.is_set():
+                if max_transactions is not None and \
+                        commits >= max_transactions:
+                    break
+                manager.begin()
+                try:
+                    done = self.step(connection)
+                    manager.commit()
+                except ConflictError:
+                    manager.abort()
+                    log.info('Conflict in %s, retrying', self.thread_name)
+                    continue
+                except Exception:
+                    manager.abort()
+                    raise
+                if done:
+                    break
+                commits += 1
+                if self.pause:
+                    self._stopped.wait(self.pause)
+        finally:
+            connection.close()
+        return commits
+
+    @abstractmethod
+    def step(self, connection):
+        """Do one batch. Returns True if there is nothing left to do."""
+
+
+class Reaper(BatchJob):
+    """Empties tombstoned subtrees in transactions of ``batch_size``
+    deletions, sleeping ``pause`` seconds between two of them.
+
+    ``progress``, if given, is called with the tombstone after each batch.
+    """
+
+    thread_name = 'plone.dexterity.reaper'
+
+    def step(self, connection):
+        """Reap one batch. Returns True if there is nothing left to do."""
+        tombstones = get_tombstones(connection)
+        if not tombstones:
+            return True
+        key = tombstones.minKey()
+        entry = tombstones[key]
+        started = time.time()
+        removed = reap_batch(entry.object, self.batch_size)
+        entry.removed += removed
+
+        if not len(entry.object):
+            # the subtree is empty, finally remove its root
+            object = entry.object
+            notify(ObjectRemovedEvent(object, entry.parent, entry.name))
+            object.__parent__ = None
+            object.__name__ = None
+            _release_name(entry.parent, entry.name)
+            entry.removed += 1
+            del tombstones[key]
+            log.info('Reaped %s: %d objects removed',
+                     entry.name, entry.removed)
+        else:
+            log.debug('Reaping %s: %d objects removed in %.3fs, %d so far',
+                      entry.name, removed, time.time() - started,
+                      entry.removed)
+        if self.progress is not None:
+            self.progress(entry)
+        return False
+
+
+def progress(connection):
+    """Return a list of ``(name, removed, created)`` for all pending
+    tombstones.
+    """
+    tombstones = get_tombstones(connection) or {}
+    return [
+        (entry.name, entry.removed, entry.created)
+        for entry in tombstones.values()
+    ]
@@ -6,6 +6,7 @@ from plone.behavior.registration import BehaviorRegistration
 from plone.dexterity.interfaces import IContentType
 from plone.dexterity.interfaces import IDexterityFTI
 from plone.dexterity.interfaces import IDexteritySchema
+from plone.dexterity.interfaces import IFormFieldProvider
 from plone.dexterity.interfaces import ISchemaInvalidatedEvent
 from plone.supermodel.parser import ISchemaPolicy
 from plone.supermodel.utils import syncSchema
@@ -40,6 +41,7 @@ def invalidate_cache(fti):
     fti.__dict__.pop('_v_schema_schema_interfaces', None)
     fti.__dict__.pop('_v_schema_modified', None)
     fti.__dict__.pop('_v_schema_behavior_schema_interfaces', None)
+    fti.__dict__.pop('_v_schema_field_routes', None)
 
 
 def volatile(func):
@@ -204,6 +206,32 @@ class SchemaCache(object):
             schemas.append(schema)
         return tuple(schemas)
 
+    @synchronized(lock)
+    @volatile
+    def field_routes(self, fti):
+        """field routing table of the fti, used by createContent
+
+        returns a tuple ``(schemas, routes)``: the main schema and the form
+        field schemata of the behaviors, in the order iterSchemataForType
+        yields them, and a dict mapping every name declared by one of them,
+        including inherited ones, to the tuple of schemas declaring it.
+        """
+        if fti is None:
+            return (), {}
+        schemas = []
+        main_schema = self.get(fti)
+        if main_schema:
+            schemas.append(main_schema)
+        for schema_interface in self.behavior_schema_interfaces(fti):
+            form_schema = IFormFieldProvider(schema_interface, None)
+            if form_schema is not None and form_schema not in schemas:
+                schemas.append(form_schema)
+        routes = {}
+        for schema in schemas:
+            for name in schema.names(all=True):
+                routes[name] = routes.get(name, ()) + (schema, )
+        return tuple(schemas), routes
+
     @synchronized(lock)
     def clear(self):
         for fti in getAllUtilitiesRegisteredFor(IDexterityFTI):
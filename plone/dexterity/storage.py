@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""Mappings holding the children of a ``BTreeContainer``.
+
+The FTI property ``container_storage`` picks one of ``CONTAINER_STORAGES``
+for the containers of a type:
+
+- ``''``, the default: an ``OOBTree``,
+- ``'large'``: a ``LargeOOBTree``, whose buckets hold up to 500 keys
+  instead of 30. A container of 100000 children then has about 300
+  buckets instead of 5000, which means less records to load when listing
+  it and a smaller tree to keep in the cache. Writing a child rewrites a
+  larger bucket though, and concurrent adds are more likely to touch the
+  same bucket.
+- ``'integer'``: a ``NameIndexedData``, for containers whose children are
+  mostly named by numbers, like imported records. The children are kept in
+  an ``LOBTree`` keyed by the number, next to a name index.
+
+An empty container gets the storage of its type when its first child is
+added. Containers holding children are migrated by the ``Promoter``, see
+``plone.dexterity.promotion``.
+"""
+from BTrees.LOBTree import LOBTree
+from BTrees.OLBTree import OLBTree
+from BTrees.OOBTree import OOBTree
+from persistent import Persistent
+from plone.dexterity.interfaces import IDexterityFTI
+from zope.component import queryUtility
+
+import logging
+import random
+import re
+
+
+log = logging.getLogger(__name__)
+
+
+_marker = object()
+
+# Names stored under their own number in a NameIndexedData, i.e. numbers
+# without leading zeros that fit into 64 bits
+_NUMERIC = re.compile(r'(0|[1-9][0-9]{0,17})\Z')
+
+
+class LargeOOBTree(OOBTree):
+    """OOBTree with larger buckets and internal nodes"""
+
+    max_leaf_size = 500
+    max_internal_size = 1000
+
+
+class _MappedSequence(object):
+    """Lazy sequence of ``func(item)`` for the items of ``seq``"""
+
+    def __init__(self, seq, func):
+        self._seq = seq
+        self._func = func
+
+    def __len__(self):
+        return len(self._seq)
+
+    def __iter__(self):
+        return map(self._func, self._seq)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._func(item) for item in self._seq[index]]
+        return self._func(self._seq[index])
+
+
+class NameIndexedData(Persistent):
+    """Mapping of names to children, keeping the children in an ``LOBTree``.
+
+    ``_index`` maps each name to a 64 bit integer id, ``_data`` maps the ids
+    to the children. A name like ``'1234'`` gets the id 1234, other names
+    get a random negative one. Keys are sorted by name, like in an OOBTree,
+    and ``keys()``, ``items()`` and ``values()`` take the same range
+    arguments.
+    """
+
+    def __init__(self, items=None):
+        self._index = OLBTree()
+        self._data = LOBTree()
+        if items:
+            self.update(items)
+
+    def _new_id(self, key):
+        if isinstance(key, str) and _NUMERIC.match(key):
+            id = int(key)
+            if id not in self._data:
+                return id
+        while True:
+            # random ids keep concurrent adds from writing the same bucket
+            id = -random.randrange(1, 2 ** 62)
+            if id not in self._data:
+                return id
+
+    def __len__(self):
+        return len(self._index)
+
+    def __bool__(self):
+        return bool(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    has_key = __contains__
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __getitem__(self, key):
+        return self._data[self._index[key]]
+
+    def get(self, key, default=None):
+        id = self._index.get(key)
+        if id is None:
+            return default
+        return self._data[id]
+
+    def __setitem__(self, key, value):
+        id = self._index.get(key)
+        if id is None:
+            id = self._index[key] = self._new_id(key)
+        self._data[id] = value
+
+    def __delitem__(self, key):
+        del self._data[self._index.pop(key)]
+
+    def pop(self, key, default=_marker):
+        id = self._index.pop(key, None)
+        if id is None:
+            if default is _marker:
+                raise KeyError(key)
+            return default
+        return self._data.pop(id)
+
+    def update(self, items):
+        if hasattr(items, 'items'):
+            items = items.items()
+        for key, value in items:
+            self[key] = value
+
+    def keys(self, *args, **kwargs):
+        return self._index.keys(*args, **kwargs)
+
+    def items(self, *args, **kwargs):
+        data = self._data
+        return _MappedSequence(
+            self._index.items(*args, **kwargs),
+            lambda item: (item[0], data[item[1]]))
+
+    def values(self, *args, **kwargs):
+        return _MappedSequence(
+            self._index.values(*args, **kwargs), self._data.__getitem__)
+
+    def iterkeys(self, *args, **kwargs):
+        return iter(self.keys(*args, **kwargs))
+
+    def iteritems(self, *args, **kwargs):
+        return iter(self.items(*args, **kwargs))
+
+    def itervalues(self, *args, **kwargs):
+        return iter(self.values(*args, **kwargs))
+
+    def minKey(self, *args):
+        return self._index.minKey(*args)
+
+    def maxKey(self, *args):
+        return self._index.maxKey(*args)
+
+
+CONTAINER_STORAGES = {
+    '': OOBTree,
+    'large': LargeOOBTree,
+    'integer': NameIndexedData,
+}
+
+
+# ``(portal_type, container_storage)`` of FTIs naming an unknown storage,
+# logged once
+_unknown_storages = set()
+
+
+def get_storage(portal_type):
+    """Return the mapping class the FTI of ``portal_type`` chooses for the
+    children of its containers, or None for the container's default. An
+    unknown ``container_storage`` is logged and the default is used.
+    """
+    fti = None
+    if portal_type:
+        fti = queryUtility(IDexterityFTI, name=portal_type)
+    name = getattr(fti, 'container_storage', None)
+    if not name:
+        return None
+    factory = CONTAINER_STORAGES.get(name)
+    if factory is None and (portal_type, name) not in _unknown_storages:
+        _unknown_storages.add((portal_type, name))
+        log.warning(
+            'Unknown container_storage %r of type %s, using the default '
+            'storage. Use one of %s.', name, portal_type,
+            ', '.join(repr(key) for key in sorted(CONTAINER_STORAGES)))
+    return factory
@@ -0,0 +1,558 @@
+# -*- coding: utf-8 -*-
+"""Micro benchmarks for plone.dexterity.
+
+These are not collected by the test runner. Run them with::
+
+    python -m plone.dexterity.tests.benchmarks [name ...]
+"""
+from plone.dexterity.content import Container
+from plone.dexterity.content import Item
+
+import sys
+import time
+import timeit
+
+
+BENCHMARKS = {}
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def report(name, seconds, number):
+    print('{0:<40s} {1:10.3f} ms'.format(name, seconds * 1000.0 / number))
+
+
+def make_container(size, klass=Container):
+    container = klass()
+    for i in range(size):
+        key = 'item-{0:d}'.format(i)
+        container[key] = Item(key)
+    return container
+
+
+@benchmark
+def container_iteration(size=10000, number=20):
+    """Iterate keys, values and items of a Container with 10k children"""
+    container = make_container(size)
+    last = 'item-{0:d}'.format(size - 1)
+    report('keys()', timeit.timeit(
+        lambda: list(container.keys()), number=number), number)
+    report('iter()', timeit.timeit(
+        lambda: [k for k in container], number=number), number)
+    report('in keys()', timeit.timeit(
+        lambda: last in container.keys(), number=number), number)
+    report('values()', timeit.timeit(
+        lambda: [v for v in container.values()], number=number), number)
+    report('items()', timeit.timeit(
+        lambda: [i for i in container.items()], number=number), number)
+
+
+def last_transaction_size(storage):
+    """Return the number of bytes written by the last transaction"""
+    for txn in storage.iterator(storage.lastTransaction()):
+        return sum(len(record.data or b'') for record in txn)
+
+
+@benchmark
+def container_write_size(size=20000):
+    """Bytes written to add, remove and move a child of a 20k Container"""
+    import transaction
+    import ZODB
+
+    db = ZODB.DB(None)
+    conn = db.open()
+    conn.root()['container'] = container = make_container(size)
+    transaction.commit()
+
+    container['new'] = Item('new')
+    transaction.commit()
+    print('{0:<40s} {1:10d} bytes'.format(
+        'add', last_transaction_size(db.storage)))
+    del container['item-{0:d}'.format(size // 2)]
+    transaction.commit()
+    print('{0:<40s} {1:10d} bytes'.format(
+        'delete', last_transaction_size(db.storage)))
+    container.moveObjectsByDelta(['item-{0:d}'.format(size // 4)], -1)
+    transaction.commit()
+    print('{0:<40s} {1:10d} bytes'.format(
+        'move by one', last_transaction_size(db.storage)))
+    conn.close()
+    db.close()
+
+
+@benchmark
+def container_bulk_add(size=5000):
+    """Add 5k children one by one and with add_many()"""
+    from plone.dexterity.content import BTreeContainer
+
+    def items():
+        keys = ['item-{0:d}'.format(i) for i in range(size)]
+        return [(key, Item(key)) for key in keys]
+
+    for klass in (Container, BTreeContainer):
+        container = klass()
+        data = items()
+        report('{0:s} __setitem__'.format(klass.__name__), timeit.timeit(
+            lambda: [container.__setitem__(k, v) for (k, v) in data],
+            number=1), 1)
+        container = klass()
+        data = items()
+        report('{0:s} add_many'.format(klass.__name__), timeit.timeit(
+            lambda: container.add_many(data), number=1), 1)
+
+
+@benchmark
+def deferred_events(size=2000):
+    """Add 2k children with a slow handler, with and without deferral"""
+    from plone.dexterity.events import deferred_events
+    from zope.component import provideHandler
+    from zope.container.interfaces import IContainerModifiedEvent
+
+    import zope.component.testing
+
+    def reindex(event):
+        # stands for a handler reindexing the container
+        time.sleep(0.0001)
+
+    zope.component.testing.setUp()
+    try:
+        provideHandler(reindex, [IContainerModifiedEvent])
+
+        def add(container):
+            for i in range(size):
+                key = 'item-{0:d}'.format(i)
+                container[key] = Item(key)
+
+        def add_deferred(container):
+            with deferred_events():
+                add(container)
+
+        for func in (add, add_deferred):
+            container = Container()
+            report(func.__name__, timeit.timeit(
+                lambda: func(container), number=1), 1)
+    finally:
+        zope.component.testing.tearDown()
+
+
+@benchmark
+def name_chooser(size=5000, number=100):
+    """Choose a name in a Container with 5k "untitled-N" children"""
+    from plone.dexterity.namechooser import DexterityNameChooser
+    from zope.container.contained import NameChooser
+
+    container = Container()
+    keys = ['untitled'] + ['untitled-{0:d}'.format(i)
+                           for i in range(2, size + 1)]
+    container.add_many([(key, Item(key)) for key in keys])
+    item = Item('untitled')
+    for klass in (NameChooser, DexterityNameChooser):
+        chooser = klass(container)
+        report(klass.__name__, timeit.timeit(
+            lambda: chooser.chooseName('untitled', item), number=number),
+            number)
+
+
+@benchmark
+def container_storage(size=50000, lookups=10000):
+    """Pickle size, memory and lookup time of the container storages for
+    50k numerically named children
+    """
+    from persistent.list import PersistentList
+    from plone.dexterity.storage import CONTAINER_STORAGES
+
+    import random
+    import tracemalloc
+    import transaction
+    import ZODB
+
+    keys = [str(i) for i in range(size)]
+    sample = random.Random(0).sample(keys, lookups)
+    for name, factory in sorted(CONTAINER_STORAGES.items()):
+        db = ZODB.DB(None)
+        conn = db.open()
+        root = conn.root()
+        root['items'] = PersistentList(Item(key) for key in keys)
+        transaction.commit()
+        data = factory()
+        for item in root['items']:
+            data[item.id] = item
+        root['data'] = data
+        transaction.commit()
+        written = last_transaction_size(db.storage)
+
+        # a second connection, with an empty cache
+        conn2 = db.open(transaction.TransactionManager())
+        tracemalloc.start()
+        data = conn2.root()['data']
+        start = timeit.default_timer()
+        for key in sample:
+            data[key]
+        cold = timeit.default_timer() - start
+        for key in keys:
+            data[key]
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        loads = conn2.getTransferCounts()[0]
+        warm = timeit.timeit(
+            lambda: [data[key] for key in sample], number=10) / 10
+        print('{0:<8s} {1:8d} bytes {2:5d} records {3:9d} bytes in memory '
+              '{4:7.2f} us cold {5:5.2f} us warm'.format(
+                  name or 'default', written, loads, memory,
+                  cold * 1e6 / lookups, warm * 1e6 / lookups))
+        conn2.close()
+        conn.close()
+        db.close()
+
+
+def register_type_with_behaviors(portal_type, behaviors, fields):
+    """Register a type with ``behaviors`` behaviors of ``fields`` fields
+    each, stored on the content by their adapters. Returns the field names.
+    """
+    from plone.behavior.interfaces import IBehavior
+    from plone.behavior.registration import BehaviorRegistration
+    from plone.dexterity.factory import DexterityFactory
+    from plone.dexterity.fti import DexterityFTI
+    from plone.dexterity.interfaces import IDexterityContent
+    from plone.dexterity.interfaces import IDexterityFTI
+    from plone.dexterity.interfaces import IFormFieldProvider
+    from zope.component import provideAdapter
+    from zope.component import provideUtility
+    from zope.component.interfaces import IFactory
+    from zope.interface import alsoProvides
+    from zope.interface.interface import InterfaceClass
+
+    import zope.schema
+
+    class Adapter(object):
+
+        fields = frozenset()
+
+        def __init__(self, context):
+            self.__dict__['context'] = context
+
+        def __getattr__(self, name):
+            if name not in self.fields:
+                raise AttributeError(name)
+            return getattr(self.context, name)
+
+        def __setattr__(self, name, value):
+            setattr(self.context, name, value)
+
+    names = []
+    behavior_names = []
+    for i in range(behaviors):
+        attrs = {}
+        for j in range(fields):
+            name = 'field_{0:d}_{1:d}'.format(i, j)
+            attrs[name] = zope.schema.TextLine()
+            names.append(name)
+        schema = InterfaceClass(
+            'IBehavior{0:d}'.format(i), attrs=attrs,
+            __module__='plone.dexterity.tests.benchmarks')
+        alsoProvides(schema, IFormFieldProvider)
+        factory = type('Adapter', (Adapter, ), {'fields': frozenset(attrs)})
+        provideAdapter(factory, (IDexterityContent, ), schema)
+        behavior_name = 'benchmark.behavior{0:d}'.format(i)
+        provideUtility(
+            BehaviorRegistration(behavior_name, '', schema, None, factory),
+            IBehavior, behavior_name)
+        behavior_names.append(behavior_name)
+    fti = DexterityFTI(
+        portal_type, klass='plone.dexterity.content.Item',
+        schema='plone.dexterity.tests.schemata.ITestSchema',
+        behaviors=behavior_names)
+    provideUtility(fti, IDexterityFTI, portal_type)
+    provideUtility(DexterityFactory(portal_type), IFactory, portal_type)
+    return names
+
+
+def create_content_scanning(portal_type, **kw):
+    """createContent before the field routing table: every schema is
+    adapted and probed for every value.
+    """
+    from plone.dexterity.interfaces import IDexterityFTI
+    from plone.dexterity.utils import iterSchemataForType
+    from zope.component import createObject
+    from zope.component import getUtility
+    from zope.event import notify
+    from zope.lifecycleevent import ObjectCreatedEvent
+
+    fti = getUtility(IDexterityFTI, name=portal_type)
+    content = createObject(fti.factory, **kw)
+    content.portal_type = fti.getId()
+    fields = dict(kw)
+    for schema in iterSchemataForType(portal_type):
+        behavior = schema(content)
+        for name, value in kw.items():
+            try:
+                getattr(behavior, name)
+            except AttributeError:
+                continue
+            setattr(behavior, name, value)
+            if name in fields:
+                del fields[name]
+    for (key, value) in fields.items():
+        setattr(content, key, value)
+    notify(ObjectCreatedEvent(content))
+    return content
+
+
+@benchmark
+def create_content(behaviors=12, number=2000):
+    """createContent for a type with 12 behaviors, setting 12 fields"""
+    from plone.dexterity.utils import createContent
+
+    import zope.component.testing
+
+    zope.component.testing.setUp()
+    try:
+        names = register_type_with_behaviors('benchmark', behaviors, 3)
+        kw = dict((name, u'value') for name in names[::3])
+        kw['title'] = u'Title'
+        for func in (create_content_scanning, createContent):
+            func('benchmark', **kw)
+            report(func.__name__, timeit.timeit(
+                lambda: func('benchmark', **kw), number=number), number)
+    finally:
+        zope.component.testing.tearDown()
+
+
+@benchmark
+def factory(number=20000):
+    """Call a DexterityFactory and its getInterfaces()"""
+    from plone.dexterity.interfaces import IDexterityFactory
+    from zope.component import getUtility
+    from zope.component.interfaces import IFactory
+
+    import zope.component.testing
+
+    zope.component.testing.setUp()
+    try:
+        register_type_with_behaviors('benchmark', 0, 0)
+        factory = getUtility(IFactory, name='benchmark')
+        assert IDexterityFactory.providedBy(factory)
+        report('__call__', timeit.timeit(
+            lambda: factory('id'), number=number), number)
+        report('getInterfaces', timeit.timeit(
+            factory.getInterfaces, number=number), number)
+    finally:
+        zope.component.testing.tearDown()
+
+
+@benchmark
+def create_many(size=1000, behaviors=12):
+    """Create 1000 objects of a type with 12 behaviors in a Container"""
+    from plone.dexterity.utils import create_many
+    from plone.dexterity.utils import createContentInContainer
+
+    import zope.component.testing
+
+    zope.component.testing.setUp()
+    try:
+        names = register_type_with_behaviors('benchmark', behaviors, 3)
+
+        def rows():
+            return [dict([('id', 'item-{0:d}'.format(i)),
+                          ('title', u'Title')] +
+                         [(name, u'value') for name in names[::3]])
+                    for i in range(size)]
+
+        container = Container()
+        data = rows()
+        report('createContentInContainer', timeit.timeit(
+            lambda: [createContentInContainer(
+                container, 'benchmark', checkConstraints=False, **row)
+                for row in data], number=1), size)
+        container = Container()
+        data = rows()
+        report('create_many', timeit.timeit(
+            lambda: create_many(
+                container, 'benchmark', data, checkConstraints=False),
+            number=1), size)
+    finally:
+        zope.component.testing.tearDown()
+
+
+@benchmark
+def json_import(size=20000):
+    """Import 20k JSON lines into a BTreeContainer in a FileStorage"""
+    from io import BytesIO
+    from plone.dexterity.content import BTreeContainer
+    from plone.dexterity.deserialize.importer import JSONLinesImporter
+    from plone.jsonserializer.interfaces import IDeserializeFromJson
+    from zope.component import provideAdapter
+    from zope.interface import Interface
+
+    import json
+    import os
+    import shutil
+    import tempfile
+    import transaction
+    import zope.component.testing
+    import ZODB
+    import ZODB.FileStorage
+
+    class Deserializer(object):
+
+        def __init__(self, context, request):
+            self.context = context
+
+        def __call__(self, data):
+            self.context.title = data['title']
+            return self.context
+
+    zope.component.testing.setUp()
+    tempdir = tempfile.mkdtemp()
+    try:
+        register_type_with_behaviors('benchmark', 0, 0)
+        provideAdapter(Deserializer, (Interface, Interface),
+                       IDeserializeFromJson)
+        data = BytesIO(b''.join(
+            json.dumps({'id': 'item-{0:d}'.format(i), '@type': 'benchmark',
+                        'title': 'Item {0:d}'.format(i)}).encode('utf8') +
+            b'\n' for i in range(size)))
+        db = ZODB.DB(ZODB.FileStorage.FileStorage(
+            os.path.join(tempdir, 'Data.fs')), cache_size=2000)
+        conn = db.open()
+        conn.root()['folder'] = folder = BTreeContainer()
+        transaction.commit()
+        stats = JSONLinesImporter(
+            folder, checkConstraints=False).run(data)
+        print('{0:<40s} {1:10.1f} objects/s'.format('import', stats.rate))
+        print('{0:<40s} {1:10d} kB'.format(
+            'peak memory', stats.as_dict()['peak_memory'] or 0))
+        print('{0:<40s} {1:10d}'.format(
+            'objects in the cache', db.cacheSize()))
+        conn.close()
+        db.close()
+    finally:
+        shutil.rmtree(tempdir)
+        zope.component.testing.tearDown()
+
+
+@benchmark
+def parallel_import(size=20000, behaviors=2, fields=10):
+    """Import 20k JSON lines of 20 fields with and without workers"""
+    from io import BytesIO
+    from plone.dexterity.content import BTreeContainer
+    from plone.dexterity.deserialize.importer import ParallelJSONLinesImporter
+
+    import json
+    import os
+    import transaction
+    import zope.component.testing
+    import ZODB
+
+    zope.component.testing.setUp()
+    try:
+        names = register_type_with_behaviors('benchmark', behaviors, fields)
+        data = b''.join(
+            json.dumps(dict(
+                [(name, u'Value {0:d}\x00'.format(i)) for name in names],
+                id='item-{0:d}'.format(i), title=u'Item {0:d}'.format(i),
+                **{'@type': 'benchmark'})).encode('utf8') + b'\n'
+            for i in range(size))
+        for workers in sorted(set([0, 2, os.cpu_count()])):
+            db = ZODB.DB(None)
+            conn = db.open()
+            conn.root()['folder'] = folder = BTreeContainer()
+            transaction.commit()
+            stats = ParallelJSONLinesImporter(
+                folder, 'benchmark', workers=workers,
+                checkConstraints=False).run(BytesIO(data))
+            print('{0:<40s} {1:10.1f} objects/s'.format(
+                'workers={0:d}'.format(workers), stats.rate))
+            conn.close()
+            db.close()
+        print('{0:<40s} {1:10d}'.format('cpus', os.cpu_count()))
+    finally:
+        zope.component.testing.tearDown()
+
+
+class UnresolvedContainer(Container):
+    """A Container without conflict resolution"""
+
+    _p_resolveConflict = None
+
+
+@benchmark
+def container_concurrent_add(threads=4, adds=50):
+    """Add children to one Container from 4 threads, FileStorage"""
+    from datetime import datetime
+    from plone.dexterity.ordering import ContainerOrder
+    from ZODB.FileStorage import FileStorage
+    from ZODB.POSException import ConflictError
+
+    import os
+    import shutil
+    import tempfile
+    import threading
+    import time
+    import transaction
+    import ZODB
+
+    def run(klass):
+        tempdir = tempfile.mkdtemp()
+        db = ZODB.DB(FileStorage(os.path.join(tempdir, 'Data.fs')))
+        conn = db.open()
+        conn.root()['folder'] = folder = klass('folder')
+        folder['first'] = Item('first')
+        transaction.commit()
+        conn.close()
+        conflicts = []
+
+        def add(thread):
+            manager = transaction.TransactionManager()
+            conn = db.open(transaction_manager=manager)
+            for i in range(adds):
+                key = '{0:d}-{1:d}'.format(thread, i)
+                while True:
+                    folder = conn.root()['folder']
+                    folder[key] = Item(key)
+                    # like the modified event handlers of Plone do
+                    folder.modification_date = datetime.now()
+                    try:
+                        manager.commit()
+                        break
+                    except ConflictError:
+                        manager.abort()
+                        conflicts.append(key)
+            conn.close()
+
+        workers = [threading.Thread(target=add, args=(i, ))
+                   for i in range(threads)]
+        start = time.time()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        seconds = time.time() - start
+        db.close()
+        shutil.rmtree(tempdir)
+        return seconds, len(conflicts)
+
+    for resolve in (False, True):
+        ContainerOrder.random_positions = resolve
+        try:
+            seconds, conflicts = run(
+                Container if resolve else UnresolvedContainer)
+        finally:
+            ContainerOrder.random_positions = True
+        print('{0:<40s} {1:10.1f} adds/s {2:6d} conflicts'.format(
+            'with resolution' if resolve else 'without resolution',
+            threads * adds / seconds, conflicts))
+
+
+def main(argv=None):
+    names = (argv if argv is not None else sys.argv[1:]) or sorted(BENCHMARKS)
+    for name in names:
+        print('{0:s}: {1:s}'.format(name, BENCHMARKS[name].__doc__))
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main()
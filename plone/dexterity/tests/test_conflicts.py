@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from datetime import timedelta
+from plone.dexterity.content import BTreeContainer
+from plone.dexterity.content import Container
+from plone.dexterity.content import Item
+from ZODB.FileStorage import FileStorage
+from ZODB.POSException import ConflictError
+
+import os
+import shutil
+import tempfile
+import threading
+import transaction
+import unittest
+import ZODB
+
+
+class TestContainerConflicts(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.db = ZODB.DB(
+            FileStorage(os.path.join(self.tempdir, 'Data.fs')))
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tempdir)
+
+    def _open(self):
+        manager = transaction.TransactionManager()
+        return manager, self.db.open(transaction_manager=manager)
+
+    def _add_concurrently(self, klass, change=None):
+        manager, conn = self._open()
+        # BTrees cannot resolve conflicts while they are still empty
+        conn.root()['folder'] = folder = klass('folder')
+        folder['first'] = Item('first')
+        manager.commit()
+        conn.close()
+
+        now = datetime(2016, 1, 1)
+        managers = []
+        for i, key in enumerate(['a', 'b']):
+            manager, conn = self._open()
+            folder = conn.root()['folder']
+            folder[key] = Item(key)
+            folder.modification_date = now + timedelta(days=i)
+            if change is not None:
+                change(folder, key)
+            managers.append((manager, conn))
+        try:
+            for manager, conn in managers:
+                manager.commit()
+        finally:
+            for manager, conn in managers:
+                manager.abort()
+                conn.close()
+
+    def test_concurrent_adds_are_resolved(self):
+        for klass in (Container, BTreeContainer):
+            self._add_concurrently(klass)
+            manager, conn = self._open()
+            folder = conn.root()['folder']
+            self.assertEqual(sorted(folder.keys()), ['a', 'b', 'first'])
+            self.assertEqual(len(folder), 3)
+            self.assertEqual(folder.modification_date, datetime(2016, 1, 2))
+            conn.close()
+
+    def test_conflicting_changes_are_not_resolved(self):
+        def set_title(folder, key):
+            folder.title = key
+        self.assertRaises(
+            ConflictError, self._add_concurrently, Container, set_title)
+
+    def test_threads(self):
+        manager, conn = self._open()
+        conn.root()['folder'] = Container('folder')
+        manager.commit()
+        conn.close()
+        conflicts = []
+
+        def add(thread):
+            manager, conn = self._open()
+            for i in range(10):
+                key = '{0:d}-{1:d}'.format(thread, i)
+                while True:
+                    folder = conn.root()['folder']
+                    folder[key] = Item(key)
+                    folder.modification_date = datetime.now()
+                    try:
+                        manager.commit()
+                        break
+                    except ConflictError:
+                        manager.abort()
+                        conflicts.append(key)
+            conn.close()
+
+        threads = [threading.Thread(target=add, args=(i, ))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        manager, conn = self._open()
+        folder = conn.root()['folder']
+        self.assertEqual(len(folder), 40)
+        self.assertEqual(len(list(folder.keys())), 40)
+        conn.close()
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
@@ -22,6 +22,7 @@ from zope.interface import alsoProvides
 from zope.interface import Interface
 from zope.traversing.browser.interfaces import IAbsoluteURL
 
+import json
 import unittest
 import zope.schema
 
@@ -960,6 +961,686 @@ class TestContent(MockTestCase):
         self.assertEqual(bar.listfield, [1, 2])
         self.assertEqual(baz.listfield, [1, 2])
 
+    def test_field_default_flat_copy(self):
+        # Flat mutable defaults are returned as shallow copies of the
+        # field's default, nested ones as deep copies.
+
+        class FauxDataManager(object):
+            def setstate(self, obj):
+                pass
+
+            def oldstate(self, obj, tid):
+                pass
+
+            def register(self, obj):
+                pass
+
+        foo = Item(id='foo')
+        foo.portal_type = 'testtype'
+        foo._p_jar = FauxDataManager()
+
+        # Dummy schema
+        class ISchema(Interface):
+            listfield = zope.schema.List(title='listfield', default=[1, 2])
+            dictfield = zope.schema.Dict(
+                title='dictfield', default={'a': [1]})
+
+        # FTI mock
+        fti_mock = self.mocker.proxy(DexterityFTI('testtype'))
+        self.expect(fti_mock.lookupSchema()).result(ISchema).count(1)
+        self.mock_utility(fti_mock, IDexterityFTI, name='testtype')
+
+        self.replay()
+
+        value = foo.listfield
+        self.assertTrue(type(value) is list)
+        self.assertEqual(json.dumps(value), '[1, 2]')
+        self.assertFalse(value is ISchema['listfield'].default)
+        self.assertFalse('listfield' in foo.__dict__)
+        value.append(3)
+        self.assertEqual(ISchema['listfield'].default, [1, 2])
+        self.assertEqual(foo.listfield, [1, 2])
+
+        foo.dictfield['a'].append(2)
+        self.assertEqual(ISchema['dictfield'].default, {'a': [1]})
+
+    def test_container_views(self):
+        c = Container()
+        c['foo'] = Item('foo')
+        c['bar'] = Item('bar')
+
+        keys = c.keys()
+        self.assertEqual(keys, ['foo', 'bar'])
+        self.assertEqual(len(keys), 2)
+        self.assertEqual(keys[-1], 'bar')
+        self.assertTrue('foo' in keys)
+        self.assertEqual(list(c), ['foo', 'bar'])
+        self.assertEqual([v.id for v in c.values()], ['foo', 'bar'])
+        self.assertEqual(c.items()[0], ('foo', c['foo']))
+
+        # views are live
+        c['baz'] = Item('baz')
+        self.assertEqual(keys, ['foo', 'bar', 'baz'])
+
+        from plone.dexterity.content import ContainerView
+        self.assertRaises(TypeError, ContainerView, c)
+
+    def test_container_views_detect_changes(self):
+        c = Container()
+        c['foo'] = Item('foo')
+        c['bar'] = Item('bar')
+
+        def delete_all():
+            for key in c.keys():
+                del c[key]
+        self.assertRaises(RuntimeError, delete_all)
+
+        # take a copy to change the container while iterating
+        for key in list(c.keys()):
+            del c[key]
+        self.assertEqual(len(c), 0)
+
+    def test_container_views_survive_ghosting(self):
+        import transaction
+        import ZODB
+
+        db = ZODB.DB(None)
+        conn = db.open()
+        c = conn.root()['c'] = Container()
+        c.add_many([(id, Item(id)) for id in ('a', 'b', 'c', 'd')])
+        transaction.commit()
+        keys = []
+        for key, child in c.items():
+            keys.append(key)
+            # like the cache GC after a savepoint
+            transaction.savepoint(optimistic=True)
+            c._order._p_deactivate()
+        self.assertEqual(keys, ['a', 'b', 'c', 'd'])
+
+        def change_while_ghosted():
+            for key in c.keys():
+                c._order._p_deactivate()
+                c['x' + key] = Item('x' + key)
+        self.assertRaises(RuntimeError, change_while_ghosted)
+        transaction.abort()
+        conn.close()
+        db.close()
+
+    def test_container_migrate_storage(self):
+        from persistent.dict import PersistentDict
+        from persistent.list import PersistentList
+        from plone.dexterity.content import migrate_container_storage
+
+        c = Container()
+        c._data = PersistentDict({'foo': Item('foo'), 'bar': Item('bar')})
+        c._order = PersistentList(['foo', 'bar'])
+
+        # old storage can still be read
+        self.assertEqual(list(c.keys()), ['foo', 'bar'])
+        self.assertEqual(len(c), 2)
+
+        # and changed, changes do not migrate it
+        c['baz'] = Item('baz')
+        c['qux'] = Item('qux')
+        del c['foo']
+        c.moveObjectsToTop(['qux'])
+        c.updateOrder(['bar', 'qux', 'baz'])
+        c.moveObjectsByDelta(['baz'], -1, ['bar', 'baz'])
+        self.assertTrue(isinstance(c._order, PersistentList))
+        self.assertEqual(list(c.keys()), ['baz', 'qux', 'bar'])
+        c.delete_many(['qux'])
+        self.assertEqual(list(c._order), ['baz', 'bar'])
+        self.assertEqual(sorted(c._data), ['bar', 'baz'])
+
+        # the storage is migrated explicitly, usually by the Promoter
+        self.assertTrue(migrate_container_storage(c))
+        self.assertFalse(isinstance(c._order, PersistentList))
+        self.assertEqual(list(c.keys()), ['baz', 'bar'])
+        self.assertEqual(c['bar'].id, 'bar')
+        self.assertFalse(migrate_container_storage(c))
+
+    def _ordered_container(self, *ids):
+        c = Container()
+        for id in ids:
+            c[id] = Item(id)
+        return c
+
+    def test_container_moveObjectsByDelta(self):
+        c = self._ordered_container('a', 'b', 'c', 'd', 'e')
+        self.assertEqual(c.moveObjectsByDelta(['d'], -2), 1)
+        self.assertEqual(list(c.keys()), ['a', 'd', 'b', 'c', 'e'])
+        self.assertEqual(c.moveObjectsByDelta(['a', 'b'], 1), 2)
+        self.assertEqual(list(c.keys()), ['d', 'a', 'c', 'b', 'e'])
+        # moved objects keep their order at the top and bottom
+        self.assertEqual(c.moveObjectsByDelta(['c', 'b'], -10), 2)
+        self.assertEqual(list(c.keys()), ['c', 'b', 'd', 'a', 'e'])
+        self.assertEqual(c.moveObjectsByDelta('c', -1), 0)
+        self.assertRaises(ValueError, c.moveObjectsByDelta, ['x'], 1)
+
+    def test_container_moveObjectsByDelta_subset(self):
+        c = self._ordered_container('a', 'b', 'c', 'd', 'e')
+        self.assertEqual(c.moveObjectsByDelta(['d'], -1, ['b', 'd']), 1)
+        self.assertEqual(list(c.keys()), ['a', 'd', 'c', 'b', 'e'])
+
+    def test_container_moveObjectToPosition(self):
+        c = self._ordered_container('a', 'b', 'c', 'd')
+        c.moveObjectToPosition('a', 2)
+        self.assertEqual(list(c.keys()), ['b', 'c', 'a', 'd'])
+        self.assertEqual(c.getObjectPosition('a'), 2)
+        c.moveObjectToPosition('d', 0)
+        self.assertEqual(list(c.keys()), ['d', 'b', 'c', 'a'])
+        self.assertRaises(ValueError, c.getObjectPosition, 'x')
+
+    def test_container_moveObjectsToTop_and_Bottom(self):
+        c = self._ordered_container('a', 'b', 'c', 'd')
+        c.moveObjectsToTop(['c', 'd'])
+        self.assertEqual(list(c.keys()), ['c', 'd', 'a', 'b'])
+        c.moveObjectsToBottom(['c'])
+        self.assertEqual(list(c.keys()), ['d', 'a', 'b', 'c'])
+
+    def test_container_updateOrder(self):
+        c = self._ordered_container('a', 'b', 'c')
+        c.updateOrder(['c', 'a', 'b'])
+        self.assertEqual(list(c.keys()), ['c', 'a', 'b'])
+        self.assertRaises(ValueError, c.updateOrder, ['a', 'b'])
+        self.assertRaises(ValueError, c.updateOrder, ['a', 'b', 'x'])
+        self.assertRaises(TypeError, c.updateOrder, 'abc')
+        self.assertRaises(TypeError, c.updateOrder, 1)
+
+        # the keys view and other iterables are taken too
+        c.updateOrder(c.keys())
+        self.assertEqual(list(c.keys()), ['c', 'a', 'b'])
+        c.updateOrder(reversed(c.keys()))
+        self.assertEqual(list(c.keys()), ['b', 'a', 'c'])
+        self.assertEqual(c.keys().index('a'), 1)
+        self.assertRaises(ValueError, c.keys().index, 'x')
+        self.assertEqual(c.keys().count('a'), 1)
+        self.assertEqual(c.keys().count('x'), 0)
+        self.assertEqual(c.values().index(c['c']), 2)
+
+    def test_iteritems_prefetch_and_deactivate(self):
+        from plone.dexterity.content import BTreeContainer
+        import transaction
+        import ZODB
+
+        db = ZODB.DB(None)
+        conn = db.open()
+        root = conn.root()
+        for klass in (Container, BTreeContainer):
+            c = root[klass.__name__] = klass()
+            for i in range(25):
+                c['item-{0:02d}'.format(i)] = Item('item-{0:02d}'.format(i))
+        transaction.commit()
+
+        conn2 = db.open(transaction.TransactionManager())
+        for klass in (Container, BTreeContainer):
+            c = conn2.root()[klass.__name__]
+            prefetched = []
+            conn2.prefetch = lambda *oids: prefetched.extend(oids)
+
+            ids = [v.id for v in c.itervalues(batch_size=10, deactivate=True)]
+            self.assertEqual(
+                ids, ['item-{0:02d}'.format(i) for i in range(25)])
+            self.assertEqual(len(prefetched), 3)
+            for key, value in c.iteritems():
+                self.assertEqual(value._p_changed, None)
+                break
+        conn2.close()
+        conn.close()
+        db.close()
+
+    def test_async_iteration_and_get_many(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from plone.dexterity.content import BTreeContainer
+        import asyncio
+        import transaction
+        import ZODB
+
+        db = ZODB.DB(None)
+        conn = db.open()
+        root = conn.root()
+        for klass in (Container, BTreeContainer):
+            c = root[klass.__name__] = klass()
+            ids = ['item-{0:02d}'.format(i) for i in range(25)]
+            c.add_many([(id, Item(id)) for id in ids])
+        transaction.commit()
+
+        conn2 = db.open(transaction.TransactionManager())
+        executor = ThreadPoolExecutor(1)
+        calls = []
+        submit = executor.submit
+
+        def counting_submit(*args, **kwargs):
+            calls.append(args[0])
+            return submit(*args, **kwargs)
+        executor.submit = counting_submit
+        conn2.executor = executor
+
+        async def run(c):
+            items = [item async for item in c.aiter_items(batch_size=10)]
+            values = [value async for value in c.aiter_values()]
+            many = await c.aget_many(
+                ['item-03', 'missing', 'item-20'], batch_size=2)
+            return items, values, many
+
+        for klass in (Container, BTreeContainer):
+            c = conn2.root()[klass.__name__]
+            del calls[:]
+            items, values, many = asyncio.run(run(c))
+            self.assertEqual(
+                [key for key, value in items],
+                ['item-{0:02d}'.format(i) for i in range(25)])
+            self.assertEqual(items[0][1]._p_changed, False)
+            self.assertEqual(len(values), 25)
+            self.assertEqual(sorted(many), ['item-03', 'item-20'])
+            self.assertEqual(many['item-20'].id, 'item-20')
+            # 3 batches and the end, 1 batch and the end, 2 batches of keys
+            self.assertEqual(len(calls), 4 + 2 + 2)
+
+        executor.shutdown()
+        conn2.close()
+        conn.close()
+        db.close()
+
+    def test_asyncget_fast_path(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from plone.dexterity.content import ASYNCGET_STATS
+        from plone.dexterity.content import BTreeContainer
+        from plone.dexterity.content import synccontext
+        import asyncio
+        import time
+        import transaction
+        import ZODB
+
+        db = ZODB.DB(None)
+        conn = db.open()
+        root = conn.root()
+        for klass in (Container, BTreeContainer):
+            c = root[klass.__name__] = klass()
+            ids = ['item-{0:04d}'.format(i) for i in range(1000)]
+            c.add_many([(id, Item(id)) for id in ids])
+        transaction.commit()
+
+        conn2 = db.open(transaction.TransactionManager())
+        conn2.executor = ThreadPoolExecutor(1)
+
+        async def get(c, key):
+            return await c.asyncget(key)
+
+        for klass in (Container, BTreeContainer):
+            c = conn2.root()[klass.__name__]
+            ASYNCGET_STATS.update(fast_path=0, executor=0)
+            # loading the child takes the executor, the next get does not
+            for i in range(2):
+                child = asyncio.run(get(c, 'item-0500'))
+                self.assertEqual(child.id, 'item-0500')
+            self.assertEqual(ASYNCGET_STATS, {'fast_path': 1, 'executor': 1})
+            self.assertRaises(KeyError, asyncio.run, get(c, 'item-0500x'))
+
+            # while the executor is busy, the child is read through it
+            async def get_while_busy(c, key):
+                busy = synccontext(c)(time.sleep, 0.01)
+                child = await c.asyncget(key)
+                await busy
+                return child
+
+            ASYNCGET_STATS.update(fast_path=0, executor=0)
+            child = asyncio.run(get_while_busy(c, 'item-0500'))
+            self.assertEqual(child.id, 'item-0500')
+            self.assertEqual(ASYNCGET_STATS, {'fast_path': 0, 'executor': 1})
+
+        conn2.executor.shutdown()
+        conn2.close()
+        conn.close()
+        db.close()
+
+    def test_add_many(self):
+        from plone.dexterity.content import BTreeContainer
+        from plone.dexterity.content import OrderedBTreeContainer
+        from zope.container.interfaces import IContainerModifiedEvent
+        from zope.lifecycleevent.interfaces import IObjectAddedEvent
+        import zope.event
+
+        events = []
+        zope.event.subscribers.append(events.append)
+        try:
+            for klass in (Container, OrderedBTreeContainer, BTreeContainer):
+                del events[:]
+                c = klass()
+                c['a'] = Item('a')
+                self.assertEqual(
+                    c.add_many([('c', Item('c')), ('b', Item('b'))]),
+                    ['c', 'b'])
+                self.assertEqual(len(c), 3)
+                self.assertEqual(c['b'].__parent__, c)
+                self.assertEqual(c['c'].__name__, 'c')
+                self.assertEqual(
+                    len([e for e in events
+                         if IObjectAddedEvent.providedBy(e)]), 3)
+                self.assertEqual(
+                    len([e for e in events
+                         if IContainerModifiedEvent.providedBy(e)]), 2)
+
+                # nothing is added if a key is taken
+                self.assertRaises(
+                    KeyError, c.add_many, [('d', Item('d')), ('a', Item())])
+                self.assertRaises(
+                    KeyError, c.add_many, [('d', Item('d')), ('d', Item())])
+                self.assertRaises(ValueError, c.add_many, {'': Item()})
+                self.assertFalse('d' in c)
+                self.assertEqual(len(c), 3)
+            self.assertEqual(list(c.keys()), ['a', 'b', 'c'])
+            self.assertEqual(list(Container().keys()), [])
+        finally:
+            zope.event.subscribers.remove(events.append)
+
+    def test_delete_many(self):
+        from plone.dexterity.content import BTreeContainer
+        from plone.dexterity.content import OrderedBTreeContainer
+        from zope.container.interfaces import IContainerModifiedEvent
+        from zope.lifecycleevent.interfaces import IObjectRemovedEvent
+        import zope.event
+
+        events = []
+        for klass in (Container, BTreeContainer, OrderedBTreeContainer):
+            c = klass()
+            c.add_many([(id, Item(id)) for id in ('a', 'b', 'c', 'd')])
+            b = c['b']
+
+            # nothing is deleted if a key is missing
+            self.assertRaises(KeyError, c.delete_many, ['b', 'x'])
+            self.assertEqual(len(c), 4)
+
+            zope.event.subscribers.append(events.append)
+            try:
+                c.delete_many(['d', 'b'])
+            finally:
+                zope.event.subscribers.remove(events.append)
+            self.assertEqual(list(c.keys()), ['a', 'c'])
+            self.assertEqual(len(c), 2)
+            self.assertEqual(b.__parent__, None)
+            self.assertEqual(
+                len([e for e in events
+                     if IObjectRemovedEvent.providedBy(e)]), 2)
+            self.assertEqual(
+                len([e for e in events
+                     if IContainerModifiedEvent.providedBy(e)]), 1)
+            del events[:]
+
+    def test_deferred_events(self):
+        from plone.dexterity.content import BTreeContainer
+        from plone.dexterity.events import deferred_events
+        from zope.container.interfaces import IContainerModifiedEvent
+        from zope.lifecycleevent.interfaces import IObjectAddedEvent
+        from zope.lifecycleevent.interfaces import IObjectRemovedEvent
+        import zope.event
+
+        events = []
+        zope.event.subscribers.append(events.append)
+        try:
+            for klass in (Container, BTreeContainer):
+                del events[:]
+                c = klass()
+                other = Container()
+                with deferred_events():
+                    c['a'] = Item('a')
+                    c['b'] = Item('b')
+                    other['a'] = Item('a')
+                    with deferred_events():
+                        del c['a']
+                    if klass is Container:
+                        c.updateOrder(['b'])
+                    self.assertEqual(events, [])
+                self.assertEqual(
+                    [(e.__class__.__name__, e.newName or e.oldName)
+                     for e in events
+                     if not IContainerModifiedEvent.providedBy(e)],
+                    [('ObjectAddedEvent', 'a'), ('ObjectAddedEvent', 'b'),
+                     ('ObjectAddedEvent', 'a'), ('ObjectRemovedEvent', 'a')])
+                modified = [e.object for e in events
+                            if IContainerModifiedEvent.providedBy(e)]
+                self.assertEqual(len(modified), 2)
+                self.assertTrue(modified[0] is other)
+                self.assertTrue(modified[1] is c)
+                self.assertTrue(events[-1].object is c)
+
+            # the events of a failing block are dispatched, as its changes
+            # are kept when the exception is caught
+            del events[:]
+            try:
+                with deferred_events():
+                    c['c'] = Item('c')
+                    raise ValueError()
+            except ValueError:
+                pass
+            self.assertTrue('c' in c)
+            self.assertEqual(
+                [e.newName for e in events
+                 if IObjectAddedEvent.providedBy(e)], ['c'])
+            del events[:]
+            c['d'] = Item('d')
+            self.assertEqual(
+                len([e for e in events
+                     if IObjectAddedEvent.providedBy(e)]), 1)
+            del c['d']
+            self.assertEqual(
+                len([e for e in events
+                     if IObjectRemovedEvent.providedBy(e)]), 1)
+        finally:
+            zope.event.subscribers.remove(events.append)
+
+    def test_deferred_events_per_task(self):
+        from plone.dexterity.events import deferred_events
+        import asyncio
+        import zope.event
+
+        events = []
+        zope.event.subscribers.append(events.append)
+
+        async def deferred(c):
+            with deferred_events():
+                c['a'] = Item('a')
+                await asyncio.sleep(0)
+                self.assertEqual(
+                    [e for e in events if e.object is c], [])
+
+        async def immediate(c):
+            await asyncio.sleep(0)
+            c['a'] = Item('a')
+            self.assertTrue(events)
+
+        async def main():
+            await asyncio.gather(deferred(Container()), immediate(Container()))
+
+        try:
+            asyncio.run(main())
+        finally:
+            zope.event.subscribers.remove(events.append)
+        self.assertEqual(len(events), 4)
+
+    def test_btreecontainer_page_items(self):
+        from plone.dexterity.content import BTreeContainer
+
+        c = BTreeContainer()
+        ids = ['a', 'b', 'ba', 'bb', 'c', 'd', 'e']
+        c.add_many([(id, Item(id)) for id in ids])
+
+        for reverse in (False, True):
+            expected = sorted(ids, reverse=reverse)
+            pages = []
+            cursor = None
+            while True:
+                items, cursor = c.page_items(cursor, size=3, reverse=reverse)
+                pages.append([key for key, value in items])
+                if cursor is None:
+                    break
+            self.assertEqual(
+                pages, [expected[:3], expected[3:6], expected[6:]])
+
+        # the cursor survives the deletion of the last key of a page
+        items, cursor = c.page_items(size=2)
+        del c['b']
+        items, cursor = c.page_items(cursor, size=2)
+        self.assertEqual([key for key, value in items], ['ba', 'bb'])
+
+        self.assertRaises(ValueError, c.page_items, cursor, reverse=True)
+        self.assertRaises(ValueError, c.page_items, 'garbage')
+        self.assertEqual(BTreeContainer().page_items(reverse=True), ([], None))
+        self.assertRaises(ValueError, c.page_items, size=0)
+
+    def test_btreecontainer_page_items_reverse(self):
+        from plone.dexterity.content import _key_before
+        from plone.dexterity.content import _marker
+        from plone.dexterity.content import BTreeContainer
+        from plone.dexterity.storage import NameIndexedData
+
+        # single character ids come before most of a large tree
+        ids = [str(i) for i in range(3000)] + list('abcdefghij')
+        c = BTreeContainer()
+        c.add_many([(id, Item(id)) for id in ids])
+        keys = []
+        cursor = None
+        while True:
+            items, cursor = c.page_items(cursor, size=7, reverse=True)
+            keys.extend(key for key, value in items)
+            if cursor is None:
+                break
+        self.assertEqual(keys, sorted(ids, reverse=True))
+
+        data = c._BTreeContainer__data
+        self.assertEqual(_key_before(data, '2'), '1999')
+        self.assertEqual(_key_before(data, 'a'), '999')
+        self.assertEqual(_key_before(data, '0'), _marker)
+        self.assertEqual(_key_before(data, 'zz'), 'j')
+        self.assertEqual(_key_before(NameIndexedData(), 'a'), _marker)
+        indexed = NameIndexedData([(id, id) for id in ids])
+        self.assertEqual(_key_before(indexed, '2'), '1999')
+
+    def test_ordered_btreecontainer(self):
+        from plone.dexterity.content import OrderedBTreeContainer
+        import zope.event
+
+        c = OrderedBTreeContainer()
+        for id in ('c', 'a', 'd', 'b'):
+            c[id] = Item(id)
+        self.assertRaises(ValueError, c.page_items, size=0)
+        self.assertEqual(list(c.keys()), ['c', 'a', 'd', 'b'])
+        self.assertEqual([v.id for v in c.values()], ['c', 'a', 'd', 'b'])
+        self.assertEqual(c.items()[1], ('a', c['a']))
+        self.assertEqual(len(c), 4)
+
+        self.assertEqual(c.moveObjectsByDelta(['b'], -2), 1)
+        self.assertEqual(list(c.keys()), ['c', 'b', 'a', 'd'])
+        c.moveObjectsToTop(['d'])
+        c.moveObjectToPosition('c', 3)
+        self.assertEqual(list(c.keys()), ['d', 'b', 'a', 'c'])
+        self.assertEqual(c.getObjectPosition('a'), 2)
+        c.updateOrder(['a', 'b', 'c', 'd'])
+        self.assertEqual(list(c), ['a', 'b', 'c', 'd'])
+        self.assertRaises(ValueError, c.updateOrder, ['a', 'b'])
+
+        items, cursor = c.page_items(size=3)
+        self.assertEqual([key for key, value in items], ['a', 'b', 'c'])
+        items, cursor = c.page_items(cursor, size=3)
+        self.assertEqual([key for key, value in items], ['d'])
+        self.assertEqual(cursor, None)
+        items, cursor = c.page_items(size=3, reverse=True)
+        self.assertEqual([key for key, value in items], ['d', 'c', 'b'])
+        del c['b']
+        self.assertRaises(ValueError, c.page_items, cursor, reverse=True)
+
+        # event subscribers see the new child in the order
+        seen = []
+
+        def subscriber(event):
+            seen.append(list(c.keys()))
+        zope.event.subscribers.append(subscriber)
+        try:
+            c['e'] = Item('e')
+        finally:
+            zope.event.subscribers.remove(subscriber)
+        self.assertEqual(seen[0], ['a', 'c', 'd', 'e'])
+        self.assertEqual(c._detach('a').id, 'a')
+        self.assertEqual(list(c.keys()), ['c', 'd', 'e'])
+        self.assertEqual(len(c), 3)
+
+    def test_migrate_to_ordered_btree(self):
+        from plone.dexterity.content import BTreeContainer
+        from plone.dexterity.content import migrate_to_ordered_btree
+        from plone.dexterity.content import OrderedBTreeContainer
+        import transaction
+        import ZODB
+
+        db = ZODB.DB(None)
+        conn = db.open()
+        conn.root()['site'] = site = Container('site')
+        for klass in (Container, BTreeContainer):
+            site['folder'] = folder = klass('folder', title=u'Folder')
+            folder.add_many([(id, Item(id)) for id in ('b', 'c', 'a')])
+            transaction.commit()
+
+            new = migrate_to_ordered_btree(folder)
+            transaction.commit()
+            self.assertTrue(isinstance(new, OrderedBTreeContainer))
+            self.assertTrue(site['folder'] is new)
+            self.assertEqual(new.title, u'Folder')
+            self.assertEqual(new.__parent__, site)
+            self.assertEqual(new['a'].__parent__, new)
+            self.assertEqual(len(new), 3)
+            self.assertEqual(migrate_to_ordered_btree(new), new)
+            expected = klass is Container and ['b', 'c', 'a'] or \
+                ['a', 'b', 'c']
+            self.assertEqual(list(new.keys()), expected)
+
+            conn2 = db.open(transaction.TransactionManager())
+            folder2 = conn2.root()['site']['folder']
+            self.assertTrue(isinstance(folder2, OrderedBTreeContainer))
+            self.assertEqual(list(folder2.keys()), expected)
+            conn2.close()
+            del site['folder']
+            transaction.commit()
+        conn.close()
+        db.close()
+
+    def test_counts_by_type(self):
+        from plone.dexterity.content import BTreeContainer
+        from plone.dexterity.content import rebuild_type_counts
+
+        def item(id, portal_type):
+            obj = Item(id)
+            obj.portal_type = portal_type
+            return obj
+
+        for klass in (Container, BTreeContainer):
+            c = klass()
+            c['a'] = item('a', 'Document')
+            c.add_many([
+                ('b', item('b', 'Document')),
+                ('c', item('c', 'News Item')),
+                ('d', item('d', 'Event')),
+            ])
+            self.assertEqual(
+                c.counts_by_type(),
+                {'Document': 2, 'News Item': 1, 'Event': 1})
+
+            del c['a']
+            c.delete_many(['d'])
+            c._detach('c')
+            self.assertEqual(c.counts_by_type(), {'Document': 1})
+
+            # containers created before the counters existed
+            c._type_counts = None
+            c['e'] = item('e', 'Event')
+            self.assertEqual(c._type_counts, None)
+            self.assertEqual(
+                c.counts_by_type(), {'Document': 1, 'Event': 1})
+            self.assertEqual(
+                rebuild_type_counts(c), {'Document': 1, 'Event': 1})
+            c['f'] = item('f', 'Event')
+            self.assertEqual(
+                dict((k, v()) for k, v in c._type_counts.items()),
+                {'Document': 1, 'Event': 2})
+
 
 def test_suite():
     return unittest.defaultTestLoader.loadTestsFromName(__name__)
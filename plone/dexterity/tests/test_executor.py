@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
+from plone.dexterity.content import Container
+from plone.dexterity.content import synccontext
+from plone.dexterity.executor import ExecutorSaturated
+from plone.dexterity.executor import get_executor
+from plone.dexterity.executor import group_commit
+from plone.dexterity.executor import Histogram
+
+import asyncio
+import threading
+import transaction
+import unittest
+import ZODB
+
+
+class TestManagedExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.db = ZODB.DB(None)
+        self.conn = self.db.open()
+        self.conn.executor = ThreadPoolExecutor(1)
+        self.conn.root()['c'] = self.context = Container('c')
+        transaction.commit()
+
+    def tearDown(self):
+        self.conn.executor.shutdown()
+        self.conn.close()
+        self.db.close()
+
+    def test_synccontext(self):
+        async def run():
+            sync = synccontext(self.context)
+            return await sync(lambda a, b=0: a + b, 1, b=2)
+
+        self.assertEqual(asyncio.run(run()), 3)
+        # the loop of the second run is not the closed one of the first
+        self.assertEqual(asyncio.run(run()), 3)
+        stats = get_executor(self.conn).stats()
+        self.assertEqual(stats['submitted'], 2)
+        self.assertEqual(stats['pending'], 0)
+        self.assertEqual(stats['exec_time']['count'], 2)
+        self.assertEqual(stats['wait_time']['count'], 2)
+
+    def test_deferred_events(self):
+        from plone.dexterity.events import deferred_events
+        from plone.dexterity.events import notify
+        import zope.event
+
+        events = []
+        zope.event.subscribers.append(events.append)
+        blocker = threading.Event()
+
+        async def run():
+            sync = synccontext(self.context)
+            with deferred_events():
+                await sync(notify, 'deferred')
+                self.assertEqual(events, [])
+                late = sync(lambda: blocker.wait() and notify('late'))
+            self.assertEqual(events, ['deferred'])
+            blocker.set()
+            await late
+
+        try:
+            asyncio.run(run())
+        finally:
+            zope.event.subscribers.remove(events.append)
+        # fired after the block was left, so not queued any more
+        self.assertEqual(events, ['deferred', 'late'])
+
+    def test_backpressure(self):
+        executor = get_executor(self.conn, max_queue=2)
+        blocker = threading.Event()
+
+        async def run():
+            first = executor.submit(blocker.wait)
+            second = executor.submit(lambda: 'second')
+            self.assertRaises(
+                ExecutorSaturated, executor.submit, lambda: 'third')
+            blocker.set()
+            return await first, await second
+
+        self.assertEqual(asyncio.run(run()), (True, 'second'))
+        self.assertEqual(executor.rejected, 1)
+        self.assertEqual(executor.max_pending, 2)
+
+    def test_timeout(self):
+        executor = get_executor(self.conn, timeout=0.01)
+        blocker = threading.Event()
+
+        async def run():
+            await executor.submit(blocker.wait)
+
+        self.assertRaises(asyncio.TimeoutError, asyncio.run, run())
+        blocker.set()
+        self.assertEqual(executor.timeouts, 1)
+
+    def test_group_commit(self):
+        calls = []
+        submit = self.conn.executor.submit
+
+        def counting_submit(*args, **kwargs):
+            calls.append(args[0])
+            return submit(*args, **kwargs)
+        self.conn.executor.submit = counting_submit
+
+        def commit(i):
+            if i == 2:
+                raise ValueError(i)
+            return i
+
+        async def run():
+            commit_ = group_commit(self.context, window=0.01)
+            return await asyncio.gather(
+                *[commit_(lambda i=i: commit(i)) for i in range(5)],
+                return_exceptions=True)
+
+        results = asyncio.run(run())
+        self.assertEqual(results[:2] + results[3:], [0, 1, 3, 4])
+        self.assertTrue(isinstance(results[2], ValueError))
+        self.assertEqual(len(calls), 1)
+        stats = self.conn._group_commit.stats()
+        self.assertEqual(stats['batch_sizes']['count'], 1)
+        self.assertEqual(stats['batch_sizes']['max'], 5)
+
+    def test_group_commit_settings(self):
+        async def run():
+            group_commit(self.context, window=0.5)
+            group_commit(self.context, max_batch=2)
+            committer = self.conn._group_commit
+            self.assertEqual(committer.window, 0.5)
+            self.assertEqual(committer.max_batch, 2)
+            commit = group_commit(self.context)
+            self.assertEqual(committer.window, 0.5)
+            # the second commit fills the batch, no need to wait the window
+            return await asyncio.gather(commit(lambda: 1), commit(lambda: 2))
+
+        self.assertEqual(asyncio.run(run()), [1, 2])
+
+    def test_group_commit_timeout(self):
+        get_executor(self.conn, timeout=0.01)
+        blocker = threading.Event()
+        committed = []
+
+        def commit(i):
+            blocker.wait()
+            committed.append(i)
+
+        async def run():
+            commit_ = group_commit(self.context, window=0)
+            return await asyncio.gather(
+                *[commit_(lambda i=i: commit(i)) for i in range(3)],
+                return_exceptions=True)
+
+        results = asyncio.run(run())
+        self.assertTrue(all(
+            isinstance(result, asyncio.TimeoutError) for result in results))
+        blocker.set()
+        self.conn.executor.submit(lambda: None).result()
+        # the commit running when the group timed out still completed
+        self.assertEqual(committed, [0])
+
+    def test_histogram(self):
+        histogram = Histogram((0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.add(value)
+        self.assertEqual(
+            histogram.as_dict()['buckets'],
+            [(0.1, 2), (1.0, 1), (float('inf'), 1)])
+        self.assertEqual(histogram.maximum, 2.0)
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
@@ -2,9 +2,12 @@
 from plone.dexterity.factory import DexterityFactory
 from plone.dexterity.fti import DexterityFTI
 from plone.dexterity.interfaces import IDexterityFTI
+from plone.dexterity.schema import SCHEMA_CACHE
 from plone.mocktestcase import MockTestCase
+from zope.component import getGlobalSiteManager
 from zope.interface import Interface
 import unittest
+import zope.component.testing
 
 
 class IDummy(Interface):
@@ -15,6 +18,8 @@ class TestFactory(MockTestCase):
 
     def test_title(self):
         fti_mock = self.mocker.mock(DexterityFTI)
+        self.expect(fti_mock._p_mtime).result(None).count(0, None)
+        self.expect(fti_mock.klass).result(None).count(0, None)
         self.expect(fti_mock.title).result('Mock type')
         self.mock_utility(fti_mock, IDexterityFTI, name='testtype')
 
@@ -25,6 +30,8 @@ class TestFactory(MockTestCase):
 
     def test_description(self):
         fti_mock = self.mocker.mock(DexterityFTI)
+        self.expect(fti_mock._p_mtime).result(None).count(0, None)
+        self.expect(fti_mock.klass).result(None).count(0, None)
         self.expect(fti_mock.description).result('Mock type description')
         self.mock_utility(fti_mock, IDexterityFTI, name='testtype')
 
@@ -35,6 +42,8 @@ class TestFactory(MockTestCase):
 
     def test_get_interfaces(self):
         fti_mock = self.mocker.mock(DexterityFTI)
+        self.expect(fti_mock._p_mtime).result(None).count(0, None)
+        self.expect(fti_mock.klass).result(None).count(0, None)
         self.expect(fti_mock.lookupSchema()).result(IDummy)
         self.mock_utility(fti_mock, IDexterityFTI, name='testtype')
 
@@ -73,7 +82,9 @@ class TestFactory(MockTestCase):
 
         # FTI
         fti_mock = self.mocker.mock(DexterityFTI)
-        self.expect(fti_mock.klass).result('my.mocked.ContentTypeClass')
+        self.expect(fti_mock._p_mtime).result(None).count(0, None)
+        self.expect(fti_mock.klass).result(
+            'my.mocked.ContentTypeClass').count(1, None)
         self.mock_utility(fti_mock, IDexterityFTI, name='testtype')
 
         self.replay()
@@ -105,7 +116,9 @@ class TestFactory(MockTestCase):
 
         # FTI
         fti_mock = self.mocker.mock(DexterityFTI)
-        self.expect(fti_mock.klass).result('my.mocked.ContentTypeClass')
+        self.expect(fti_mock._p_mtime).result(None).count(0, None)
+        self.expect(fti_mock.klass).result(
+            'my.mocked.ContentTypeClass').count(1, None)
         self.mock_utility(fti_mock, IDexterityFTI, name='testtype')
 
         self.replay()
@@ -136,7 +149,9 @@ class TestFactory(MockTestCase):
 
         # FTI
         fti_mock = self.mocker.mock(DexterityFTI)
-        self.expect(fti_mock.klass).result('my.mocked.ContentTypeClass')
+        self.expect(fti_mock._p_mtime).result(None).count(0, None)
+        self.expect(fti_mock.klass).result(
+            'my.mocked.ContentTypeClass').count(1, None)
         self.mock_utility(fti_mock, IDexterityFTI, name='testtype')
 
         self.replay()
@@ -164,7 +179,9 @@ class TestFactory(MockTestCase):
 
         # FTI
         fti_mock = self.mocker.mock(DexterityFTI)
-        self.expect(fti_mock.klass).result('my.mocked.ContentTypeClass')
+        self.expect(fti_mock._p_mtime).result(None).count(0, None)
+        self.expect(fti_mock.klass).result(
+            'my.mocked.ContentTypeClass').count(1, None)
         self.mock_utility(fti_mock, IDexterityFTI, name='testtype')
 
         self.replay()
@@ -192,7 +209,9 @@ class TestFactory(MockTestCase):
 
         # FTI
         fti_mock = self.mocker.mock(DexterityFTI)
-        self.expect(fti_mock.klass).result('my.mocked.ContentTypeClass')
+        self.expect(fti_mock._p_mtime).result(None).count(0, None)
+        self.expect(fti_mock.klass).result(
+            'my.mocked.ContentTypeClass').count(1, None)
         self.mock_utility(fti_mock, IDexterityFTI, name='testtype')
 
         self.replay()
@@ -201,5 +220,56 @@ class TestFactory(MockTestCase):
         self.assertEqual(obj_mock, factory('id', title='title'))
 
 
+class TestFactoryCache(unittest.TestCase):
+
+    def setUp(self):
+        zope.component.testing.setUp()
+        self.fti = self._register('plone.dexterity.content.Item')
+
+    def tearDown(self):
+        zope.component.testing.tearDown()
+
+    def _register(self, klass):
+        fti = DexterityFTI(
+            'testtype', klass=klass,
+            schema='plone.dexterity.tests.test_factory.IDummy')
+        getGlobalSiteManager().registerUtility(
+            fti, IDexterityFTI, name='testtype')
+        return fti
+
+    def test_fti_and_class_are_cached(self):
+        factory = DexterityFactory(portal_type='testtype')
+        self.assertEqual(factory('a').__class__.__name__, 'Item')
+        spec = factory.getInterfaces()
+        self.assertEqual([IDummy, Interface], list(spec.flattened()))
+
+        # no lookup as long as the schema cache is valid
+        other = self._register('plone.dexterity.content.Container')
+        self.assertEqual(factory('b').__class__.__name__, 'Item')
+        self.assertTrue(factory.getInterfaces() is spec)
+
+        SCHEMA_CACHE.invalidate('testtype')
+        self.assertEqual(factory('c').__class__.__name__, 'Container')
+        self.assertFalse(factory.getInterfaces() is spec)
+
+        other.klass = 'plone.dexterity.content.Item'
+        self.assertEqual(factory('d').__class__.__name__, 'Item')
+
+        other.klass = 'plone.dexterity.content.__name__'
+        self.assertRaises(ValueError, factory)
+
+    def test_fti_of_other_site_is_not_touched(self):
+        class ClosedFTI(object):
+
+            def __getattr__(self, name):
+                raise AssertionError(name)
+
+        factory = DexterityFactory(portal_type='testtype')
+        key, fti, klass = factory._resolved()
+        factory._v_resolved = ((object(), ) + key[1:], ClosedFTI(), klass)
+        self.assertEqual(factory('a').__class__.__name__, 'Item')
+        self.assertTrue(factory._v_resolved[1] is self.fti)
+
+
 def test_suite():
     return unittest.defaultTestLoader.loadTestsFromName(__name__)
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+from io import BytesIO
+from plone.dexterity.content import Container
+from plone.dexterity.deserialize.importer import Checkpoint
+from plone.dexterity.deserialize.importer import clean_text
+from plone.dexterity.deserialize.importer import compile_fields
+from plone.dexterity.deserialize.importer import JSONLinesImporter
+from plone.dexterity.deserialize.importer import ParallelJSONLinesImporter
+from plone.dexterity.deserialize.importer import prepare_lines
+from plone.dexterity.deserialize.importer import read_lines
+from plone.dexterity.deserialize.importer import read_raw_lines
+from plone.dexterity.factory import DexterityFactory
+from plone.dexterity.fti import DexterityFTI
+from plone.dexterity.interfaces import IDexterityContent
+from plone.dexterity.interfaces import IDexterityFTI
+from plone.jsonserializer.interfaces import IDeserializeFromJson
+from plone.supermodel.interfaces import WRITE_PERMISSIONS_KEY
+from zope.component import provideAdapter
+from zope.component import provideUtility
+from zope.component.interfaces import IFactory
+from zope.interface import Interface
+from zope import schema
+
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import transaction
+import unittest
+import zope.component.testing
+import ZODB
+
+
+class IRecord(Interface):
+
+    title = schema.TextLine(title=u'Title')
+    body = schema.Text(title=u'Body', required=False)
+    count = schema.Int(title=u'Count', required=False, min=0)
+    day = schema.Date(title=u'Day', required=False)
+    kind = schema.Choice(
+        title=u'Kind', required=False, vocabulary='plone.test.kinds')
+    secret = schema.TextLine(title=u'Secret', required=False)
+
+
+IRecord.setTaggedValue(WRITE_PERMISSIONS_KEY, {'secret': 'cmf.ManagePortal'})
+
+
+class Deserializer(object):
+    """Sets the title of the record, failing for titles in ``broken`` after
+    setting the title of ``changed`` if given.
+    """
+
+    broken = set()
+    changed = None
+
+    def __init__(self, context, request):
+        self.context = context
+
+    def __call__(self, data):
+        if data.get('title') in self.broken:
+            if self.changed is not None:
+                self.changed.title = data['title']
+            raise ValueError(data['title'])
+        self.context.title = data.get('title')
+        return self.context
+
+
+class PermissionDeserializer(object):
+    """Records the data it gets, and sets no protected field"""
+
+    received = []
+
+    def __init__(self, context, request):
+        self.context = context
+
+    def __call__(self, data):
+        self.received.append(data)
+        return self.context
+
+
+def jsonlines(count, start=0):
+    return b''.join(
+        json.dumps({'id': 'item-{0:d}'.format(i), '@type': 'doc',
+                    'title': 'Item {0:d}'.format(i)}).encode('utf8') + b'\n'
+        for i in range(start, start + count))
+
+
+class TestJSONLinesImporter(unittest.TestCase):
+
+    def setUp(self):
+        zope.component.testing.setUp()
+        provideUtility(
+            DexterityFTI('doc', klass='plone.dexterity.content.Item'),
+            IDexterityFTI, 'doc')
+        provideUtility(DexterityFactory('doc'), IFactory, 'doc')
+        provideAdapter(
+            Deserializer, (IDexterityContent, Interface),
+            IDeserializeFromJson)
+        Deserializer.broken = set()
+        Deserializer.changed = None
+
+        self.db = ZODB.DB(None)
+        self.conn = self.db.open()
+        self.conn.root()['folder'] = self.folder = Container('folder')
+        transaction.commit()
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        transaction.abort()
+        self.conn.close()
+        self.db.close()
+        shutil.rmtree(self.tempdir)
+        zope.component.testing.tearDown()
+
+    def test_read_lines(self):
+        data = b'{"id": "a"}\n\n{"id": "b"}\n'
+        self.assertEqual(
+            list(read_lines(BytesIO(data))),
+            [(1, 12, {'id': 'a'}), (3, 25, {'id': 'b'})])
+        self.assertEqual(
+            list(read_lines(BytesIO(data), 1, 12)),
+            [(3, 25, {'id': 'b'})])
+
+    def test_import(self):
+        stats = []
+        importer = JSONLinesImporter(
+            self.folder, savepoint_every=3, commit_every=10,
+            checkConstraints=False,
+            progress=lambda s: stats.append(s.created))
+        result = importer.run(BytesIO(jsonlines(25)))
+        self.assertEqual(stats, [10, 20, 25])
+        self.assertEqual(result.commits, 3)
+        self.assertEqual(result.line, 25)
+        self.assertEqual(len(self.folder), 25)
+        self.assertEqual(self.folder['item-7'].title, 'Item 7')
+        self.assertEqual(self.folder['item-7'].portal_type, 'doc')
+        self.assertTrue(result.rate > 0)
+        self.assertTrue('peak_memory' in result.as_dict())
+
+    def test_skip_errors(self):
+        Deserializer.broken = {'Item 3'}
+        importer = JSONLinesImporter(
+            self.folder, checkConstraints=False, skip_errors=True)
+        result = importer.run(BytesIO(jsonlines(5)))
+        self.assertEqual((result.created, result.failed), (4, 1))
+        self.assertFalse('item-3' in self.folder)
+
+    def test_skip_errors_rolls_back(self):
+        # the changes made by a failing record are undone
+        Deserializer.broken = {'Item 3'}
+        Deserializer.changed = self.folder
+        self.folder.title = u'Folder'
+        transaction.commit()
+        importer = JSONLinesImporter(
+            self.folder, checkConstraints=False, skip_errors=True)
+        result = importer.run(BytesIO(jsonlines(5)))
+        self.assertEqual((result.created, result.failed), (4, 1))
+        self.assertEqual(self.folder.title, u'Folder')
+        self.assertEqual(len(self.folder), 4)
+
+    def test_truncated_checkpoint(self):
+        path = os.path.join(self.tempdir, 'checkpoint')
+        with open(path, 'w') as f:
+            f.write('{"line": 10, "off')
+        self.assertEqual(Checkpoint(path).load(), (0, 0))
+        Checkpoint(path).save(10, 200)
+        self.assertEqual(Checkpoint(path).load(), (10, 200))
+
+    def test_resume_from_checkpoint(self):
+        path = os.path.join(self.tempdir, 'export.jsonl')
+        with open(path, 'wb') as f:
+            f.write(jsonlines(25))
+        checkpoint = os.path.join(self.tempdir, 'checkpoint')
+
+        Deserializer.broken = {'Item 14'}
+        importer = JSONLinesImporter(
+            self.folder, commit_every=10, checkpoint=checkpoint,
+            checkConstraints=False)
+        self.assertRaises(ValueError, importer.run, path)
+        transaction.abort()
+        self.assertEqual(len(self.folder), 10)
+        self.assertEqual(Checkpoint(checkpoint).load()[0], 10)
+
+        Deserializer.broken = set()
+        result = importer.run(path)
+        self.assertEqual(result.created, 15)
+        self.assertEqual(len(self.folder), 25)
+        self.assertEqual(Checkpoint(checkpoint).load()[0], 25)
+
+
+class TestParallelJSONLinesImporter(unittest.TestCase):
+
+    def setUp(self):
+        zope.component.testing.setUp()
+        provideUtility(
+            DexterityFTI(
+                'record', klass='plone.dexterity.content.Item',
+                schema=IRecord.__identifier__),
+            IDexterityFTI, 'record')
+        provideUtility(DexterityFactory('record'), IFactory, 'record')
+        self.db = ZODB.DB(None)
+        self.conn = self.db.open()
+        self.conn.root()['folder'] = self.folder = Container('folder')
+        transaction.commit()
+
+    def tearDown(self):
+        transaction.abort()
+        self.conn.close()
+        self.db.close()
+        zope.component.testing.tearDown()
+
+    def _lines(self, count, values, portal_type='record'):
+        records = []
+        for i in range(count):
+            record = {'id': 'record-{0:d}'.format(i), '@type': portal_type,
+                      'title': u'Record {0:d}'.format(i),
+                      'body': u'line\r\nline\x00', 'count': str(i),
+                      'day': '2020-01-{0:02d}'.format(i % 28 + 1)}
+            record.update(values.get(i, {}))
+            if portal_type is None:
+                del record['@type']
+            records.append(json.dumps(record).encode('utf8'))
+        return BytesIO(b'\n'.join(records))
+
+    def test_clean_text(self):
+        self.assertEqual(clean_text(u'a\r\nb\rc\x07\td'), u'a\nb\nc\td')
+
+    def test_compile_fields(self):
+        fields = compile_fields('record')
+        self.assertEqual(
+            sorted(fields),
+            ['body', 'count', 'day', 'kind', 'secret', 'title'])
+        self.assertEqual(fields['kind'], None)
+        self.assertEqual(fields['secret'], None)
+        self.assertEqual(fields['title'].interface, None)
+        self.assertEqual(IRecord['title'].interface, IRecord)
+
+    def _check(self, workers):
+        importer = ParallelJSONLinesImporter(
+            self.folder, 'record', workers=workers, chunk_size=4,
+            checkConstraints=False, skip_errors=True)
+        result = importer.run(self._lines(
+            10, {3: {'count': '-1'}, 5: {'title': u'a\nb'}}))
+        self.assertEqual((result.created, result.failed), (8, 2))
+        self.assertEqual(len(self.folder), 8)
+        self.assertFalse('record-3' in self.folder)
+        record = self.folder['record-7']
+        self.assertEqual(record.title, u'Record 7')
+        self.assertEqual(record.body, u'line\nline')
+        self.assertEqual(record.count, 7)
+        self.assertEqual(record.day, datetime.date(2020, 1, 8))
+        self.assertEqual(list(self.folder.keys())[:3],
+                         ['record-0', 'record-1', 'record-2'])
+
+    def test_serial(self):
+        self._check(0)
+
+    def test_deserialize_protected_and_complex_values(self):
+        provideAdapter(
+            PermissionDeserializer, (IDexterityContent, Interface),
+            IDeserializeFromJson)
+        PermissionDeserializer.received = []
+        importer = ParallelJSONLinesImporter(
+            self.folder, 'record', workers=0, checkConstraints=False)
+        result = importer.run(self._lines(2, {1: {
+            'secret': u'set', 'body': {'data': u'text'}, 'extra': 1}}))
+        self.assertEqual(result.created, 2)
+        # the protected field is left to the deserializer checking the
+        # permission, like values convert() cannot handle and unknown keys
+        self.assertEqual(
+            PermissionDeserializer.received,
+            [{'secret': u'set', 'body': {'data': u'text'}, 'extra': 1}])
+        record = self.folder['record-1']
+        self.assertEqual(record.title, u'Record 1')
+        self.assertEqual(record.secret, None)
+
+    def test_workers(self):
+        self._check(2)
+
+    def test_default_type(self):
+        lines = list(read_raw_lines(self._lines(1, {}, portal_type=None)))
+        fields = {'record': compile_fields('record')}
+        record = prepare_lines(lines, fields, 'record')[0][2]
+        self.assertEqual(record['@type'], 'record')
+        self.assertEqual(record['@values']['count'], 0)
+
+        # the workers convert the records of the type of the importer too
+        importer = ParallelJSONLinesImporter(
+            self.folder, 'record', workers=2, checkConstraints=False)
+        result = importer.run(self._lines(3, {}, portal_type=None))
+        self.assertEqual((result.created, result.failed), (3, 0))
+        self.assertEqual(self.folder['record-2'].count, 2)
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from BTrees.OOBTree import OOBTree
+from plone.dexterity.content import BTreeContainer
+from plone.dexterity.content import Container
+from plone.dexterity.content import Item
+from plone.dexterity.namechooser import DexterityNameChooser
+from zope.container.contained import NameChooser
+
+import unittest
+
+
+class TestNameChooser(unittest.TestCase):
+
+    def _container(self, klass, ids):
+        container = klass()
+        container.add_many([(id, Item(id)) for id in ids])
+        return container
+
+    def test_same_names_as_zope(self):
+        layouts = [
+            [],
+            ['doc'],
+            ['doc', 'doc-2', 'doc-3'],
+            ['doc', 'doc-02', 'doc-2.old', 'doc-2x', 'doc-', 'docs'],
+            ['doc.old', 'doc-2.old', 'doc-3.txt'],
+            ['doc'] + ['doc-{0:d}'.format(i) for i in range(2, 120)],
+        ]
+        names = ['doc', 'doc.old', '+doc', 'a/doc', b'doc']
+        for klass in (Container, BTreeContainer):
+            for ids in layouts:
+                container = self._container(klass, ids)
+                for name in names:
+                    self.assertEqual(
+                        DexterityNameChooser(container).chooseName(
+                            name, Item()),
+                        NameChooser(container).chooseName(name, Item()),
+                        (klass, ids, name))
+
+    def test_gaps(self):
+        # a free number following a taken one is picked, not the lowest
+        ids = ['doc', 'doc-2', 'doc-3', 'doc-4', 'doc-6', 'doc-7', 'doc-8']
+        for klass in (Container, BTreeContainer):
+            container = self._container(klass, ids)
+            self.assertEqual(
+                DexterityNameChooser(container).chooseName('doc', Item()),
+                'doc-9')
+
+    def test_lookups(self):
+        lookups = []
+
+        class CountingTree(OOBTree):
+
+            def __contains__(self, key):
+                lookups.append(key)
+                return super(CountingTree, self).__contains__(key)
+
+        ids = ['doc'] + ['doc-{0:d}'.format(i) for i in range(2, 1000)]
+        container = self._container(Container, ids)
+        container._data = CountingTree(container._data)
+        self.assertEqual(
+            DexterityNameChooser(container).chooseName('doc', Item()),
+            'doc-1000')
+        self.assertTrue(0 < len(lookups) < 30, lookups)
+
+    def test_empty_name(self):
+        container = self._container(Container, ['Item'])
+        self.assertEqual(
+            DexterityNameChooser(container).chooseName('', Item()),
+            'Item-2')
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+from plone.dexterity.ordering import ContainerOrder
+
+import unittest
+
+
+class TestContainerOrder(unittest.TestCase):
+
+    def test_append_remove(self):
+        order = ContainerOrder(['a', 'b'])
+        order.append('c')
+        self.assertEqual(list(order), ['a', 'b', 'c'])
+        self.assertEqual(len(order), 3)
+        self.assertTrue('b' in order)
+
+        order.remove('b')
+        self.assertEqual(list(order), ['a', 'c'])
+        self.assertEqual(len(order), 2)
+        self.assertFalse('b' in order)
+        self.assertRaises(KeyError, order.remove, 'b')
+        self.assertRaises(ValueError, order.append, 'a')
+
+    def test_insert(self):
+        order = ContainerOrder(['a', 'b'])
+        order.insert(0, 'c')
+        order.insert(2, 'd')
+        order.insert(10, 'e')
+        order.insert(-1, 'f')
+        self.assertEqual(list(order), ['c', 'a', 'd', 'b', 'f', 'e'])
+        self.assertEqual(order.index('d'), 2)
+
+    def test_insert_renumbers(self):
+        order = ContainerOrder(['a', 'b'])
+        order.gap = 4
+        for i in range(10):
+            order.insert(1, str(i))
+        self.assertEqual(
+            list(order),
+            ['a', '9', '8', '7', '6', '5', '4', '3', '2', '1', '0', 'b'])
+
+    def test_getitem(self):
+        order = ContainerOrder(['a', 'b', 'c'])
+        self.assertEqual(order[0], 'a')
+        self.assertEqual(order[-1], 'c')
+        self.assertEqual(order[1:], ['b', 'c'])
+        self.assertEqual(order[-2:], ['b', 'c'])
+        self.assertRaises(IndexError, order.__getitem__, 3)
+
+    def test_update(self):
+        order = ContainerOrder(['a', 'b', 'c'])
+        order.update(['c', 'a', 'b'])
+        self.assertEqual(list(order), ['c', 'a', 'b'])
+        self.assertRaises(ValueError, order.update, ['a', 'a'])
+        self.assertEqual(list(order), ['c', 'a', 'b'])
+
+    def test_generation(self):
+        order = ContainerOrder()
+        generation = order.generation
+        order.append('a')
+        self.assertNotEqual(order.generation, generation)
+
+    def test_generation_survives_ghosting(self):
+        import transaction
+        import ZODB
+
+        db = ZODB.DB(None)
+        conn = db.open()
+        order = conn.root()['order'] = ContainerOrder(['a', 'b'])
+        order.append('c')
+        transaction.commit()
+        generation = order.generation
+        self.assertNotEqual(generation, 0)
+        order._p_deactivate()
+        self.assertEqual(order._p_changed, None)
+        self.assertEqual(order.generation, generation)
+        self.assertEqual(list(order), ['a', 'b', 'c'])
+        conn.close()
+        db.close()
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
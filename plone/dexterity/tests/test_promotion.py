@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+from persistent.dict import PersistentDict
+from persistent.list import PersistentList
+from plone.dexterity.content import Container
+from plone.dexterity.content import Item
+from plone.dexterity.fti import DexterityFTI
+from plone.dexterity.interfaces import IDexterityFTI
+from plone.dexterity.ordering import ContainerOrder
+from plone.dexterity.ordering import KeyOrder
+from plone.dexterity.promotion import get_promotions
+from plone.dexterity.promotion import promote_batch
+from plone.dexterity.promotion import Promoter
+from plone.dexterity.promotion import queue_promotion
+from plone.dexterity.promotion import queuePromotion
+from zope.component import getGlobalSiteManager
+from zope.component import provideHandler
+from zope.component.event import objectEventNotify
+from ZODB.FileStorage import FileStorage
+from ZODB.POSException import ConflictError
+
+import os
+import shutil
+import tempfile
+import transaction
+import unittest
+import ZODB
+
+
+class TestPromotion(unittest.TestCase):
+
+    def setUp(self):
+        self.fti = DexterityFTI('folder')
+        self.fti.promotion_threshold = 5
+        getGlobalSiteManager().registerUtility(
+            self.fti, IDexterityFTI, name='folder')
+        provideHandler(objectEventNotify)
+        provideHandler(queuePromotion)
+
+        self.db = ZODB.DB(None)
+        self.conn = self.db.open()
+        self.root = self.conn.root()
+        self.root['site'] = self.site = Container('site')
+        transaction.commit()
+
+    def tearDown(self):
+        transaction.abort()
+        self.conn.close()
+        self.db.close()
+        gsm = getGlobalSiteManager()
+        gsm.unregisterUtility(self.fti, IDexterityFTI, name='folder')
+        gsm.unregisterHandler(queuePromotion)
+        gsm.unregisterHandler(objectEventNotify)
+
+    def _folder(self, size):
+        folder = Container('folder')
+        folder.portal_type = 'folder'
+        self.site['folder'] = folder
+        folder.add_many(
+            [('item-{0:d}'.format(i), Item('item-{0:d}'.format(i)))
+             for i in range(size)])
+        transaction.commit()
+        return folder
+
+    def _folder_add(self, size):
+        folder = self.site['folder']
+        folder.add_many(
+            [('more-{0:d}'.format(i), Item('more-{0:d}'.format(i)))
+             for i in range(size)])
+        transaction.commit()
+        return folder
+
+    def test_ordered_container_is_not_queued(self):
+        self._folder(10)
+        self.assertFalse(get_promotions(self.conn))
+
+    def test_unordered_container_is_promoted(self):
+        self.fti.ordered = False
+        self._folder(3)
+        self.assertFalse(get_promotions(self.conn))
+        self._folder_add(3)
+        self.assertEqual(len(get_promotions(self.conn)), 1)
+
+        self.assertEqual(Promoter(self.db).run(), 1)
+        transaction.begin()
+        folder = self.site['folder']
+        self.assertTrue(isinstance(folder._order, KeyOrder))
+        self.assertEqual(len(folder), 6)
+        self.assertEqual(
+            list(folder.keys()),
+            ['item-0', 'item-1', 'item-2', 'more-0', 'more-1', 'more-2'])
+        self.assertFalse(get_promotions(self.conn))
+
+        # children are kept sorted and cannot be moved
+        folder['a'] = Item('a')
+        del folder['item-1']
+        self.assertEqual(folder.keys()[:2], ['a', 'item-0'])
+        self.assertEqual(len(folder), 6)
+        self.assertEqual(folder.getObjectPosition('more-0'), 3)
+        self.assertRaises(ValueError, folder.moveObjectsToTop, ['more-0'])
+        self.assertRaises(
+            ValueError, folder.updateOrder, list(reversed(folder.keys())))
+        self.assertEqual(folder.moveObjectsToTop(['a']), 0)
+        folder.updateOrder(list(folder.keys()))
+        self.assertEqual(folder.keys()[:2], ['a', 'item-0'])
+
+    def test_legacy_container_is_migrated_in_batches(self):
+        folder = Container('folder')
+        folder.portal_type = 'folder'
+        ids = ['item-{0:d}'.format(i) for i in range(10)]
+        ids.reverse()
+        folder._data = PersistentDict((id, Item(id)) for id in ids)
+        folder._order = PersistentList(ids)
+        self.site['folder'] = folder
+        transaction.commit()
+        queue_promotion(folder)
+        transaction.commit()
+
+        migrated = []
+        promoter = Promoter(
+            self.db, batch_size=4,
+            progress=lambda entry: migrated.append(entry.migrated))
+        self.assertEqual(promoter.run(), 3)
+        self.assertEqual(migrated, [4, 8, 10])
+        transaction.begin()
+        self.assertTrue(isinstance(folder._order, ContainerOrder))
+        self.assertEqual(list(folder.keys()), ids)
+        self.assertFalse(get_promotions(self.conn))
+
+    def test_legacy_container_is_queued_when_changed(self):
+        folder = Container('folder')
+        folder.portal_type = 'folder'
+        ids = ['item-{0:d}'.format(i) for i in range(40)]
+        folder._data = PersistentDict((id, Item(id)) for id in ids)
+        folder._order = PersistentList(ids)
+        self.site['folder'] = folder
+        transaction.commit()
+
+        # a normal change keeps the legacy storage and queues the container
+        folder['new'] = Item('new')
+        transaction.commit()
+        self.assertTrue(isinstance(folder._order, PersistentList))
+        self.assertEqual(len(get_promotions(self.conn)), 1)
+
+        def progress(entry):
+            # changes between batches are caught up with by the last batch
+            if entry.migrated == 8:
+                del folder['item-1']
+                folder['late'] = Item('late')
+                transaction.commit()
+
+        storage = self.db.storage
+        start = storage.lastTransaction()
+        promoter = Promoter(self.db, batch_size=4, progress=progress)
+        self.assertEqual(promoter.run(), 11)
+
+        # no transaction of the promoter writes more than a batch worth of
+        # records, and none rewrites the children
+        for txn in storage.iterator(start):
+            oids = [record.oid for record in txn]
+            if txn.tid != start:
+                self.assertLess(len(oids), 12)
+            self.assertNotIn(folder['item-0']._p_oid, oids)
+
+        transaction.begin()
+        self.assertTrue(isinstance(folder._order, ContainerOrder))
+        self.assertEqual(
+            list(folder.keys()),
+            [id for id in ids if id != 'item-1'] + ['new', 'late'])
+        self.assertEqual(len(folder), 41)
+        self.assertFalse(get_promotions(self.conn))
+
+
+class TestConcurrentPromotion(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.db = ZODB.DB(FileStorage(os.path.join(self.tempdir, 'Data.fs')))
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_add_during_last_batch_conflicts(self):
+        # the promoter and a user each have a connection
+        promoter = transaction.TransactionManager()
+        conn = self.db.open(transaction_manager=promoter)
+        user = transaction.TransactionManager()
+        conn2 = self.db.open(transaction_manager=user)
+
+        folder = Container('folder')
+        ids = ['item-{0:d}'.format(i) for i in range(6)]
+        folder._data = PersistentDict((id, Item(id)) for id in ids)
+        folder._order = PersistentList(ids)
+        conn.root()['folder'] = folder
+        promoter.commit()
+        entry = queue_promotion(folder)
+        promoter.commit()
+
+        promoter.begin()
+        self.assertFalse(promote_batch(entry, 4))
+        promoter.commit()
+        promoter.begin()
+        self.assertTrue(promote_batch(entry, 4))
+
+        # a child added to the old storage before the promoter commits
+        user.begin()
+        conn2.root()['folder']['new'] = Item('new')
+        user.commit()
+        self.assertRaises(ConflictError, promoter.commit)
+        promoter.abort()
+
+        self.assertEqual(Promoter(self.db, batch_size=4).run(), 1)
+        user.begin()
+        folder2 = conn2.root()['folder']
+        self.assertTrue(isinstance(folder2._order, ContainerOrder))
+        self.assertEqual(list(folder2.keys()), ids + ['new'])
+        self.assertEqual(len(folder2), 7)
+        conn.close()
+        conn2.close()
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
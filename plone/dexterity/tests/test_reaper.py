@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+from plone.dexterity.content import BTreeContainer
+from plone.dexterity.content import Container
+from plone.dexterity.content import Item
+from plone.dexterity.namechooser import DexterityNameChooser
+from plone.dexterity.reaper import BatchJob
+from plone.dexterity.reaper import progress
+from plone.dexterity.reaper import Reaper
+from plone.dexterity.reaper import tombstone
+from zope.lifecycleevent.interfaces import IObjectRemovedEvent
+
+import transaction
+import unittest
+import zope.event
+import ZODB
+
+
+class TestReaper(unittest.TestCase):
+
+    def setUp(self):
+        self.db = ZODB.DB(None)
+        self.conn = self.db.open()
+        self.root = self.conn.root()
+        self.root['site'] = site = Container('site')
+        site['keep'] = Item('keep')
+        site['big'] = big = BTreeContainer('big')
+        for i in range(5):
+            sub = Container('sub-{0:d}'.format(i))
+            big['sub-{0:d}'.format(i)] = sub
+            sub.add_many(
+                [('item-{0:d}'.format(j), Item('item-{0:d}'.format(j)))
+                 for j in range(7)])
+        transaction.commit()
+        self.events = []
+        zope.event.subscribers.append(self.events.append)
+
+    def tearDown(self):
+        zope.event.subscribers.remove(self.events.append)
+        transaction.abort()
+        self.conn.close()
+        self.db.close()
+
+    def removed(self):
+        return [e.oldName for e in self.events
+                if IObjectRemovedEvent.providedBy(e)]
+
+    def test_tombstone_detaches(self):
+        site = self.root['site']
+        tombstone(site, 'big')
+        transaction.commit()
+        self.assertEqual(list(site.keys()), ['keep'])
+        self.assertEqual(self.removed(), [])
+        [(name, removed, created)] = progress(self.conn)
+        self.assertEqual((name, removed), ('big', 0))
+
+        # the name stays reserved until the subtree is reaped
+        self.assertRaises(KeyError, site.__setitem__, 'big', Item('big'))
+        chooser = DexterityNameChooser(site)
+        self.assertEqual(chooser.chooseName('big', Item()), 'big-2')
+        self.assertRaises(KeyError, chooser.checkName, 'big', Item())
+        Reaper(self.db).run()
+        self.conn.sync()
+        site['big'] = Item('big')
+
+    def test_reap_in_batches_and_resume(self):
+        tombstone(self.root['site'], 'big')
+        transaction.commit()
+
+        seen = []
+        reaper = Reaper(self.db, batch_size=4,
+                        progress=lambda entry: seen.append(entry.removed))
+        # stop after a few transactions, then resume
+        self.assertEqual(reaper.run(max_transactions=3), 3)
+        self.conn.sync()
+        # sub-0 takes two batches of leaves, then sub-0 itself goes
+        self.assertEqual(progress(self.conn)[0][1], 4 + 3 + 1)
+
+        reaper.run()
+        self.conn.sync()
+        self.assertEqual(progress(self.conn), [])
+        self.assertEqual(seen[-1], 5 * 7 + 5 + 1)
+        removed = self.removed()
+        self.assertEqual(len(removed), 5 * 7 + 5 + 1)
+        self.assertEqual(removed[-1], 'big')
+        self.assertEqual(list(self.root['site'].keys()), ['keep'])
+
+    def test_batch_job_is_abstract(self):
+        self.assertRaises(TypeError, BatchJob, self.db)
+
+    def test_tombstone_small_object(self):
+        site = self.root['site']
+        self.assertEqual(tombstone(site, 'keep'), None)
+        self.assertEqual(self.removed(), ['keep'])
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
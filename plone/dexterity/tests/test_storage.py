@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+from BTrees.OOBTree import OOBTree
+from concurrent.futures import ThreadPoolExecutor
+from plone.dexterity.content import ASYNCGET_STATS
+from plone.dexterity.content import BTreeContainer
+from plone.dexterity.content import Item
+from plone.dexterity.fti import DexterityFTI
+from plone.dexterity.interfaces import IDexterityFTI
+from plone.dexterity.promotion import get_promotions
+from plone.dexterity.promotion import migrate_btree_batch
+from plone.dexterity.promotion import Promoter
+from plone.dexterity.promotion import queue_promotion
+from plone.dexterity.storage import LargeOOBTree
+from plone.dexterity.storage import NameIndexedData
+from zope.component import getGlobalSiteManager
+from ZODB.FileStorage import FileStorage
+from ZODB.POSException import ConflictError
+
+import asyncio
+import os
+import shutil
+import tempfile
+import transaction
+import unittest
+import ZODB
+
+
+class TestNameIndexedData(unittest.TestCase):
+
+    def test_mapping(self):
+        data = NameIndexedData([('12', 'a'), ('b', 'b'), ('012', 'c')])
+        data['3'] = 'd'
+        self.assertEqual(list(data.keys()), ['012', '12', '3', 'b'])
+        self.assertEqual(data._index['12'], 12)
+        self.assertEqual(data._index['3'], 3)
+        self.assertTrue(data._index['012'] < 0)
+        self.assertTrue(data._index['b'] < 0)
+        self.assertEqual(list(data.values()), ['c', 'a', 'd', 'b'])
+        self.assertEqual(data.items('2')[:2], [('3', 'd'), ('b', 'b')])
+        self.assertEqual(len(data.items()), 4)
+        self.assertEqual(data.maxKey('2'), '12')
+
+        data['12'] = 'e'
+        self.assertEqual(data['12'], 'e')
+        self.assertEqual(len(data._data), 4)
+        self.assertEqual(data.pop('12'), 'e')
+        self.assertEqual(data.pop('12', None), None)
+        self.assertRaises(KeyError, data.pop, '12')
+        del data['b']
+        self.assertEqual(data.get('b'), None)
+        self.assertFalse('b' in data)
+        self.assertEqual(len(data), 2)
+        self.assertEqual(len(data._data), 2)
+
+
+class TestContainerStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.fti = DexterityFTI('records')
+        getGlobalSiteManager().registerUtility(
+            self.fti, IDexterityFTI, name='records')
+        self.db = ZODB.DB(None)
+        self.conn = self.db.open()
+        self.root = self.conn.root()
+
+    def tearDown(self):
+        transaction.abort()
+        self.conn.close()
+        self.db.close()
+        getGlobalSiteManager().unregisterUtility(
+            self.fti, IDexterityFTI, name='records')
+
+    def _container(self, size):
+        container = BTreeContainer('records')
+        container.portal_type = 'records'
+        container.add_many(
+            [(str(i), Item(str(i))) for i in range(size)])
+        self.root['records'] = container
+        transaction.commit()
+        return container
+
+    def test_empty_container_gets_storage_of_its_type(self):
+        self.fti.container_storage = 'large'
+        container = self._container(3)
+        self.assertTrue(
+            type(container._BTreeContainer__data) is LargeOOBTree)
+
+        self.fti.container_storage = 'integer'
+        del self.root['records']
+        container = self._container(3)
+        data = container._BTreeContainer__data
+        self.assertTrue(isinstance(data, NameIndexedData))
+        self.assertEqual(list(container.keys()), ['0', '1', '2'])
+        self.assertEqual(container['1'].id, '1')
+        self.assertEqual(len(container), 3)
+
+        container.delete_many(['0'])
+        self.assertEqual(container.page_items(size=1)[0][0][0], '1')
+        items, cursor = container.page_items(size=1, reverse=True)
+        self.assertEqual(items[0][0], '2')
+
+    def test_asyncget_fast_path(self):
+        self.fti.container_storage = 'integer'
+        self._container(100)
+        conn2 = self.db.open(transaction.TransactionManager())
+        conn2.executor = ThreadPoolExecutor(1)
+        container = conn2.root()['records']
+
+        async def get(key):
+            return await container.asyncget(key)
+
+        ASYNCGET_STATS.update(fast_path=0, executor=0)
+        for i in range(2):
+            self.assertEqual(asyncio.run(get('50')).id, '50')
+        self.assertEqual(ASYNCGET_STATS, {'fast_path': 1, 'executor': 1})
+        self.assertRaises(KeyError, asyncio.run, get('500'))
+        conn2.executor.shutdown()
+        conn2.close()
+
+    def test_populated_container_is_migrated(self):
+        container = self._container(10)
+        self.assertTrue(type(container._BTreeContainer__data) is OOBTree)
+        self.fti.container_storage = 'integer'
+        queue_promotion(container)
+        transaction.commit()
+
+        promoter = Promoter(self.db, batch_size=4)
+        self.assertEqual(promoter.run(1), 1)
+        # changes made while the container is copied are kept
+        transaction.begin()
+        del container['1']
+        container['10'] = Item('10')
+        transaction.commit()
+
+        self.assertEqual(promoter.run(), 2)
+        transaction.begin()
+        self.assertFalse(get_promotions(self.conn))
+        self.assertTrue(
+            isinstance(container._BTreeContainer__data, NameIndexedData))
+        self.assertEqual(
+            sorted(container.keys(), key=int),
+            ['0', '2', '3', '4', '5', '6', '7', '8', '9', '10'])
+        self.assertEqual(len(container), 10)
+
+    def test_unknown_storage(self):
+        self.fti.container_storage = 'larg'
+        with self.assertLogs('plone.dexterity.storage', 'WARNING'):
+            container = self._container(3)
+        self.assertTrue(type(container._BTreeContainer__data) is OOBTree)
+        container['3'] = Item('3')
+        self.assertEqual(len(container), 4)
+        self.assertFalse(get_promotions(self.conn))
+
+
+class TestConcurrentStorageMigration(unittest.TestCase):
+
+    def setUp(self):
+        self.fti = DexterityFTI('records')
+        getGlobalSiteManager().registerUtility(
+            self.fti, IDexterityFTI, name='records')
+        self.tempdir = tempfile.mkdtemp()
+        self.db = ZODB.DB(FileStorage(os.path.join(self.tempdir, 'Data.fs')))
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tempdir)
+        getGlobalSiteManager().unregisterUtility(
+            self.fti, IDexterityFTI, name='records')
+
+    def test_add_during_last_batch_conflicts(self):
+        promoter = transaction.TransactionManager()
+        conn = self.db.open(transaction_manager=promoter)
+        user = transaction.TransactionManager()
+        conn2 = self.db.open(transaction_manager=user)
+
+        container = BTreeContainer('records')
+        container.portal_type = 'records'
+        container.add_many([(str(i), Item(str(i))) for i in range(300)])
+        conn.root()['records'] = container
+        promoter.commit()
+        self.fti.container_storage = 'large'
+        entry = queue_promotion(container)
+        promoter.commit()
+
+        promoter.begin()
+        self.assertFalse(migrate_btree_batch(entry, 200))
+        promoter.commit()
+        promoter.begin()
+        self.assertTrue(migrate_btree_batch(entry, 200))
+
+        # a child added to the old tree before the promoter commits only
+        # writes one of its buckets
+        user.begin()
+        conn2.root()['records']['50x'] = Item('50x')
+        user.commit()
+        self.assertRaises(ConflictError, promoter.commit)
+        promoter.abort()
+
+        self.assertEqual(Promoter(self.db, batch_size=200).run(), 1)
+        user.begin()
+        container2 = conn2.root()['records']
+        data = container2._BTreeContainer__data
+        self.assertTrue(type(data) is LargeOOBTree)
+        self.assertEqual(len(data), 301)
+        self.assertEqual(len(container2), 301)
+        self.assertTrue('50x' in container2)
+        conn.close()
+        conn2.close()
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
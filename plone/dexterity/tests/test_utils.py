@@ -123,5 +123,158 @@ class TestUtils(MockTestCase):
         )
 
 
+class BehaviorAdapter(object):
+    """Stores the fields of a behavior on the context with a prefix"""
+
+    created = []
+
+    def __init__(self, context):
+        self.__dict__['context'] = context
+        self.created.append(self)
+
+    def __setattr__(self, name, value):
+        setattr(self.context, 'behavior_' + name, value)
+
+
+class TestCreateContent(unittest.TestCase):
+
+    def setUp(self):
+        from plone.behavior.interfaces import IBehavior
+        from plone.behavior.registration import BehaviorRegistration
+        from plone.dexterity.factory import DexterityFactory
+        from plone.dexterity.interfaces import IDexterityContent
+        from plone.dexterity.interfaces import IDexterityFTI
+        from plone.dexterity.interfaces import IFormFieldProvider
+        from zope.component import provideAdapter
+        from zope.component import provideUtility
+        from zope.component.interfaces import IFactory
+        from zope.interface import alsoProvides
+        from zope.interface import Interface
+        import zope.component.testing
+        import zope.schema
+
+        zope.component.testing.setUp()
+
+        class IBehaviorSchema(Interface):
+            subtitle = zope.schema.TextLine()
+            description = zope.schema.Text()
+
+        alsoProvides(IBehaviorSchema, IFormFieldProvider)
+        provideAdapter(
+            BehaviorAdapter, (IDexterityContent, ), IBehaviorSchema)
+        provideUtility(
+            BehaviorRegistration(
+                u'Test', u'', IBehaviorSchema, None, BehaviorAdapter),
+            IBehavior, 'test.behavior')
+        self.fti = DexterityFTI(
+            'doc', schema='plone.dexterity.tests.schemata.ITestSchema',
+            klass='plone.dexterity.content.Item',
+            behaviors=['test.behavior'])
+        provideUtility(self.fti, IDexterityFTI, 'doc')
+        provideUtility(DexterityFactory('doc'), IFactory, 'doc')
+        self.IBehaviorSchema = IBehaviorSchema
+        del BehaviorAdapter.created[:]
+
+    def tearDown(self):
+        import zope.component.testing
+        zope.component.testing.tearDown()
+
+    def test_createContent_routes_fields(self):
+        from plone.dexterity.schema import SCHEMA_CACHE
+        from plone.dexterity.tests.schemata import ITestSchema
+
+        content = utils.createContent(
+            'doc', title=u'Title', subtitle=u'Subtitle',
+            description=u'Description', other=1)
+        self.assertEqual(content.portal_type, 'doc')
+        self.assertEqual(content.title, u'Title')
+        self.assertEqual(content.other, 1)
+        # names declared by several schemas are set through each of them
+        self.assertEqual(content.description, u'Description')
+        self.assertEqual(content.behavior_description, u'Description')
+        self.assertEqual(content.behavior_subtitle, u'Subtitle')
+        # the behavior is adapted once for both of its fields
+        self.assertEqual(len(BehaviorAdapter.created), 1)
+
+        schemas, routes = SCHEMA_CACHE.field_routes('doc')
+        self.assertEqual(schemas, (ITestSchema, self.IBehaviorSchema))
+        self.assertEqual(
+            routes['description'], (ITestSchema, self.IBehaviorSchema))
+        self.assertEqual(routes['subtitle'], (self.IBehaviorSchema, ))
+
+        # values outside of any schema are set on the content only
+        del BehaviorAdapter.created[:]
+        content = utils.createContent('doc', other=2)
+        self.assertEqual(content.other, 2)
+        self.assertEqual(BehaviorAdapter.created, [])
+
+    def test_create_many(self):
+        from datetime import datetime
+        from plone.dexterity.content import Container
+        from zope.container.interfaces import IContainerModifiedEvent
+        from zope.lifecycleevent.interfaces import IObjectCreatedEvent
+        from zope.security.interfaces import Unauthorized
+        import zope.event
+
+        container = Container()
+        rows = [
+            {'id': 'a', 'title': u'A', 'subtitle': u'Sub'},
+            {'id': 'b', 'title': u'B',
+             'creation_date': datetime(2020, 1, 1)},
+        ]
+        # no add permission is registered
+        self.assertRaises(
+            Unauthorized, utils.create_many, container, 'doc', rows)
+
+        events = []
+        zope.event.subscribers.append(events.append)
+        try:
+            a, b = utils.create_many(
+                container, 'doc', rows, checkConstraints=False)
+        finally:
+            zope.event.subscribers.remove(events.append)
+        self.assertEqual(list(container.keys()), ['a', 'b'])
+        self.assertTrue(container['a'] is a)
+        self.assertEqual((a.portal_type, a.title), ('doc', u'A'))
+        self.assertEqual(a.behavior_subtitle, u'Sub')
+        self.assertEqual(a.creation_date, b.modification_date)
+        self.assertEqual(b.creation_date, datetime(2020, 1, 1))
+        self.assertEqual(
+            len([e for e in events if IObjectCreatedEvent.providedBy(e)]),
+            2)
+        self.assertEqual(
+            len([e for e in events
+                 if IContainerModifiedEvent.providedBy(e)]), 1)
+
+        self.assertRaises(
+            ValueError, utils.create_many, container, 'doc', [{}],
+            checkConstraints=False)
+
+    def test_createContent_deferred_events(self):
+        from plone.dexterity.content import Container
+        from plone.dexterity.events import deferred_events
+        from zope.interface.interfaces import IObjectEvent
+        import zope.event
+
+        def subscriber(event):
+            if IObjectEvent.providedBy(event):
+                events.append(event)
+
+        events = []
+        zope.event.subscribers.append(subscriber)
+        try:
+            container = Container()
+            with deferred_events():
+                for id in ('a', 'b'):
+                    container[id] = utils.createContent('doc', id=id)
+                self.assertEqual(events, [])
+        finally:
+            zope.event.subscribers.remove(subscriber)
+        self.assertEqual(
+            [e.__class__.__name__ for e in events],
+            ['ObjectCreatedEvent', 'ObjectAddedEvent', 'ObjectCreatedEvent',
+             'ObjectAddedEvent', 'ContainerModifiedEvent'])
+
+
 def test_suite():
     return unittest.defaultTestLoader.loadTestsFromName(__name__)
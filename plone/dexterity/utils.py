@@ -1,16 +1,18 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime
+from dateutil.tz import tzlocal
 from dateutil.tz import tzutc
 from plone.behavior.interfaces import IBehaviorAssignable
+from plone.dexterity.events import notify
 from plone.dexterity.interfaces import IDexterityFTI
 from plone.dexterity.interfaces import IFormFieldProvider
 from plone.dexterity.schema import SCHEMA_CACHE
 from plone.supermodel.utils import mergedTaggedValueDict
 from zope.component import createObject
 from zope.component import getUtility
+from zope.component.interfaces import IFactory
 from zope.container.interfaces import INameChooser
 from zope.dottedname.resolve import resolve
-from zope.event import notify
 from zope.lifecycleevent import ObjectCreatedEvent
 from zope.security.interfaces import Unauthorized
 
@@ -102,6 +104,34 @@ def getAdditionalSchemata(context=None, portal_type=None):
                 yield form_schema
 
 
+def _set_fields(content, kw, schemas, routes):
+    """Set the values of ``kw`` on ``content``.
+
+    Each value is routed to the schemas declaring its name, see
+    SCHEMA_CACHE.field_routes(), so that every schema involved is adapted
+    once; other values are set on the content.
+    """
+    values = {}
+    fields = {}
+    for name, value in kw.items():
+        owners = routes.get(name)
+        if owners is None:
+            fields[name] = value
+            continue
+        for schema in owners:
+            values.setdefault(schema, []).append((name, value))
+
+    for schema in schemas:
+        schema_values = values.get(schema)
+        if schema_values:
+            behavior = schema(content)
+            for name, value in schema_values:
+                setattr(behavior, name, value)
+
+    for (key, value) in fields.items():
+        setattr(content, key, value)
+
+
 def createContent(portal_type, **kw):
     fti = getUtility(IDexterityFTI, name=portal_type)
     content = createObject(fti.factory, **kw)
@@ -111,29 +141,8 @@ def createContent(portal_type, **kw):
     # to re-define a type through the web that uses the factory from an
     # existing type, but wants a unique portal_type!
     content.portal_type = fti.getId()
-    schemas = iterSchemataForType(portal_type)
-    fields = dict(kw)  # create a copy
-
-    for schema in schemas:
-        # schema.names() doesn't return attributes from superclasses in derived
-        # schemas. therefore we have to iterate over all items from the passed
-        # keywords arguments and set it, if the behavior has the questioned
-        # attribute.
-        behavior = schema(content)
-        for name, value in kw.items():
-            try:
-                # hasattr swallows exceptions.
-                getattr(behavior, name)
-            except AttributeError:
-                # fieldname not available
-                continue
-            setattr(behavior, name, value)
-            if name in fields:
-                del fields[name]
-
-    for (key, value) in fields.items():
-        setattr(content, key, value)
 
+    _set_fields(content, kw, *SCHEMA_CACHE.field_routes(fti))
     notify(ObjectCreatedEvent(content))
     return content
 
@@ -188,6 +197,64 @@ def createContentInContainer(container, portal_type, checkConstraints=True,
     )
 
 
+def create_many(container, portal_type, rows, checkConstraints=True,
+                request=None, now=None):
+    """Create objects of ``portal_type`` from the dicts ``rows`` and add
+    them to ``container``.
+
+    This is createContentInContainer() for many objects of one type: the
+    FTI, its factory, content class and field routing table are looked up
+    and the constraints are checked once. Every row needs an ``id``, which
+    is the only value passed to the factory; the others are set like
+    createContent() sets them. All
+    objects get ``now``, by default the time of the call, as creation and
+    modification date unless their row sets one. They are added with the
+    container's ``add_many``, so a single container modified event is fired.
+    Returns the added objects.
+    """
+    from plone.dexterity.factory import DexterityFactory
+
+    fti = getUtility(IDexterityFTI, name=portal_type)
+    if checkConstraints and not fti.isConstructionAllowed(container, request):
+        raise Unauthorized('Cannot create {0:s}'.format(portal_type))
+
+    factory = getUtility(IFactory, name=fti.factory)
+    if isinstance(factory, DexterityFactory):
+        klass = factory.resolve_class(fti)
+
+        def construct(**kw):
+            return factory.construct(klass, fti, **kw)
+    else:
+        construct = factory
+    schemas, routes = SCHEMA_CACHE.field_routes(fti)
+    portal_type = fti.getId()
+    if now is None:
+        now = datetime.now(tz=tzlocal())
+
+    items = []
+    for row in rows:
+        name = row.get('id')
+        if not name:
+            raise ValueError('Every row needs an id')
+        # the values are set once, through the schemas declaring them
+        content = construct(id=name)
+        content.portal_type = portal_type
+        for date in ('creation_date', 'modification_date'):
+            if date not in row:
+                setattr(content, date, now)
+        _set_fields(content, row, schemas, routes)
+        notify(ObjectCreatedEvent(content))
+        items.append((name, content))
+
+    add_many = getattr(container, 'add_many', None)
+    if add_many is not None:
+        add_many(items)
+    else:
+        for name, content in items:
+            container[name] = content
+    return [container[name] for name, content in items]
+
+
 def safe_bytes(st):
     if isinstance(st, str):
         st = st.encode('utf8')